@@ -0,0 +1,234 @@
+"""正覺壁球管理系統 - 考勤運算
+
+舊格式考勤紀錄的遷移，以及按班別以 bitset 記錄出席的考勤簿及考勤總表。
+"""
+import numpy as np
+import pandas as pd
+
+from schedule import parse_dates, split_dates
+
+PRESENT, ABSENT, NO_RECORD = "✅", "✘", "-"
+# 出席名單欄位的分隔符
+NAME_SEP = ", "
+
+
+# --- 正規化考勤儲存 (每節每位學生一筆) ---
+ENTRY_COLUMNS = ["班級", "日期", "學生姓名", "出席", "記錄人"]
+
+
+def as_bool(v):
+    if isinstance(v, (bool, np.bool_)):
+        return bool(v)
+    return str(v).strip().lower() in ("true", "1", "yes", "✅")
+
+
+def sort_dates(dates, today=None):
+    """按日期先後排序 (無法解析的日期按文字排在最後；沒有年份的 日/月 按學年推算，見 schedule.parse_dates)"""
+    dates = list(dates)
+    parsed = parse_dates(dates, today)
+    return sorted(dates, key=lambda d: (pd.isna(parsed[d]), parsed[d] if pd.notna(parsed[d]) else pd.Timestamp.min, str(d)))
+
+
+def migrate_records(records, players):
+    """將舊格式 (每節一列，出席名單以逗號連接) 轉為每節每位學生一筆
+
+    缺席學生由該班名單推算；名單中沒有但出現在出席名單的學生亦會保留。
+    舊版只以半形逗號分隔具體日期，以頓號等分隔的多個日期曾被當作一個日期標籤：
+    這類紀錄按 split_dates 拆分至各個日期。同一班同一日期有多筆紀錄時，以單一日期標籤的紀錄優先，
+    其次為第一筆 (與舊版顯示的紀錄相同)。
+    """
+    if records.empty:
+        return pd.DataFrame(columns=ENTRY_COLUMNS)
+    labels = records["日期"].map(split_dates)
+    recs = records.assign(日期=labels, 合併標籤=labels.map(len) > 1).explode("日期").dropna(subset=["日期"])
+    recs = (recs.sort_values(by="合併標籤", kind="stable")
+            .drop_duplicates(subset=["班級", "日期"], keep='first')
+            .sort_index(kind="stable"))
+    roster = players.groupby("班級")["姓名"].agg(lambda s: [str(n) for n in s.unique()]).to_dict() if not players.empty else {}
+    rows = []
+    for rec in recs.to_dict('records'):
+        raw = rec.get("出席名單")
+        present = [n for n in str(raw).split(NAME_SEP) if n] if pd.notna(raw) and str(raw) else []
+        names = list(dict.fromkeys(roster.get(rec["班級"], []) + present))
+        present = set(present)
+        recorder = rec.get("記錄人", "")
+        rows += [{"班級": rec["班級"], "日期": rec["日期"], "學生姓名": n, "出席": n in present, "記錄人": recorder} for n in names]
+    return pd.DataFrame(rows, columns=ENTRY_COLUMNS)
+
+
+class ClassSessions:
+    """單一班別的考勤：學生次序固定，每節以壓縮位元組 (bitset) 記錄出席者
+
+    present_counts 為各學生累計出席次數，每次登記點名時按新舊差異增量更新。
+    已排序的日期及學生統計在首次使用時計算，只在登記點名或加入學生後重新計算。
+    """
+
+    def __init__(self):
+        self.names = []
+        self.positions = {}
+        self.sessions = {}
+        self.recorders = {}
+        self.present_counts = np.zeros(0, dtype=np.int64)
+        self._dates = None
+        self._summary = None
+
+    def position(self, name):
+        if name not in self.positions:
+            self.positions[name] = len(self.names)
+            self.names.append(name)
+            self.present_counts = np.append(self.present_counts, 0)
+            self._summary = None
+        return self.positions[name]
+
+    def set_session(self, date, present_names, recorder=""):
+        for name in present_names:
+            self.position(name)
+        old_mask = self.present_mask(date)
+        mask = np.zeros(len(self.names), dtype=bool)
+        mask[[self.positions[n] for n in present_names]] = True
+        self.present_counts += mask
+        if old_mask is not None:
+            self.present_counts -= old_mask
+        if date not in self.sessions:
+            self._dates = None
+        self.sessions[date] = np.packbits(mask)
+        self.recorders[date] = recorder
+        self._summary = None
+
+    def present_mask(self, date):
+        """返回該節的出席布林陣列 (長度為目前學生數)，未點名時返回 None"""
+        bits = self.sessions.get(date)
+        if bits is None:
+            return None
+        mask = np.unpackbits(bits, count=min(len(self.names), bits.size * 8)).astype(bool)
+        # 後來才加入的學生在舊節數中視為缺席
+        return np.pad(mask, (0, len(self.names) - mask.size))
+
+    def present(self, date):
+        mask = self.present_mask(date)
+        return [] if mask is None else [n for n, p in zip(self.names, mask) if p]
+
+    def absentees(self, date):
+        mask = self.present_mask(date)
+        return [] if mask is None else [n for n, p in zip(self.names, mask) if not p]
+
+    def ordered_dates(self):
+        """已點名的日期 (按日期先後排序)"""
+        if self._dates is None:
+            self._dates = sort_dates(list(self.sessions))
+        return self._dates
+
+    def student_summary(self):
+        """各學生的出席次數、出席率及目前連續出席節數 (返回共用的結果，使用者不應修改)"""
+        if self._summary is not None:
+            return self._summary
+        n_sessions = len(self.sessions)
+        present, _ = self.matrix(self.ordered_dates())
+        # 由最近一節往回數，直至第一次缺席
+        absent_from_end = ~present[:, ::-1]
+        streaks = np.where(absent_from_end.any(axis=1), absent_from_end.argmax(axis=1), n_sessions)
+        self._summary = pd.DataFrame({
+            "學生姓名": self.names,
+            "出席次數": self.present_counts,
+            "點名節數": n_sessions,
+            "出席率": self.present_counts / n_sessions if n_sessions else 0.0,
+            "連續出席": streaks,
+        })
+        return self._summary
+
+    def matrix(self, dates):
+        """返回 (學生×日期 出席布林矩陣, 各日期是否已點名)"""
+        present = np.zeros((len(self.names), len(dates)), dtype=bool)
+        recorded = np.zeros(len(dates), dtype=bool)
+        for j, date in enumerate(dates):
+            mask = self.present_mask(date)
+            if mask is not None:
+                present[:, j] = mask
+                recorded[j] = True
+        return present, recorded
+
+
+class AttendanceBook:
+    """正規化考勤紀錄：entries 為儲存格式 (每節每位學生一筆)，記憶體中按班別保存 bitset"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.classes = {}
+        self._student_summary = None
+        if entries.empty:
+            return
+        present = entries["出席"].map(as_bool).to_numpy()
+        for (s_class, date), idx in entries.groupby(["班級", "日期"], sort=False).indices.items():
+            sessions = self.classes.setdefault(s_class, ClassSessions())
+            names = entries["學生姓名"].to_numpy()[idx]
+            for name in names:
+                sessions.position(name)
+            sessions.set_session(date, [n for n, p in zip(names, present[idx]) if p], entries["記錄人"].iat[idx[0]])
+
+    def class_sessions(self, s_class):
+        return self.classes.get(s_class, ClassSessions())
+
+    def present(self, s_class, date):
+        return self.class_sessions(s_class).present(date)
+
+    def recorder(self, s_class, date):
+        return self.class_sessions(s_class).recorders.get(date)
+
+    def class_summary(self):
+        """各班點名節數、學生人數及平均出席率 (由增量維護的出席次數計算)"""
+        rows = []
+        for s_class, sessions in self.classes.items():
+            n_sessions, n_students = len(sessions.sessions), len(sessions.names)
+            total = int(sessions.present_counts.sum())
+            rows.append({
+                "班級": s_class,
+                "點名節數": n_sessions,
+                "學生人數": n_students,
+                "平均出席人數": total / n_sessions if n_sessions else 0.0,
+                "平均出席率": total / (n_sessions * n_students) if n_sessions and n_students else 0.0,
+            })
+        return pd.DataFrame(rows, columns=["班級", "點名節數", "學生人數", "平均出席人數", "平均出席率"])
+
+    def student_summary(self):
+        """全校學生出席統計 (加上班級欄位)；只在登記點名後重新組合"""
+        if self._student_summary is None:
+            self._student_summary = self._combine_summaries()
+        return self._student_summary
+
+    def _combine_summaries(self):
+        frames = [sessions.student_summary().assign(班級=s_class) for s_class, sessions in self.classes.items()]
+        if not frames:
+            return pd.DataFrame(columns=["班級", "學生姓名", "出席次數", "點名節數", "出席率", "連續出席"])
+        return pd.concat(frames, ignore_index=True)[["班級", "學生姓名", "出席次數", "點名節數", "出席率", "連續出席"]]
+
+    def record_session(self, s_class, date, present_names, roster_names, recorder):
+        """登記一節點名，更新 bitset 並返回新的 entries (只替換該節的紀錄)"""
+        present_set = set(present_names)
+        self._student_summary = None
+        sessions = self.classes.setdefault(s_class, ClassSessions())
+        for name in roster_names:
+            sessions.position(name)
+        sessions.set_session(date, list(present_names), recorder)
+        new_rows = pd.DataFrame(
+            [{"班級": s_class, "日期": date, "學生姓名": n, "出席": n in present_set, "記錄人": recorder}
+             for n in dict.fromkeys(list(roster_names) + list(present_names))],
+            columns=ENTRY_COLUMNS,
+        )
+        others = self.entries[~((self.entries["班級"] == s_class) & (self.entries["日期"] == date))] if not self.entries.empty else self.entries
+        self.entries = pd.concat([others, new_rows], ignore_index=True) if not others.empty else new_rows
+        return self.entries
+
+    def matrix(self, s_class, student_names, dates):
+        """考勤總表 (欄位為 學生姓名 + 各日期)，直接由 bitset 組合"""
+        dates = list(dict.fromkeys(dates))
+        sessions = self.class_sessions(s_class)
+        present, recorded = sessions.matrix(dates)
+        rows = pd.Index(sessions.names).get_indexer(student_names) if sessions.names else np.full(len(student_names), -1)
+        student_present = np.zeros((len(student_names), len(dates)), dtype=bool)
+        known = rows >= 0
+        student_present[known] = present[rows[known]]
+        cells = np.where(student_present, PRESENT, ABSENT).astype(object)
+        cells[:, ~recorded] = NO_RECORD
+        report_df = pd.DataFrame(cells, columns=dates)
+        report_df.insert(0, "學生姓名", student_names)
+        return report_df
@@ -0,0 +1,181 @@
+"""正覺壁球管理系統 - 管理員驗證
+
+管理員密碼只以加鹽的慢速雜湊 (scrypt，不支援時為 PBKDF2) 保存在記憶體，按學校快取並定期重新讀取，
+比對時使用固定時間比較。登入成功後發出以 HMAC 簽署的 session token，其後每次重新執行只需驗證簽署，
+不會讀取後端。
+
+產生可存入 admin_settings/config 的 password_hash：
+    python auth.py
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+
+from datastore import DEFAULT_CACHE_TTL
+
+# 學校尚未設定密碼時使用的預設密碼
+DEFAULT_ADMIN_PASSWORD = "8888"
+HAS_SCRYPT = hasattr(hashlib, "scrypt")
+# scrypt 參數 (約 16 MB 記憶體、數十毫秒)；PBKDF2 的迭代次數
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+PBKDF2_ITERATIONS = 310000
+# 每個 session 在 FAILURE_WINDOW 秒內失敗 MAX_FAILURES 次後須等待，之後每次失敗等待時間加倍
+MAX_FAILURES = 5
+FAILURE_WINDOW = 300
+LOCKOUT_BASE = 30
+LOCKOUT_MAX = 900
+# 管理員 session token 的有效時間 (秒)
+TOKEN_TTL = 8 * 3600
+
+
+class AuthUnavailable(Exception):
+    """無法讀取管理設定，且沒有可用的快取"""
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def hash_password(password, salt=None):
+    """返回 "scrypt$n$r$p$鹽$雜湊" 或 "pbkdf2_sha256$迭代次數$鹽$雜湊" 格式的密碼雜湊"""
+    salt = salt or secrets.token_bytes(16)
+    password = str(password).encode('utf-8')
+    if HAS_SCRYPT:
+        digest = hashlib.scrypt(password, salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    digest = hashlib.pbkdf2_hmac("sha256", password, salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password, encoded):
+    """以固定時間比較密碼與雜湊；格式無法辨認時返回 False"""
+    try:
+        scheme, *params = str(encoded).split("$")
+        password = str(password).encode('utf-8')
+        if scheme == "scrypt" and HAS_SCRYPT:
+            n, r, p, salt, expected = params
+            digest = hashlib.scrypt(password, salt=_unb64(salt), n=int(n), r=int(r), p=int(p), dklen=len(_unb64(expected)))
+        elif scheme == "pbkdf2_sha256":
+            iterations, salt, expected = params
+            digest = hashlib.pbkdf2_hmac("sha256", password, _unb64(salt), int(iterations))
+        else:
+            return False
+        return hmac.compare_digest(digest, _unb64(expected))
+    except (ValueError, TypeError):
+        return False
+
+
+def credential_from_settings(settings):
+    """由管理設定取得密碼雜湊：優先使用 password_hash，舊有的明文 password 在記憶體中轉為雜湊"""
+    if settings.get("password_hash"):
+        return str(settings["password_hash"])
+    return hash_password(settings.get("password", DEFAULT_ADMIN_PASSWORD))
+
+
+class AdminAuthenticator:
+    """程序內共用的管理員驗證
+
+    loader(學校代號) 返回該校的管理設定 (admin_settings/config)，只在快取過期 (ttl) 時呼叫；
+    讀取失敗時沿用上次的雜湊，從未讀取成功時拋出 AuthUnavailable (不會改用預設密碼)。
+    secret 為簽署 token 的密鑰，未提供時每個程序隨機產生 (重新啟動後須再次登入)。
+    """
+
+    def __init__(self, loader, secret=None, ttl=DEFAULT_CACHE_TTL):
+        self.loader = loader
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else (secret or secrets.token_bytes(32))
+        self.ttl = ttl
+        self._credentials = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def credential(self, app_id):
+        with self._lock:
+            hit = self._credentials.get(app_id)
+        if hit is not None and time.monotonic() - hit[1] < self.ttl:
+            return hit[0]
+        with self._load_lock:
+            # 其他執行緒可能已在等待期間重新讀取
+            with self._lock:
+                hit = self._credentials.get(app_id)
+            if hit is not None and time.monotonic() - hit[1] < self.ttl:
+                return hit[0]
+            try:
+                encoded = credential_from_settings(self.loader(app_id) or {})
+            except Exception as e:
+                if hit is None:
+                    raise AuthUnavailable(str(e)) from e
+                # 後端暫時無法連線：沿用上次的雜湊，ttl 後再嘗試
+                encoded = hit[0]
+            with self._lock:
+                self._credentials[app_id] = (encoded, time.monotonic())
+            return encoded
+
+    def invalidate(self, app_id=None):
+        """令快取的雜湊失效 (例如修改密碼後)"""
+        with self._lock:
+            if app_id is None:
+                self._credentials.clear()
+            else:
+                self._credentials.pop(app_id, None)
+
+    def check(self, app_id, password):
+        return verify_password(password, self.credential(app_id))
+
+    # --- session token ---
+    def _sign(self, payload):
+        return _b64(hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, app_id, subject, ttl=TOKEN_TTL):
+        """發出 "內容.簽署" 格式的 token，內容包括身份、學校及到期時間"""
+        payload = _b64(json.dumps({"sub": subject, "tenant": app_id, "exp": int(time.time() + ttl)}, separators=(",", ":")).encode('utf-8'))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, app_id, token):
+        """返回 token 的身份；簽署不符、已過期或屬於其他學校時返回 None"""
+        try:
+            payload, signature = str(token).split(".")
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            claims = json.loads(_unb64(payload))
+        except (ValueError, TypeError):
+            return None
+        if claims.get("tenant") != app_id or claims.get("exp", 0) < time.time():
+            return None
+        return claims.get("sub")
+
+
+class LoginThrottle:
+    """單一 session 的登入失敗次數限制"""
+
+    def __init__(self):
+        self.failures = []
+
+    def wait_time(self, now=None):
+        """尚須等待的秒數 (0 表示可以嘗試登入)"""
+        now = time.time() if now is None else now
+        self.failures = [t for t in self.failures if now - t < FAILURE_WINDOW]
+        excess = len(self.failures) - MAX_FAILURES
+        if excess < 0:
+            return 0.0
+        lockout = min(LOCKOUT_MAX, LOCKOUT_BASE * 2 ** excess)
+        return max(0.0, self.failures[-1] + lockout - now)
+
+    def failed(self, now=None):
+        self.failures.append(time.time() if now is None else now)
+
+    def succeeded(self):
+        self.failures = []
+
+
+if __name__ == "__main__":
+    import getpass
+
+    print(hash_password(getpass.getpass("新管理員密碼：")))
@@ -0,0 +1,73 @@
+"""正覺壁球管理系統 - 學生得獎紀錄榮譽榜
+
+得獎紀錄的排序、篩選、分頁及整頁 HTML 產生。
+"""
+import html
+
+import pandas as pd
+
+AWARDS_PAGE_SIZE = 10
+
+
+def sort_awards(awards_df):
+    """按獲獎日期由新至舊排序 (日期相同時保持原有次序)"""
+    return awards_df.sort_values(by="日期", ascending=False, kind="stable")
+
+
+def award_years(awards_df):
+    """紀錄中出現的年份 (由新至舊)"""
+    years = awards_df["日期"].astype(str).str[:4]
+    return sorted({y for y in years if y.isdigit()}, reverse=True)
+
+
+def filter_awards(awards_df, student="", competition="", year="", exact_student=False):
+    """按學生、比賽名稱 (部分字眼) 及年份篩選"""
+    mask = pd.Series(True, index=awards_df.index)
+    student, competition = student.strip(), competition.strip()
+    if student:
+        names = awards_df["學生姓名"].astype(str).str.strip()
+        mask &= (names == student) if exact_student else names.str.contains(student, case=False, regex=False)
+    if competition:
+        mask &= awards_df["比賽名稱"].astype(str).str.contains(competition, case=False, regex=False)
+    if year:
+        mask &= awards_df["日期"].astype(str).str.startswith(str(year))
+    return awards_df[mask]
+
+
+def page_slice(df, page, page_size=AWARDS_PAGE_SIZE):
+    """返回 (該頁資料, 總頁數)，頁數由 1 開始並自動限制在有效範圍"""
+    n_pages = max(1, -(-len(df) // page_size))
+    page = min(max(1, page), n_pages)
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size], n_pages
+
+
+def render_award_card(row, is_own_award):
+    bg_color = "#e8f0fe" if is_own_award else "#ffffff"
+    border = "2px solid #1a73e8" if is_own_award else "1px solid #e0e0e0"
+    text_color = "#202124"
+    esc = lambda v: html.escape("" if v is None or (not isinstance(v, str) and pd.isna(v)) else str(v))
+    note = f'<p style="margin:8px 0 0 0; font-style: italic; border-top: 1px dashed #ccc; padding-top: 8px;">{esc(row.get("備註"))}</p>' if esc(row.get("備註")) else ''
+    own = ' <span style="color:#d93025; font-weight:bold;">(⭐ 恭喜您！)</span>' if is_own_award else ''
+    card = f"""
+    <div style="background-color: {bg_color}; padding: 18px; border-radius: 12px; border: {border}; margin-bottom: 12px; box-shadow: 0 2px 4px rgba(0,0,0,0.05);">
+        <h3 style="margin:0; color: #1a73e8; font-size: 1.4em;">🏆 {esc(row['獎項'])}</h3>
+        <div style="color: {text_color}; margin-top: 10px;">
+            <p style="margin:4px 0;"><b>比賽名稱：</b>{esc(row['比賽名稱'])}</p>
+            <p style="margin:4px 0;"><b>獲獎學生：</b>{esc(row['學生姓名'])}{own}</p>
+            <p style="margin:4px 0; font-size: 0.9em; color: #5f6368;">📅 獲獎日期：{esc(row['日期'])}</p>
+            {note}
+        </div>
+    </div>"""
+    # 去除縮排，避免 Markdown 把多張卡片之間的 HTML 當作程式碼區塊
+    return "".join(line.strip() for line in card.splitlines())
+
+
+def render_awards_page_html(page_df, highlight_name=""):
+    """把一頁的獎項組合成單一 HTML 區塊"""
+    highlight_name = str(highlight_name).strip()
+    cards = [
+        render_award_card(row, bool(highlight_name) and str(row["學生姓名"]).strip() == highlight_name)
+        for row in page_df.to_dict('records')
+    ]
+    return "\n".join(cards)
@@ -0,0 +1,1152 @@
+"""正覺壁球管理系統 - 雲端數據同步層
+
+負責 DataFrame 與雲端文件之間的轉換、差異比對及批次寫入。
+後端可為 Firestore、本機 SQLite (SQLiteBackend) 或記憶體 (MemoryBackend)，三者介面相同。
+記憶體及 SQLite 後端亦用於離線測試及基準測試。
+"""
+import hashlib
+import itertools
+import json
+import operator
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import PROCESS_METRICS, Span, frame_bytes, frame_memory
+
+# Firestore 單次批次寫入的操作上限
+MAX_BATCH_OPS = 500
+# 共用快取的預設有效時間 (秒)；變更監聽失效時作為後備
+DEFAULT_CACHE_TTL = 300
+# 共用快取保存的查詢結果上限
+MAX_CACHED_QUERIES = 256
+# 開始監聽後等待第一次回呼 (整個集合) 的時間上限 (秒)，逾時改為直接讀取
+WATCH_INITIAL_TIMEOUT = 10
+
+
+# --- 1. 文件轉換工具 ---
+def clean_value(v):
+    """將 pandas / numpy 數值轉為 Firestore 可接受的 Python 原生型別"""
+    if isinstance(v, (list, dict)):
+        return v
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return None
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, pd.Timestamp):
+        return v.to_pydatetime()
+    return v
+
+
+def clean_record(record):
+    return {str(k).strip(): clean_value(v) for k, v in record.items()}
+
+
+class KeySpec:
+    """集合主鍵定義
+
+    columns: 組成主鍵的欄位；prefix: 文件 ID 前綴；
+    hashed: 為 True 時以主鍵欄位的穩定雜湊值作 ID (適用於姓名等可能重複的欄位)；
+    fallbacks: 欄位不存在時改用的替代欄位，例如 {'班級': '年級'}。
+    """
+
+    def __init__(self, columns, prefix="", hashed=False, fallbacks=None):
+        self.columns = tuple(columns)
+        self.prefix = prefix
+        self.hashed = hashed
+        self.fallbacks = fallbacks or {}
+
+    def key_values(self, row):
+        values = []
+        for col in self.columns:
+            if col not in row and col in self.fallbacks:
+                col = self.fallbacks[col]
+            values.append(row.get(col))
+        return values
+
+    def applies_to(self, row):
+        return all(col in row or self.fallbacks.get(col) in row for col in self.columns)
+
+    def doc_id(self, row):
+        values = self.key_values(row)
+        if self.hashed:
+            parts = [str(row.get(self.columns[0], "")).strip(), stable_hash(values)]
+        else:
+            parts = [key_text(v) for v in values]
+        if self.prefix:
+            parts.insert(0, self.prefix)
+        return safe_doc_id("_".join(parts))
+
+
+# 各集合的主鍵登記表；未登記的集合以整列內容雜湊作 ID
+PRIMARY_KEYS = {
+    'attendance_records': KeySpec(("班級", "日期")),
+    'attendance_entries': KeySpec(("班級", "日期", "學生姓名"), prefix="att", hashed=True),
+    'announcements': KeySpec(("日期", "標題")),
+    'tournaments': KeySpec(("比賽名稱", "日期"), prefix="tm"),
+    'points_ledger': KeySpec(("事件ID",), prefix="evt"),
+    'student_awards': KeySpec(("學生姓名", "比賽名稱", "獎項", "日期"), prefix="award", hashed=True),
+    # 使用 班級+姓名 作為 ID 以區分不同學生，若沒班級則用年級
+    'rankings': KeySpec(("班級", "姓名"), fallbacks={'班級': '年級'}),
+    'class_players': KeySpec(("班級", "姓名"), fallbacks={'班級': '年級'}),
+}
+
+
+def key_text(v):
+    """主鍵值的標準文字形式：空值為空字串，整數型浮點數去除小數點"""
+    v = clean_value(v)
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+
+def stable_hash(values, length=12):
+    """對主鍵值計算跨程序穩定的雜湊值 (不受 PYTHONHASHSEED 影響)"""
+    payload = json.dumps([key_text(v) for v in values], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:length]
+
+
+def safe_doc_id(doc_id):
+    # Firestore 文件 ID 不可包含 "/"
+    return doc_id.replace("/", "-")
+
+
+def make_doc_id(collection_name, row):
+    """根據主鍵登記表產生確定性的文件 ID，重複儲存同一列會得到相同 ID"""
+    spec = PRIMARY_KEYS.get(collection_name)
+    if spec is not None and spec.applies_to(row):
+        return spec.doc_id(row)
+    columns = sorted(row)
+    return f"row_{stable_hash(columns + [row[c] for c in columns])}"
+
+
+def frame_from_documents(collection_name, docs):
+    """將雲端文件列表轉為 DataFrame，集合為空時返回 None"""
+    if not docs:
+        return None
+    df = pd.DataFrame(docs)
+    df.columns = [str(c).strip() for c in df.columns]
+    if collection_name == 'attendance_records':
+        for col in ["班級", "日期", "出席人數", "出席名單", "記錄人"]:
+            if col not in df.columns: df[col] = ""
+    elif collection_name == 'attendance_entries':
+        for col in ["班級", "日期", "學生姓名", "出席", "記錄人"]:
+            if col not in df.columns: df[col] = False if col == "出席" else ""
+    return df
+
+
+def frame_to_documents(collection_name, df):
+    """將 DataFrame 轉為 {文件 ID: 文件內容}，相同 ID 以最後一列為準"""
+    docs = {}
+    for record in df.to_dict('records'):
+        record = clean_record(record)
+        docs[make_doc_id(collection_name, record)] = record
+    return docs
+
+
+# --- 2. 儲存後端 ---
+# 每份文件的版本欄位：每次寫入加一，提交時比對 (compare-and-set)，避免覆蓋其他管理員的修改
+VERSION_FIELD = "_version"
+
+
+def split_version(data):
+    """返回 (不含版本欄位的文件內容, 版本號)；未有版本欄位的舊文件視為版本 0"""
+    data = dict(data)
+    version = data.pop(VERSION_FIELD, 0)
+    return data, int(version or 0)
+
+
+def commit_ops(upserts, deletes):
+    ops = [('set', doc_id, data) for doc_id, data in upserts.items()]
+    return ops + [('delete', doc_id, None) for doc_id in deletes]
+
+
+# 可作查詢條件及排序的欄位 (SQLite 後端中對應的索引欄位)
+INDEXED_FIELDS = {"班級": "class_name", "日期": "date", "學生姓名": "student"}
+QUERY_OPERATORS = {"==": operator.eq, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+class Query:
+    """集合查詢：where 為 ((欄位, 運算子, 值), ...)，可排序及限制筆數
+
+    條件由後端執行 (Firestore 查詢、SQLite 索引或記憶體篩選)；本物件可作為快取鍵。
+    值一律以文字比較，日期須為 YYYY-MM-DD 格式才可作範圍比較。
+    """
+
+    def __init__(self, collection_name, where=(), order_by=None, descending=False, limit=None):
+        where = tuple((field, op, str(value)) for field, op, value in where)
+        for field, op, _ in where:
+            if field not in INDEXED_FIELDS or op not in QUERY_OPERATORS:
+                raise ValueError(f"不支援的查詢條件：{field} {op}")
+        if order_by is not None and order_by not in INDEXED_FIELDS:
+            raise ValueError(f"不支援的排序欄位：{order_by}")
+        self.collection_name = collection_name
+        self.where = where
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+
+    @property
+    def key(self):
+        return (self.collection_name, self.where, self.order_by, self.descending, self.limit)
+
+    def __eq__(self, other):
+        return isinstance(other, Query) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def matches(self, doc):
+        return all(doc.get(field) is not None and QUERY_OPERATORS[op](str(doc[field]), value)
+                   for field, op, value in self.where)
+
+    def apply(self, docs):
+        """在記憶體中對 {文件 ID: 內容} 執行查詢"""
+        hits = [(doc_id, data) for doc_id, data in docs.items() if self.matches(data)]
+        if self.order_by:
+            hits.sort(key=lambda item: str(item[1].get(self.order_by, "")), reverse=self.descending)
+        return dict(hits[:self.limit] if self.limit else hits)
+
+    def filter_frame(self, df):
+        """對已載入的 DataFrame 執行相同查詢"""
+        mask = pd.Series(True, index=df.index)
+        for field, op, value in self.where:
+            if field not in df.columns:
+                return df.iloc[0:0]
+            mask &= df[field].notna() & QUERY_OPERATORS[op](df[field].map(str), value)
+        result = df[mask]
+        if self.order_by in result.columns:
+            result = result.sort_values(by=self.order_by, ascending=not self.descending, kind="stable", key=lambda s: s.map(str))
+        return result.head(self.limit) if self.limit else result
+
+
+class FirestoreBackend:
+    """Firestore 後端：路徑為 artifacts/{app_id}/public/data/{collection}"""
+
+    def __init__(self, db, app_id):
+        self.db = db
+        self.app_id = app_id
+
+    def collection_ref(self, collection_name):
+        return self.db.collection('artifacts').document(self.app_id).collection('public').document('data').collection(collection_name)
+
+    def list_documents(self, collection_name):
+        return {doc.id: doc.to_dict() for doc in self.collection_ref(collection_name).stream()}
+
+    def query(self, collection_name, query):
+        """把條件、排序及筆數上限交由 Firestore 執行 (等式加排序可能需要建立複合索引)"""
+        ref = self.collection_ref(collection_name)
+        for field, op, value in query.where:
+            ref = ref.where(field, op, value)
+        if query.order_by:
+            ref = ref.order_by(query.order_by, direction='DESCENDING' if query.descending else 'ASCENDING')
+        if query.limit:
+            ref = ref.limit(query.limit)
+        return {doc.id: doc.to_dict() for doc in ref.stream()}
+
+    def watch(self, collection_name, callback):
+        """監聽集合變更，callback 收到 {文件 ID: 內容}，已刪除的文件內容為 None
+
+        第一次回呼包含集合的全部文件 (Firestore 把現有文件作為新增的變更送出)。
+        """
+        def on_snapshot(col_snapshot, changes, read_time):
+            callback({c.document.id: (None if c.type.name == 'REMOVED' else c.document.to_dict()) for c in changes})
+        return self.collection_ref(collection_name).on_snapshot(on_snapshot)
+
+    def commit(self, collection_name, upserts, deletes, expected):
+        """以交易逐批比對版本後寫入，每批最多 MAX_BATCH_OPS 個操作
+
+        expected 為 {文件 ID: 預期版本}。版本不符的文件不會寫入，
+        返回 {文件 ID: 雲端目前內容 (已刪除為 None)}。
+        """
+        from firebase_admin import firestore
+
+        coll_ref = self.collection_ref(collection_name)
+        ops = commit_ops(upserts, deletes)
+
+        @firestore.transactional
+        def commit_chunk(transaction, chunk):
+            refs = {doc_id: coll_ref.document(doc_id) for _, doc_id, _ in chunk}
+            current = {snap.id: snap.to_dict() for snap in transaction.get_all(list(refs.values())) if snap.exists}
+            conflicts = {}
+            for op, doc_id, data in chunk:
+                remote = current.get(doc_id)
+                version = split_version(remote)[1] if remote is not None else 0
+                if version != expected.get(doc_id, 0):
+                    conflicts[doc_id] = remote
+                elif op == 'set':
+                    transaction.set(refs[doc_id], {**data, VERSION_FIELD: version + 1})
+                else:
+                    transaction.delete(refs[doc_id])
+            return conflicts
+
+        conflicts = {}
+        for start in range(0, len(ops), MAX_BATCH_OPS):
+            conflicts.update(commit_chunk(self.db.transaction(), ops[start:start + MAX_BATCH_OPS]))
+        return conflicts
+
+
+class MemoryBackend:
+    """記憶體後端 (模擬 Firestore)，記錄往返次數以便測試及基準比較"""
+
+    def __init__(self, initial=None):
+        self.collections = {name: dict(docs) for name, docs in (initial or {}).items()}
+        self.rpc_count = 0
+        self.write_count = 0
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    def list_documents(self, collection_name):
+        self.rpc_count += 1
+        return {doc_id: dict(data) for doc_id, data in self.collections.get(collection_name, {}).items()}
+
+    def query(self, collection_name, query):
+        self.rpc_count += 1
+        return {doc_id: dict(data) for doc_id, data in query.apply(self.collections.get(collection_name, {})).items()}
+
+    def watch(self, collection_name, callback):
+        """與 Firestore 相同，第一次回呼 (在返回前) 包含集合的全部文件"""
+        docs = self.list_documents(collection_name)
+        self._watchers.setdefault(collection_name, []).append(callback)
+        callback(docs)
+
+    def commit(self, collection_name, upserts, deletes, expected):
+        ops = commit_ops(upserts, deletes)
+        changes, conflicts = {}, {}
+        with self._lock:
+            coll = self.collections.setdefault(collection_name, {})
+            self.rpc_count += -(-len(ops) // MAX_BATCH_OPS)
+            for op, doc_id, data in ops:
+                remote = coll.get(doc_id)
+                version = split_version(remote)[1] if remote is not None else 0
+                if version != expected.get(doc_id, 0):
+                    conflicts[doc_id] = None if remote is None else dict(remote)
+                    continue
+                self.write_count += 1
+                if op == 'set':
+                    coll[doc_id] = {**data, VERSION_FIELD: version + 1}
+                    changes[doc_id] = dict(coll[doc_id])
+                else:
+                    coll.pop(doc_id, None)
+                    changes[doc_id] = None
+        if changes:
+            for callback in self._watchers.get(collection_name, []):
+                callback(changes)
+        return conflicts
+
+
+# 單一 SQL 語句的參數數目上限以下的分段大小
+SQLITE_CHUNK = 500
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    app_id TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    class_name TEXT,
+    date TEXT,
+    student TEXT,
+    PRIMARY KEY (app_id, collection, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_documents_class ON documents (app_id, collection, class_name, date);
+CREATE INDEX IF NOT EXISTS idx_documents_date ON documents (app_id, collection, date);
+CREATE INDEX IF NOT EXISTS idx_documents_student ON documents (app_id, collection, student);
+"""
+
+
+class SQLitePool:
+    """SQLite 連線池：以 WAL 模式允許讀寫並行，連線重用 (最多 size 個)
+
+    同一檔案的所有租戶共用一個連線池。path 須為檔案路徑 (":memory:" 每個連線各自獨立)。
+    """
+
+    def __init__(self, path, size=4, timeout=30.0):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._pool_lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """借出一個連線；池中沒有空閒連線且已達上限時等待歸還"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._pool_lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        """關閉池中所有閒置的連線"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            with self._pool_lock:
+                self._created -= 1
+            conn.close()
+
+
+class SQLiteBackend:
+    """本機 SQLite 後端：沒有 Firebase 時使用，資料由同一檔案的所有 session 及程序共用
+
+    文件以 JSON 存放，並抽出 INDEXED_FIELDS 作索引欄位；各租戶以 app_id 區分。
+    未指定 pool 時自行建立連線池 (最多 pool_size 個連線)。
+    """
+
+    def __init__(self, path, app_id, pool_size=4, timeout=30.0, pool=None):
+        self.app_id = app_id
+        self.pool = pool if pool is not None else SQLitePool(path, pool_size, timeout)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def _row(self, collection_name, doc_id, data, version):
+        index_values = [None if data.get(field) is None else str(data[field]) for field in INDEXED_FIELDS]
+        return (self.app_id, collection_name, doc_id, json.dumps(data, ensure_ascii=False, default=str), version, *index_values)
+
+    def _fetch(self, conn, collection_name, doc_ids):
+        """返回 {文件 ID: (內容, 版本)}，分段查詢以免超出參數上限"""
+        found = {}
+        for start in range(0, len(doc_ids), SQLITE_CHUNK):
+            chunk = doc_ids[start:start + SQLITE_CHUNK]
+            rows = conn.execute(
+                f"SELECT doc_id, data, version FROM documents WHERE app_id = ? AND collection = ? AND doc_id IN ({','.join('?' * len(chunk))})",
+                (self.app_id, collection_name, *chunk),
+            )
+            found.update({doc_id: (json.loads(data), version) for doc_id, data, version in rows})
+        return found
+
+    def list_documents(self, collection_name):
+        with self.connection() as conn:
+            rows = conn.execute("SELECT doc_id, data, version FROM documents WHERE app_id = ? AND collection = ?",
+                                (self.app_id, collection_name)).fetchall()
+        return {doc_id: {**json.loads(data), VERSION_FIELD: version} for doc_id, data, version in rows}
+
+    def query(self, collection_name, query):
+        """以索引欄位執行查詢"""
+        sql = "SELECT doc_id, data, version FROM documents WHERE app_id = ? AND collection = ?"
+        params = [self.app_id, collection_name]
+        for field, op, value in query.where:
+            sql += f" AND {INDEXED_FIELDS[field]} {'=' if op == '==' else op} ?"
+            params.append(value)
+        if query.order_by:
+            sql += f" ORDER BY {INDEXED_FIELDS[query.order_by]} {'DESC' if query.descending else 'ASC'}"
+        if query.limit:
+            sql += " LIMIT ?"
+            params.append(int(query.limit))
+        with self.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return {doc_id: {**json.loads(data), VERSION_FIELD: version} for doc_id, data, version in rows}
+
+    def commit(self, collection_name, upserts, deletes, expected):
+        """在單一交易內比對版本後寫入，返回 {文件 ID: 目前內容 (已刪除為 None)}"""
+        ops = commit_ops(upserts, deletes)
+        conflicts = {}
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = self._fetch(conn, collection_name, [doc_id for _, doc_id, _ in ops])
+                rows, removed = [], []
+                for op, doc_id, data in ops:
+                    remote, version = current.get(doc_id, (None, 0))
+                    if version != expected.get(doc_id, 0):
+                        conflicts[doc_id] = None if remote is None else {**remote, VERSION_FIELD: version}
+                    elif op == 'set':
+                        rows.append(self._row(collection_name, doc_id, data, version + 1))
+                    else:
+                        removed.append((self.app_id, collection_name, doc_id))
+                conn.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.executemany("DELETE FROM documents WHERE app_id = ? AND collection = ? AND doc_id = ?", removed)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return conflicts
+
+
+# --- 3. 差異同步引擎 ---
+class SyncResult:
+    def __init__(self, inserted=(), updated=(), deleted=(), conflicts=None):
+        self.inserted = list(inserted)
+        self.updated = list(updated)
+        self.deleted = list(deleted)
+        # 因版本不符而未寫入的文件：{文件 ID: 雲端目前內容 (已刪除為 None)}
+        self.conflicts = conflicts or {}
+        # 本 session 沒有修改、但其他人已新增、修改或刪除的文件：{文件 ID: 目前內容 (已刪除為 None)}
+        self.kept = {}
+        # 提交時的預期版本 (session 讀取時的版本)
+        self.expected = {}
+        self.frame = None
+        # 修改已寫入延後寫入佇列，尚未提交
+        self.queued = False
+
+    def upserts(self, docs):
+        """由完整文件集合取出需要寫入的新增及更新文件"""
+        return {doc_id: docs[doc_id] for doc_id in self.inserted + self.updated}
+
+    @property
+    def changed(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+    def summary(self):
+        text = f"新增 {len(self.inserted)}、更新 {len(self.updated)}、刪除 {len(self.deleted)}"
+        if self.conflicts:
+            text += f"；{len(self.conflicts)} 筆已被其他人修改，已改用最新內容"
+        return text
+
+
+def same_content(a, b):
+    """比較兩份文件 (None 表示不存在)；空值欄位與缺少該欄位視為相同 (DataFrame 會為缺少的欄位補上空值)"""
+    if a is None or b is None:
+        return a is b
+    if a == b:
+        return True
+    return ({k: v for k, v in a.items() if v is not None and v != ""}
+            == {k: v for k, v in b.items() if v is not None and v != ""})
+
+
+def merge_conflicts(collection_name, df, conflicts):
+    """以雲端最新內容取代或補回 DataFrame 中的文件 (內容為 None 的列會被移除)，其餘列保持不變"""
+    if not conflicts:
+        return df
+    docs = frame_to_documents(collection_name, df)
+    for doc_id, remote in conflicts.items():
+        if remote is None:
+            docs.pop(doc_id, None)
+        else:
+            docs[doc_id] = remote
+    merged = pd.DataFrame(list(docs.values()))
+    # 保持原有欄位次序，雲端新增的欄位排在最後
+    columns = list(df.columns) + [c for c in merged.columns if c not in df.columns]
+    return merged.reindex(columns=columns)
+
+
+class SyncEngine:
+    """保存每個集合上次同步的快照及各文件版本，儲存時只寫入新增、修改及刪除的文件
+
+    寫入時以 session 讀取時的版本作比對 (樂觀並行控制)：同一程序或其他程序的管理員在讀取後已修改的文件
+    不會被覆蓋，只重新讀取這些衝突文件並更新快照。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._snapshots = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def load(self, collection_name, docs=None):
+        """從後端讀取整個集合並記錄為快照，返回文件列表 (不含版本欄位)
+
+        docs 為已取得的整個集合 (例如監聽的第一次回呼) 時直接使用，不再向後端讀取。
+        """
+        if docs is None:
+            docs = self.backend.list_documents(collection_name)
+        snapshot, versions = {}, {}
+        for doc_id, data in docs.items():
+            data, versions[doc_id] = split_version(data)
+            snapshot[doc_id] = clean_record(data)
+        with self._lock:
+            self._snapshots[collection_name] = snapshot
+            self._versions[collection_name] = versions
+        return list(snapshot.values())
+
+    def seed(self, collection_name, docs, versions):
+        """以本機快照作為初始快照 (只在尚未從後端讀取時使用)；版本不符的文件在提交時會被偵測為衝突"""
+        with self._lock:
+            if collection_name not in self._snapshots:
+                self._snapshots[collection_name] = dict(docs)
+                self._versions[collection_name] = dict(versions)
+
+    def snapshot(self, collection_name):
+        """返回 (快照文件, 版本) 的副本，未載入時返回 None"""
+        with self._lock:
+            if collection_name not in self._snapshots:
+                return None
+            return dict(self._snapshots[collection_name]), dict(self._versions.get(collection_name, {}))
+
+    def matches_snapshot(self, collection_name, changes):
+        """判斷一組變更是否與快照一致 (即本程序自己寫入的回音)"""
+        snapshot = self._snapshots.get(collection_name)
+        if snapshot is None:
+            return False
+        for doc_id, data in changes.items():
+            if data is None:
+                if doc_id in snapshot:
+                    return False
+            elif snapshot.get(doc_id) != clean_record(split_version(data)[0]):
+                return False
+        return True
+
+    def current(self, collection_name, pending=None):
+        """快照加上尚未提交的修改 (pending 為 {文件 ID: 內容，刪除為 None})"""
+        snapshot = self._snapshots.get(collection_name, {})
+        if not pending:
+            return snapshot
+        current = dict(snapshot)
+        for doc_id, data in pending.items():
+            if data is None:
+                current.pop(doc_id, None)
+            else:
+                current[doc_id] = data
+        return current
+
+    def diff(self, collection_name, docs, pending=None):
+        snapshot = self.current(collection_name, pending)
+        inserted = [doc_id for doc_id in docs if doc_id not in snapshot]
+        # 新增的空白欄位 (例如只有部分學生有值的欄位) 不算修改
+        updated = [doc_id for doc_id in docs if doc_id in snapshot and not same_content(snapshot[doc_id], docs[doc_id])]
+        deleted = [doc_id for doc_id in snapshot if doc_id not in docs]
+        return SyncResult(inserted, updated, deleted)
+
+    def versions(self, collection_name, doc_ids):
+        """快照中各文件的版本 (未知的文件為 0)，作為提交時的預期版本"""
+        versions = self._versions.get(collection_name, {})
+        return {doc_id: versions.get(doc_id, 0) for doc_id in doc_ids}
+
+    def _commit(self, collection_name, upserts, deletes, expected=None):
+        """以預期版本 (預設為快照版本) 比對後提交，更新快照版本及衝突文件，返回 {文件 ID: 雲端內容}"""
+        if expected is None:
+            expected = self.versions(collection_name, list(upserts) + list(deletes))
+        versions = self._versions.setdefault(collection_name, {})
+        try:
+            conflicts = self.backend.commit(collection_name, upserts, deletes, expected)
+        except Exception:
+            # 部分批次可能已寫入，快照不再可信，下次儲存時重新讀取
+            self._snapshots.pop(collection_name, None)
+            self._versions.pop(collection_name, None)
+            raise
+        for doc_id in upserts:
+            if doc_id not in conflicts:
+                versions[doc_id] = expected[doc_id] + 1
+        for doc_id in deletes:
+            if doc_id not in conflicts:
+                versions.pop(doc_id, None)
+
+        resolved = {}
+        # 未載入整個集合時 (例如單筆附加) 不建立部分快照
+        snapshot = self._snapshots.get(collection_name, {})
+        for doc_id, remote in conflicts.items():
+            if remote is None:
+                snapshot.pop(doc_id, None)
+                versions.pop(doc_id, None)
+                resolved[doc_id] = None
+            else:
+                data, versions[doc_id] = split_version(remote)
+                snapshot[doc_id] = resolved[doc_id] = clean_record(data)
+        return resolved
+
+    def prepare(self, collection_name, df, base=None, pending=None):
+        """計算 DataFrame 的變更，不寫入後端
+
+        base 為本 session 修改前讀取的 DataFrame：只提交 df 與 base 不同的文件，預期版本為 session 讀取時的版本。
+        session 讀取後已被其他 session 或程序修改的文件不會寫入，以目前內容列為衝突；
+        session 沒有修改、但其他人已新增、修改或刪除的文件以目前內容為準 (result.kept)。
+        未提供 base (或 base 就是 df) 時與快照 (及尚未提交的修改) 比對。
+        返回 (SyncResult, {文件 ID: 內容})。
+        """
+        docs = frame_to_documents(collection_name, df)
+        with self._lock:
+            if collection_name not in self._snapshots:
+                self.load(collection_name)
+            if base is None or base is df:
+                result = self.diff(collection_name, docs, pending)
+            else:
+                result = self._diff_from_base(self.current(collection_name, pending), docs,
+                                              frame_to_documents(collection_name, base))
+            # 與 base 內容相同的文件，其快照版本即 session 讀取時的版本
+            result.expected = self.versions(collection_name, result.inserted + result.updated + result.deleted)
+        return result, docs
+
+    @staticmethod
+    def _diff_from_base(current, docs, seen):
+        changed = [doc_id for doc_id in docs if seen.get(doc_id) != docs[doc_id]]
+        removed = [doc_id for doc_id in seen if doc_id not in docs]
+        conflicts = {}
+        for doc_id in changed + removed:
+            now = current.get(doc_id)
+            # 其他人已作出相同修改 (或已刪除) 時不需寫入，亦不算衝突
+            if same_content(now, docs.get(doc_id)) or same_content(now, seen.get(doc_id)):
+                continue
+            conflicts[doc_id] = now
+        touched = set(changed) | set(removed)
+        result = SyncResult(
+            [doc_id for doc_id in changed if doc_id not in conflicts and doc_id not in current],
+            [doc_id for doc_id in changed if doc_id not in conflicts and doc_id in current and current[doc_id] != docs[doc_id]],
+            [doc_id for doc_id in removed if doc_id not in conflicts and doc_id in current],
+            conflicts,
+        )
+        result.kept = {doc_id: data for doc_id, data in current.items()
+                       if doc_id not in touched and not same_content(docs.get(doc_id), data)}
+        result.kept.update({doc_id: None for doc_id in docs if doc_id not in current and doc_id not in touched})
+        return result
+
+    def apply(self, collection_name, upserts, deletes, expected=None):
+        """提交一組文件變更並更新快照，返回衝突文件 {文件 ID: 雲端內容}"""
+        with self._lock:
+            if collection_name not in self._snapshots:
+                self.load(collection_name)
+            # 先更新快照，令監聽器把本次寫入的回音視為已知變更
+            snapshot = self._snapshots[collection_name]
+            snapshot.update(upserts)
+            for doc_id in deletes:
+                snapshot.pop(doc_id, None)
+            return self._commit(collection_name, upserts, deletes, expected)
+
+    def sync(self, collection_name, df, base=None):
+        """比對 base (或快照) 與 DataFrame，僅提交有變更的文件
+
+        與其他管理員的修改衝突的文件會保留雲端內容，列於結果的 conflicts。
+        """
+        with self._lock:
+            result, docs = self.prepare(collection_name, df, base)
+            if result.changed:
+                result.conflicts.update(self.apply(collection_name, result.upserts(docs), result.deleted, result.expected))
+            return result
+
+    def write_one(self, collection_name, record):
+        """單筆寫入一份文件 (不比對整個集合)，返回文件 ID"""
+        doc = clean_record(record)
+        doc_id = make_doc_id(collection_name, doc)
+        with self._lock:
+            if collection_name in self._snapshots:
+                self._snapshots[collection_name][doc_id] = doc
+            self._commit(collection_name, {doc_id: doc}, [])
+        return doc_id
+
+
+# --- 4. 跨 session 共用快取 ---
+# 集合版本號在整個程序內遞增，不同租戶或重新建立的快取亦不會出現相同的版本號
+_CACHE_VERSIONS = itertools.count(1)
+
+
+class SharedDataCache:
+    """程序內共用的集合快取，每個集合只保存一份 DataFrame
+
+    各 session 只持有快取中 DataFrame 的引用，因此取得後不可直接原地修改。
+    設定 max_bytes 時，總記憶體超出上限便移除最久未使用的集合 (下次讀取時重新載入)。
+    """
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, max_bytes=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self.evictions = 0
+        self._versions = {}
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._derived = {}
+
+    def _fresh(self, collection_name):
+        entry = self._entries.get(collection_name)
+        return entry is not None and time.monotonic() - entry[1] < self.ttl
+
+    def _touch(self, collection_name):
+        with self._lock:
+            if collection_name in self._entries:
+                self._entries.move_to_end(collection_name)
+
+    def get(self, collection_name, loader):
+        """取得集合 DataFrame；過期或未載入時以 loader 讀取 (同一集合只會有一個讀取)"""
+        entry = self._entries.get(collection_name)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            self._touch(collection_name)
+            return entry[0]
+        with self._lock:
+            load_lock = self._load_locks.setdefault(collection_name, threading.Lock())
+        with load_lock:
+            if not self._fresh(collection_name):
+                df = loader()
+                self.put(collection_name, df)
+                return df
+            return self._entries[collection_name][0]
+
+    def put(self, collection_name, df):
+        size = frame_memory(df) if self.max_bytes is not None else 0
+        with self._lock:
+            self._entries[collection_name] = (df, time.monotonic())
+            self._entries.move_to_end(collection_name)
+            self._sizes[collection_name] = size
+            self._versions[collection_name] = next(_CACHE_VERSIONS)
+            if self.max_bytes is not None:
+                self._evict(keep=collection_name)
+
+    def _evict(self, keep):
+        # 最近使用的集合排在最後；剛寫入的集合即使單獨超出上限亦保留
+        while self.memory() > self.max_bytes:
+            name = next((n for n in self._entries if n != keep), None)
+            if name is None:
+                return
+            self._drop(name)
+            self.evictions += 1
+
+    def _drop(self, collection_name):
+        self._entries.pop(collection_name, None)
+        self._sizes.pop(collection_name, None)
+        for key in [k for k in self._derived if k[0] == collection_name]:
+            del self._derived[key]
+
+    def memory(self):
+        """快取中各集合 DataFrame 的估算記憶體總和 (只在設定 max_bytes 時量度)"""
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def peek(self, collection_name):
+        """返回仍有效的快取 DataFrame，未載入或已過期時返回 None (不會觸發讀取)"""
+        entry = self._entries.get(collection_name)
+        return entry[0] if entry is not None and self._fresh(collection_name) else None
+
+    def invalidate(self, collection_name=None):
+        with self._lock:
+            names = [collection_name] if collection_name else list(self._entries)
+            for name in names:
+                # 只有查詢結果而未載入整個集合時亦須遞增版本，令查詢快取失效
+                if name in self._entries or collection_name:
+                    self._versions[name] = next(_CACHE_VERSIONS)
+                self._drop(name)
+
+    def version(self, collection_name):
+        """集合的版本號，每次寫入或失效時遞增 (程序內唯一)，可作為衍生計算及匯出檔案的快取鍵"""
+        return self._versions.get(collection_name, 0)
+
+    def derived(self, collection_name, kind, df, builder):
+        """按集合版本快取由 DataFrame 衍生的結果 (例如排行榜視圖)
+
+        只有 df 正是快取中的同一個 DataFrame 時才會共用，否則返回 None 由呼叫者自行計算。
+        """
+        with self._lock:
+            entry = self._entries.get(collection_name)
+            version = self._versions.get(collection_name, 0)
+            hit = self._derived.get((collection_name, kind))
+        if entry is None or entry[0] is not df:
+            return None
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        value = builder(df)
+        with self._lock:
+            if self._versions.get(collection_name, 0) == version:
+                self._derived[(collection_name, kind)] = (version, value)
+        return value
+
+
+class DataService:
+    """單一程序共用的數據服務：差異同步引擎 + 共用快取 + 雲端變更監聽"""
+
+    def __init__(self, backend, ttl=DEFAULT_CACHE_TTL, metrics=PROCESS_METRICS, max_bytes=None):
+        self.backend = backend
+        self.metrics = metrics
+        self.engine = SyncEngine(backend)
+        self.cache = SharedDataCache(ttl, max_bytes)
+        self._watches = {}
+        self._queries = {}
+        self._query_lock = threading.Lock()
+        self.write_queue = None
+        self.snapshot_store = None
+        self._reconciled = set()
+        self._background = ThreadPoolExecutor(max_workers=2)
+
+    def attach_snapshot_store(self, store):
+        """啟用本機快照 (見 snapshot_store.py)：首次讀取集合時先以快照即時返回，再在背景與後端核對"""
+        self.snapshot_store = store
+        return self
+
+    def attach_write_queue(self, write_queue):
+        """啟用延後寫入：save / append 只寫入本機日誌及共用快取，由佇列在背景提交 (見 write_queue.py)"""
+        write_queue.on_flush = self._on_flush
+        write_queue.metrics = self.metrics
+        self.write_queue = write_queue.start()
+        return self
+
+    def load(self, collection_name):
+        """讀取集合 (優先使用共用快取)，集合為空時返回 None；尚未提交的修改會套用在讀取結果上
+
+        有本機快照時，本程序首次讀取 (或上次核對失敗後) 直接返回快照內容並在背景向後端核對；
+        後端無法連線時亦以快照代替。
+        """
+        def loader():
+            with Span(f"data.load.{collection_name}", self.metrics) as info:
+                df = self._load_frame(collection_name)
+                info["docs"], info["bytes"] = (0 if df is None else len(df)), frame_bytes(df)
+            return df
+        return self.cache.get(collection_name, loader)
+
+    def _load_frame(self, collection_name):
+        if self.snapshot_store is not None and collection_name not in self._reconciled:
+            stored = self.snapshot_store.read(collection_name)
+            if stored is not None:
+                docs, versions, etag = stored
+                self.engine.seed(collection_name, docs, versions)
+                self._submit(self._reconcile, collection_name, etag)
+                return self._frame(collection_name, docs)
+        try:
+            self._fetch(collection_name)
+        except Exception:
+            # 後端無法連線：改用本機快照，下次讀取時再核對
+            stored = self.snapshot_store.read(collection_name) if self.snapshot_store is not None else None
+            if stored is None:
+                raise
+            self._reconciled.discard(collection_name)
+            return self._frame(collection_name, stored[0])
+        self._reconciled.add(collection_name)
+        self._persist(collection_name)
+        return self._frame(collection_name)
+
+    def _frame(self, collection_name, docs=None):
+        """由快照 (或指定文件) 加上尚未提交的修改組成 DataFrame"""
+        pending = self.write_queue.pending(collection_name) if self.write_queue is not None else None
+        if docs is None or pending:
+            base = docs if docs is not None else self.engine.current(collection_name)
+            docs = dict(base)
+            for doc_id, data in (pending or {}).items():
+                if data is None:
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = data
+        return frame_from_documents(collection_name, list(docs.values()))
+
+    def _reconcile(self, collection_name, etag):
+        """背景向後端讀取集合；內容與快照不同時更新共用快取及本機快照"""
+        try:
+            with Span(f"data.reconcile.{collection_name}", self.metrics):
+                self._fetch(collection_name)
+        except Exception:
+            # 離線：繼續使用快照，快取過期後再次嘗試
+            return
+        self._reconciled.add(collection_name)
+        if self._persist(collection_name) != etag:
+            self.cache.put(collection_name, self._frame(collection_name))
+
+    def _persist(self, collection_name):
+        """把引擎快照寫入本機快照，返回 etag (未啟用時返回 None)"""
+        snapshot = self.engine.snapshot(collection_name) if self.snapshot_store is not None else None
+        if snapshot is None:
+            return None
+        try:
+            return self.snapshot_store.write(collection_name, *snapshot)
+        except OSError:
+            return None
+
+    def load_many(self, collection_names, max_workers=8):
+        """並行讀取多個集合
+
+        返回 (frames, errors, timings)：各集合的 DataFrame (或 None)、
+        讀取失敗的例外，以及每個集合的耗時 (秒)。單一集合失敗不影響其他集合。
+        """
+        def timed_load(name):
+            start = time.perf_counter()
+            try:
+                return name, self.load(name), None, time.perf_counter() - start
+            except Exception as e:
+                return name, None, e, time.perf_counter() - start
+
+        frames, errors, timings = {}, {}, {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(collection_names)))) as pool:
+            for name, df, error, elapsed in pool.map(timed_load, collection_names):
+                timings[name] = elapsed
+                if error is not None:
+                    errors[name] = error
+                else:
+                    frames[name] = df
+        return frames, errors, timings
+
+    def stored(self, collection_name):
+        """已提交 (或已寫入延後佇列) 的集合內容，不包括只以 publish 發布的 DataFrame；集合為空時返回 None
+
+        即不提供 base 時 save 的比對對象。
+        """
+        if self.engine.snapshot(collection_name) is None:
+            self._fetch(collection_name)
+        return self._frame(collection_name)
+
+    def query(self, query):
+        """執行查詢，返回符合條件的 DataFrame (沒有結果時返回 None)
+
+        整個集合已在共用快取時直接篩選快取內容；否則把條件交由後端執行，只讀取符合的文件，
+        再套用延後寫入佇列中尚未提交的修改 (與 load 一致)。
+        結果按 (集合, 條件) 快取，集合版本變更 (寫入或監聽到其他人的修改) 或過期時失效。
+        """
+        name = query.collection_name
+        cached = self.cache.peek(name)
+        if cached is not None:
+            result = self.cache.derived(name, ('query', query.key), cached, query.filter_frame)
+            if result is not None:
+                return None if result.empty else result
+        hit = self._query_hit(query)
+        if hit is not None:
+            return hit[2]
+        version = self.cache.version(name)
+        with Span(f"data.query.{name}", self.metrics) as info:
+            docs = {doc_id: split_version(data)[0] for doc_id, data in self.backend.query(name, query).items()}
+            pending = self.write_queue.pending(name) if self.write_queue is not None else None
+            if pending:
+                # 後端結果未包括排隊中的修改：按相同條件重新篩選、排序及限制筆數
+                for doc_id, data in pending.items():
+                    docs.pop(doc_id, None)
+                    if data is not None:
+                        docs[doc_id] = data
+                docs = query.apply(docs)
+            df = frame_from_documents(name, list(docs.values()))
+            info["docs"], info["bytes"] = len(docs), frame_bytes(df)
+        with self._query_lock:
+            if len(self._queries) >= MAX_CACHED_QUERIES:
+                self._queries.pop(next(iter(self._queries)))
+            self._queries[query] = (version, time.monotonic(), df)
+        return df
+
+    def _query_hit(self, query):
+        # 不為查詢開啟整個集合的監聽 (監聽會讀取所有文件)，其他程序的修改最遲在 TTL 後生效
+        with self._query_lock:
+            hit = self._queries.get(query)
+        if hit is not None and hit[0] == self.cache.version(query.collection_name) and time.monotonic() - hit[1] < self.cache.ttl:
+            return hit
+        return None
+
+    def query_cached(self, query):
+        """查詢可否由共用快取回答 (整個集合或同一查詢的結果仍有效)，不需向後端讀取"""
+        return self.cache.peek(query.collection_name) is not None or self._query_hit(query) is not None
+
+    def save(self, collection_name, df, base=None):
+        """寫入變更，成功提交 (或寫入延後佇列) 後才更新共用快取
+
+        base 為修改前讀取的 DataFrame (見 SyncEngine.prepare)。有衝突或其他人修改了本 session 沒有修改的文件時，
+        快取改為合併雲端最新內容後的 DataFrame (result.frame)。提交失敗時拋出例外，快取保持不變。
+        """
+        with Span(f"data.save.{collection_name}", self.metrics) as info:
+            if self.write_queue is not None:
+                pending = self.write_queue.pending(collection_name)
+                result, docs = self.engine.prepare(collection_name, df, base, pending)
+                self.write_queue.enqueue(collection_name, result.upserts(docs), result.deleted)
+                result.queued = result.changed
+            else:
+                result = self.engine.sync(collection_name, df, base)
+                if result.changed:
+                    self._submit(self._persist, collection_name)
+            info["docs"] = len(result.inserted) + len(result.updated) + len(result.deleted)
+        result.frame = df
+        if result.conflicts or result.kept:
+            result.frame = merge_conflicts(collection_name, df, {**result.kept, **result.conflicts})
+        self.cache.put(collection_name, result.frame)
+        return result
+
+    def append(self, collection_name, record, df):
+        """附加一筆紀錄：只寫入一份文件，成功後把 df (附加後的完整 DataFrame) 放入共用快取"""
+        if self.write_queue is not None:
+            doc = clean_record(record)
+            doc_id = make_doc_id(collection_name, doc)
+            self.write_queue.enqueue(collection_name, {doc_id: doc}, [])
+        else:
+            doc_id = self.engine.write_one(collection_name, record)
+            self._submit(self._persist, collection_name)
+        self.cache.put(collection_name, df)
+        return doc_id
+
+    def publish(self, collection_name, df):
+        """只更新共用快取 (例如由流水帳推算的積分榜)，不寫入雲端"""
+        self.cache.put(collection_name, df)
+
+    def _submit(self, fn, *args):
+        try:
+            self._background.submit(fn, *args)
+        except RuntimeError:
+            # 服務已關閉 (例如租戶被移出記憶體)：略過背景的快照更新
+            pass
+
+    def close(self):
+        """停止監聽、背景提交及背景工作；未提交的修改保留在日誌，下次建立服務時繼續提交"""
+        for handle in self._watches.values():
+            if hasattr(handle, 'unsubscribe'):
+                try:
+                    handle.unsubscribe()
+                except Exception:
+                    pass
+        self._watches.clear()
+        if self.write_queue is not None:
+            self.write_queue.stop()
+        self._background.shutdown(wait=False)
+        self.cache.invalidate()
+
+    def _fetch(self, collection_name):
+        """從後端讀取整個集合並更新引擎快照
+
+        集合尚未監聽時先開始監聽，以第一次回呼 (整個集合) 作為讀取結果，冷啟動只讀取集合一次；
+        無法監聽或第一次回呼逾時時改為直接讀取。
+        """
+        initial = self._start_watch(collection_name)
+        self.engine.load(collection_name, initial)
+
+    def _start_watch(self, collection_name):
+        """開始監聽集合，返回第一次回呼收到的全部文件；已在監聽、無法監聽或逾時時返回 None"""
+        if collection_name in self._watches or not hasattr(self.backend, 'watch'):
+            return None
+        initial, ready, lock = {}, threading.Event(), threading.Lock()
+
+        def callback(changes):
+            with lock:
+                first = not ready.is_set()
+                if first:
+                    initial.update(changes)
+                    ready.set()
+            if not first:
+                self._on_change(collection_name, changes)
+
+        try:
+            self._watches[collection_name] = self.backend.watch(collection_name, callback)
+        except Exception:
+            # 無法監聽時僅依賴 TTL 失效，下次從後端讀取時再嘗試監聽
+            return None
+        if not ready.wait(WATCH_INITIAL_TIMEOUT):
+            with lock:
+                # 逾時後才到達的第一次回呼按一般變更處理
+                if not ready.is_set():
+                    ready.set()
+                    return None
+        return {doc_id: data for doc_id, data in initial.items() if data is not None}
+
+    def _on_flush(self, collection_name, conflicts):
+        # 背景提交時發現衝突：以雲端內容取代共用快取中的這些文件
+        cached = self.cache.peek(collection_name)
+        if conflicts and cached is not None:
+            self.cache.put(collection_name, merge_conflicts(collection_name, cached, conflicts))
+        self._persist(collection_name)
+
+    def _on_change(self, collection_name, changes):
+        # 其他 session 或程序的寫入才需令快取失效
+        if not self.engine.matches_snapshot(collection_name, changes):
+            self.cache.invalidate(collection_name)
@@ -0,0 +1,222 @@
+"""正覺壁球管理系統 - Excel 匯入及匯出
+
+匯入：以 openpyxl 唯讀模式逐列串流讀取上載的 Excel，分段驗證及標準化欄位，
+大型多工作表名單亦只需有限記憶體。
+匯出：以 openpyxl 唯寫模式逐列寫出工作簿。
+"""
+import io
+import re
+
+import pandas as pd
+
+from rankings import SETTLED_COLUMN, SETTLED_EVENTS
+
+# 每段處理的列數
+CHUNK_ROWS = 2000
+# 顯示的警告上限 (避免大量錯誤列洗版)
+MAX_WARNINGS = 20
+
+# 常見的欄位別名 -> 標準欄位
+COLUMN_ALIASES = {
+    "班別": "班級", "班": "班級",
+    "學生姓名": "姓名", "名字": "姓名",
+    "級別": "年級",
+    "班號": "學號", "學生編號": "學號",
+    "分數": "積分",
+}
+
+# 各匯入類型的欄位規格：required 為必填欄位，optional 為選填欄位及其預設值，
+# keep_extra 為 True 時保留其他欄位 (例如日程表的上課時間、地點，名單及積分榜的備註欄)
+IMPORT_SCHEMAS = {
+    'schedules': {"required": ["班級"], "optional": {"具體日期": ""}, "keep_extra": True},
+    'class_players': {"required": ["班級", "姓名"], "optional": {"年級": "-", "學號": ""}, "keep_extra": True},
+    'rankings': {"required": ["年級", "班級", "姓名", "積分"], "optional": {"章別": "無"}, "keep_extra": True},
+}
+
+
+class ImportResult:
+    def __init__(self, frame=None, errors=None, warnings=None, rows_read=0, sheets=0):
+        self.frame = frame
+        self.errors = errors or []
+        self.warnings = warnings or []
+        self.rows_read = rows_read
+        self.sheets = sheets
+
+    @property
+    def ok(self):
+        return self.frame is not None and not self.errors
+
+
+def normalize_header(value):
+    name = "" if value is None else str(value).strip()
+    return COLUMN_ALIASES.get(name, name)
+
+
+def iter_sheet_chunks(data, chunk_rows=CHUNK_ROWS):
+    """逐個工作表串流讀取，產生 (工作表名稱, 欄位名稱, 該段資料列, 各列的 Excel 列號)"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            header = [normalize_header(h) for h in header]
+            chunk, row_numbers = [], []
+            for row_number, row in enumerate(rows, start=2):
+                if row is None or all(v is None or str(v).strip() == "" for v in row):
+                    continue
+                row = tuple(row[:len(header)])
+                chunk.append(row + (None,) * (len(header) - len(row)))
+                row_numbers.append(row_number)
+                if len(chunk) >= chunk_rows:
+                    yield ws.title, header, chunk, row_numbers
+                    chunk, row_numbers = [], []
+            if chunk:
+                yield ws.title, header, chunk, row_numbers
+    finally:
+        wb.close()
+
+
+def clean_text(series):
+    """去除前後空白；空值轉為空字串，Excel 的 1.0 轉為 1"""
+    def to_text(v):
+        if v is None or (not isinstance(v, str) and pd.isna(v)):
+            return ""
+        if isinstance(v, float) and v.is_integer():
+            return str(int(v))
+        return str(v).strip()
+    return series.map(to_text)
+
+
+def validate_chunk(kind, chunk_df, sheet, row_numbers, warnings):
+    """驗證及標準化一段資料，返回保留的資料列"""
+    schema = IMPORT_SCHEMAS[kind]
+    for col, default in schema["optional"].items():
+        if col not in chunk_df.columns:
+            chunk_df[col] = default
+    columns = schema["required"] + list(schema["optional"])
+    if schema["keep_extra"]:
+        columns += [c for c in chunk_df.columns if c not in columns and c]
+    df = chunk_df[columns].copy()
+
+    text_cols = [c for c in schema["required"] + list(schema["optional"]) if c != "積分"]
+    for col in text_cols:
+        df[col] = clean_text(df[col])
+    if "學號" in df.columns:
+        df["學號"] = df["學號"].map(lambda v: v.zfill(2) if v.isdigit() else v)
+    if "年級" in df.columns:
+        df["年級"] = df["年級"].replace("", "-")
+
+    keep = pd.Series(True, index=df.index)
+    for col in [c for c in schema["required"] if c != "積分"]:
+        missing = df[col] == ""
+        for pos in df.index[missing]:
+            if len(warnings) < MAX_WARNINGS:
+                warnings.append(f"{sheet} 第 {row_numbers[pos]} 列缺少「{col}」，已略過")
+        keep &= ~missing
+
+    if "積分" in df.columns:
+        points = pd.to_numeric(df["積分"], errors='coerce')
+        invalid = points.isna() & keep
+        for pos in df.index[invalid]:
+            if len(warnings) < MAX_WARNINGS:
+                warnings.append(f"{sheet} 第 {row_numbers[pos]} 列「積分」不是數字，已設為 0")
+        df["積分"] = points.fillna(0).astype(int)
+    return df[keep]
+
+
+def import_excel(data, kind, chunk_rows=CHUNK_ROWS):
+    """讀取並驗證上載的 Excel (所有工作表)，返回 ImportResult
+
+    缺少必填欄位的工作表會被略過；所有工作表都不合格時返回錯誤。
+    """
+    schema = IMPORT_SCHEMAS[kind]
+    parts, warnings, errors = [], [], []
+    sheets_used, skipped, rows_read = set(), set(), 0
+    try:
+        for sheet, header, rows, row_numbers in iter_sheet_chunks(data, chunk_rows):
+            if sheet in skipped:
+                continue
+            missing = [c for c in schema["required"] if c not in header]
+            if missing:
+                skipped.add(sheet)
+                warnings.append(f"工作表「{sheet}」缺少欄位：{'、'.join(missing)}，已略過")
+                continue
+            # 同名欄位只保留第一個
+            chunk_df = pd.DataFrame(rows, columns=header)
+            chunk_df = chunk_df.loc[:, ~chunk_df.columns.duplicated()]
+            parts.append(validate_chunk(kind, chunk_df, sheet, row_numbers, warnings))
+            sheets_used.add(sheet)
+            rows_read += len(rows)
+    except Exception as e:
+        return ImportResult(errors=[f"無法讀取 Excel：{e}"])
+
+    if not parts:
+        errors.append(f"找不到包含必填欄位 ({'、'.join(schema['required'])}) 的工作表")
+        return ImportResult(errors=errors, warnings=warnings, rows_read=rows_read)
+    frame = pd.concat(parts, ignore_index=True)
+    return ImportResult(frame, errors, warnings, rows_read, len(sheets_used))
+
+
+# --- 匯出 ---
+def ranking_export_frame(rank_df):
+    """匯出用積分榜：合併重複學生 (年級+姓名)，積分轉為整數並由高至低排序"""
+    export_df = rank_df.drop_duplicates(subset=["年級", "姓名"], keep='first').drop(columns=[SETTLED_COLUMN, SETTLED_EVENTS], errors='ignore')
+    export_df["積分"] = pd.to_numeric(export_df["積分"], errors='coerce').fillna(0).astype(int)
+    return export_df.sort_values(by="積分", ascending=False)
+
+
+def safe_sheet_title(title, used):
+    """Excel 工作表名稱最多 31 字元且不可包含 []:*?/\\，重複時加上編號"""
+    base = re.sub(r"[\[\]:*?/\\]", "-", str(title)).strip() or "Sheet"
+    base = base[:31]
+    name, n = base, 2
+    while name in used:
+        suffix = f" ({n})"
+        name, n = base[:31 - len(suffix)] + suffix, n + 1
+    used.add(name)
+    return name
+
+
+def write_frame(wb, title, df, used_titles):
+    """以唯寫模式把 DataFrame 逐列寫入新工作表"""
+    ws = wb.create_sheet(safe_sheet_title(title, used_titles))
+    ws.append([str(c) for c in df.columns])
+    for row in df.itertuples(index=False, name=None):
+        ws.append([None if (not isinstance(v, str) and pd.isna(v)) else (v.item() if hasattr(v, "item") else v) for v in row])
+
+
+def build_workbook(sheets):
+    """sheets 為 [(工作表名稱, DataFrame), ...]，返回 xlsx 位元組"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    used_titles = set()
+    for title, df in sheets:
+        write_frame(wb, title, df, used_titles)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def export_rankings_xlsx(rank_df):
+    return build_workbook([('積分榜', ranking_export_frame(rank_df))])
+
+
+def export_attendance_csv(report_df):
+    return report_df.to_csv(index=False).encode('utf-8-sig')
+
+
+def export_school_workbook(rank_df, matrices):
+    """全校匯出：積分榜 + 每班一張考勤總表，一次寫出
+
+    matrices 為 {班級: 考勤總表 DataFrame}。
+    """
+    sheets = []
+    if rank_df is not None and not rank_df.empty:
+        sheets.append(('積分榜', ranking_export_frame(rank_df)))
+    sheets += [(f"考勤-{s_class}", report_df) for s_class, report_df in matrices.items()]
+    return build_workbook(sheets or [('空白', pd.DataFrame())])
@@ -0,0 +1,141 @@
+"""正覺壁球管理系統 - 效能量度
+
+以 span 量度數據層呼叫、頁面繪製及 DataFrame 運算的耗時，並累計文件數及位元組，
+彙總為耗時直方圖。PROCESS_METRICS 為程序內共用的統計，各 session 可另建 Metrics。
+"""
+import json
+import threading
+import time
+
+import pandas as pd
+
+# 直方圖各區間的上限 (毫秒)，最後一個區間為超過 10 秒
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """固定區間的耗時直方圖 (毫秒)，百分位數以所在區間的上限估算"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.docs = 0
+        self.bytes = 0
+
+    def add(self, ms, docs=0, nbytes=0):
+        i = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.docs += docs or 0
+        self.bytes += nbytes or 0
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(float(BUCKETS_MS[i]), self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max, 3),
+            "docs": self.docs,
+            "bytes": self.bytes,
+            "buckets": dict(zip([f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"], self.buckets)),
+        }
+
+
+class Metrics:
+    """span 名稱 -> 直方圖"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, docs=0, nbytes=0):
+        with self._lock:
+            self._histograms.setdefault(name, Histogram()).add(seconds * 1000, docs, nbytes)
+
+    def summary(self):
+        """每個 span 一列：次數、平均、p50、p95、最長耗時及累計文件數、位元組"""
+        with self._lock:
+            rows = [{"項目": name, **{k: v for k, v in h.to_dict().items() if k != "buckets"}}
+                    for name, h in self._histograms.items()]
+        columns = ["項目", "count", "total_ms", "mean_ms", "p50_ms", "p95_ms", "max_ms", "docs", "bytes"]
+        return pd.DataFrame(rows, columns=columns).sort_values(by="total_ms", ascending=False, ignore_index=True)
+
+    def to_dict(self):
+        with self._lock:
+            return {"started": self.started, "spans": {name: h.to_dict() for name, h in self._histograms.items()}}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.started = time.time()
+
+
+class Span:
+    """量度一段程式的耗時並記錄到一個或多個 Metrics
+
+    可作為 context manager 使用 (info 字典可設定 docs / bytes)，
+    亦可在無法包住整段程式時呼叫 finish()。
+    """
+
+    def __init__(self, name, *targets):
+        self.name = name
+        self.targets = targets
+        self.info = {"docs": 0, "bytes": 0}
+        self.start = time.perf_counter()
+        self.finished = False
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.perf_counter() - self.start
+        for metrics in self.targets:
+            metrics.record(self.name, elapsed, self.info["docs"], self.info["bytes"])
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.info
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
+
+
+def frame_bytes(df):
+    """DataFrame 佔用的記憶體 (位元組)，作為讀寫數據量的估算"""
+    return 0 if df is None else int(df.memory_usage(index=False).sum())
+
+
+def frame_memory(df, sample=1000):
+    """DataFrame 實際佔用記憶體 (包括文字內容) 的估算：大型表格只量度平均分佈的部分列再按比例推算"""
+    if df is None or df.empty:
+        return 0
+    if len(df) <= sample:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    rows = df.iloc[::len(df) // sample]
+    return int(rows.memory_usage(index=True, deep=True).sum() * len(df) / len(rows))
+
+
+def export_json(**sections):
+    """把多份統計 (例如程序及 session) 匯出為 JSON 文字"""
+    return json.dumps({name: m.to_dict() for name, m in sections.items()}, ensure_ascii=False, indent=2)
+
+
+PROCESS_METRICS = Metrics()
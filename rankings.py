@@ -0,0 +1,334 @@
+"""正覺壁球管理系統 - 積分榜運算、學生索引及積分流水帳
+
+名單同步、章別、排名表，以及以流水帳記錄並定期結算的積分事件。
+"""
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+RANK_COLUMNS = ["年級", "班級", "姓名", "積分", "章別"]
+# 新加入積分榜學生的起始積分
+NEW_PLAYER_POINTS = 100
+# 香港壁球總會章別獎勵設定
+BADGE_AWARDS = {
+    "白金章": {"points": 400, "icon": "💎"},
+    "金章": {"points": 200, "icon": "🥇"},
+    "銀章": {"points": 100, "icon": "🥈"},
+    "銅章": {"points": 50, "icon": "🥉"},
+    "無": {"points": 0, "icon": ""}
+}
+
+
+def text_key(series):
+    """與 str(x).strip() 相同的標準化 (空值轉為 'nan' 字串，與逐列比對一致)"""
+    return series.map(str).str.strip()
+
+
+def ensure_rank_columns(df_r):
+    """補齊積分榜欄位 (原地修改並返回)"""
+    for col in RANK_COLUMNS:
+        if col not in df_r.columns: df_r[col] = 0 if col == "積分" else "無"
+    return df_r
+
+
+def sync_from_roster(rank_df, players_df):
+    """將壁球班名單中尚未在積分榜的學生加入積分榜
+
+    以 (姓名, 年級) 作比對鍵，名單內重複的學生只加入第一筆。
+    結果與逐列比對的舊做法一致，但只需一次反連接及一次 concat。
+    返回 (新積分榜, 新增人數)。
+    """
+    df_r = ensure_rank_columns(rank_df.copy())
+    if players_df.empty:
+        return df_r, 0
+
+    grades = players_df["年級"] if "年級" in players_df.columns else pd.Series("-", index=players_df.index)
+    candidates = pd.DataFrame({
+        "年級": text_key(grades).to_numpy(),
+        "班級": text_key(players_df["班級"]).to_numpy(),
+        "姓名": text_key(players_df["姓名"]).to_numpy(),
+    })
+    candidates = candidates.drop_duplicates(subset=["姓名", "年級"], keep='first')
+
+    existing = pd.MultiIndex.from_arrays([text_key(df_r["姓名"]), text_key(df_r["年級"])])
+    new_keys = pd.MultiIndex.from_arrays([candidates["姓名"], candidates["年級"]])
+    new_rows = candidates[~new_keys.isin(existing)]
+    if new_rows.empty:
+        return df_r, 0
+
+    new_rows = new_rows.assign(積分=NEW_PLAYER_POINTS, 章別="無")[RANK_COLUMNS]
+    return pd.concat([df_r, new_rows], ignore_index=True), len(new_rows)
+
+
+def user_id_key(s_class, s_num):
+    """學生登入 ID (如 1A01)：班別轉大寫，學號補足兩位 (Excel 的 1.0 視作 1)"""
+    num = str(s_num).strip()
+    if num.endswith(".0") and num[:-2].isdigit():
+        num = num[:-2]
+    return f"{str(s_class).strip().upper()}{num.zfill(2)}"
+
+
+class StudentRegistry:
+    """以標準化鍵索引積分榜及壁球班名單
+
+    - (年級, 姓名) -> 積分榜列標籤
+    - 學生登入 ID (班級 + 學號) -> 真實姓名
+    索引只在來源 DataFrame 被替換時重建；經由本物件修改積分榜時以 O(1) 同步更新索引。
+    """
+
+    def __init__(self):
+        self.rank_df = None
+        self._rank_source = None
+        self._rank_index = {}
+        self._players_source = None
+        self._user_index = {}
+
+    # --- 綁定來源 ---
+    def bind_rankings(self, rank_df):
+        if rank_df is self._rank_source and self.rank_df is not None:
+            return self
+        self._rank_source = rank_df
+        self.rank_df = ensure_rank_columns(rank_df.copy())
+        keys = zip(text_key(self.rank_df["年級"]), text_key(self.rank_df["姓名"]))
+        self._rank_index = {}
+        for label, key in zip(self.rank_df.index, keys):
+            # 與舊做法相同，重複學生以第一筆為準
+            self._rank_index.setdefault(key, label)
+        return self
+
+    def bind_players(self, players_df):
+        if players_df is self._players_source:
+            return self
+        self._players_source = players_df
+        self._user_index = {}
+        if {"班級", "學號", "姓名"}.issubset(players_df.columns):
+            for s_class, s_num, name in zip(players_df["班級"], players_df["學號"], players_df["姓名"]):
+                self._user_index.setdefault(user_id_key(s_class, s_num), str(name))
+        return self
+
+    # --- 查詢 ---
+    def find(self, name, grade):
+        """返回學生在積分榜的列標籤，找不到時返回 None"""
+        return self._rank_index.get((str(grade).strip(), str(name).strip()))
+
+    def resolve_user(self, user_id):
+        """由登入 ID (如 1A01) 取得學生真實姓名，找不到時返回空字串"""
+        return self._user_index.get(str(user_id).strip().upper(), "")
+
+    def points(self, label):
+        pts = pd.to_numeric(self.rank_df.at[label, "積分"], errors='coerce')
+        return 0 if pd.isna(pts) else pts
+
+    # --- 修改 (同步更新索引) ---
+    def add_student(self, name, grade, s_class, points, badge="無"):
+        label = self.rank_df.index.max() + 1 if len(self.rank_df) else 0
+        self.rank_df.loc[label] = {"年級": grade, "班級": s_class, "姓名": name, "積分": points, "章別": badge}
+        self._rank_index.setdefault((str(grade).strip(), str(name).strip()), label)
+        return label
+
+    def award_badge(self, name, grade, s_class, badge, badge_points):
+        """登記章別並加分；學生不在積分榜時以起始積分建立新記錄"""
+        label = self.find(name, grade)
+        if label is None:
+            return self.add_student(name, grade if grade else "-", s_class if s_class else "-",
+                                    NEW_PLAYER_POINTS + badge_points, badge)
+        self.rank_df.at[label, "章別"] = badge
+        self.rank_df.at[label, "積分"] = int(self.points(label) + badge_points)
+        if s_class: self.rank_df.at[label, "班級"] = s_class
+        return label
+
+    def adjust_points(self, name, grade, delta):
+        """調整分數，返回 (原分數, 新分數)；找不到學生時返回 None"""
+        label = self.find(name, grade)
+        if label is None:
+            return None
+        old_pts = self.points(label)
+        self.rank_df.at[label, "積分"] = int(old_pts + delta)
+        return old_pts, old_pts + delta
+
+    def apply_event(self, event):
+        """套用一筆積分事件 (章別登記或分數調整)，並把事件 ID 記錄為該學生已結算的事件"""
+        name, grade, s_class = event["姓名"], event["年級"], event_text(event.get("班級"))
+        delta, badge = event["分數變動"], event_text(event.get("章別"))
+        if badge:
+            label = self.award_badge(name, grade, s_class, badge, delta)
+        elif self.find(name, grade) is None:
+            label = self.add_student(name, grade if grade else "-", s_class if s_class else "-", NEW_PLAYER_POINTS + delta)
+        else:
+            label = self.find(name, grade)
+            self.adjust_points(name, grade, delta)
+        if SETTLED_EVENTS not in self.rank_df.columns:
+            self.rank_df[SETTLED_EVENTS] = ""
+        settled = event_text(self.rank_df.at[label, SETTLED_EVENTS])
+        event_id = str(event["事件ID"])
+        self.rank_df.at[label, SETTLED_EVENTS] = f"{settled}{EVENT_SEP}{event_id}" if settled else event_id
+        return label
+
+    def commit(self):
+        """返回供儲存的積分榜副本，並將其登記為目前來源 (避免下次重建索引)"""
+        df_r = self.rank_df.copy()
+        self._rank_source = df_r
+        return df_r
+
+
+# --- 排行榜視圖 ---
+def badge_labels(badges, badge_awards):
+    """章別 -> 「圖示 章別」，無章別時為 "-" (向量化版本的 get_rank_ui)"""
+    badges = badges.map(str)
+    icons = badges.map({name: info["icon"] for name, info in badge_awards.items()}).fillna("")
+    return (icons + " " + badges).where(~badges.isin(["無", "nan"]), "-")
+
+
+def ranked_table(df, columns):
+    table = df[columns].reset_index(drop=True)
+    table.index = np.arange(1, len(table) + 1)
+    return table
+
+
+class Leaderboard:
+    """排行榜視圖：全校榜及按年級、班別的分榜 (均已排序並由 1 開始編號)"""
+
+    COLUMNS = ["年級", "班級", "姓名", "積分", "榮譽勳章"]
+
+    def __init__(self, rank_df, badge_awards):
+        board = rank_df.copy()
+        for col in RANK_COLUMNS:
+            if col not in board.columns:
+                board[col] = 0 if col == "積分" else "-"
+        # 自動合併重複學生（姓名+年級）
+        board["姓名"] = board["姓名"].astype(str).str.strip()
+        board["年級"] = board["年級"].astype(str).str.strip()
+        board = board.drop_duplicates(subset=["年級", "姓名"], keep='first')
+        board["積分"] = pd.to_numeric(board["積分"], errors='coerce').fillna(0).astype(int)
+        board = board.sort_values(by="積分", ascending=False, kind="stable")
+        board["榮譽勳章"] = badge_labels(board["章別"], badge_awards)
+        self.board = board
+        self.table = ranked_table(board, self.COLUMNS)
+        self.by_grade = {g: ranked_table(df, self.COLUMNS) for g, df in board.groupby("年級", sort=True)}
+        self.by_class = {c: ranked_table(df, self.COLUMNS) for c, df in board.groupby(board["班級"].astype(str), sort=True)}
+
+
+# --- 積分流水帳 ---
+LEDGER_COLUMNS = ["事件ID", "時間", "年級", "姓名", "班級", "分數變動", "原因", "章別", "管理員"]
+# 積分榜每位學生已套用的事件 ID (以 EVENT_SEP 連接)；其餘事件會在載入時套用。
+# 以事件 ID 而非事件時間結算，其他程序較遲寫入、時間較早的事件亦會被套用
+SETTLED_EVENTS = "已結算事件"
+EVENT_SEP = ","
+# 舊版以事件時間結算：該學生不晚於此時間的事件視為已結算
+SETTLED_COLUMN = "結算時間"
+# 每累積多少筆事件便把結果寫回積分榜 (壓縮)
+LEDGER_COMPACT_EVERY = 50
+
+
+def new_point_event(name, grade, s_class, delta, reason, badge="", admin="", now=None):
+    """建立一筆積分事件；事件 ID 以時間開頭，按字串排序即為時間先後"""
+    ts = (now or datetime.now()).isoformat(timespec='microseconds')
+    return {
+        "事件ID": f"{ts}_{uuid.uuid4().hex[:8]}",
+        "時間": ts,
+        # 與新增學生時一致，未填年級記為 "-"
+        "年級": str(grade).strip() or "-",
+        "姓名": str(name).strip(),
+        "班級": str(s_class).strip(),
+        "分數變動": int(delta),
+        "原因": reason,
+        "章別": badge,
+        "管理員": admin,
+    }
+
+
+def badge_event(name, grade, s_class, badge, admin="", now=None):
+    """章別登記的積分事件，加分按 BADGE_AWARDS"""
+    return new_point_event(name, grade, s_class, BADGE_AWARDS[badge]["points"], "章別登記", badge, admin, now)
+
+
+def record_event(registry, rank_df, ledger_df, event, stored_df=None):
+    """把剛寫入流水帳的事件套用到積分榜 (只修改該學生，不重新套用流水帳；返回的積分榜為副本)
+
+    ledger_df 為附加事件後的流水帳，stored_df 為已寫回儲存的積分榜 (None 表示尚未儲存)。
+    返回 (新積分榜, 是否壓縮)：stored_df 未結算的事件達 LEDGER_COMPACT_EVERY 筆時，應把積分榜
+    與已儲存的內容比對後寫回；其餘時候只需發布至共用快取。以未結算事件數而非流水帳長度判斷，
+    其他 session 同時附加事件亦不會錯過壓縮。
+    """
+    registry.bind_rankings(rank_df)
+    registry.apply_event(event)
+    stored_df = stored_df if stored_df is not None else pd.DataFrame(columns=RANK_COLUMNS)
+    return registry.commit(), len(pending_events(stored_df, ledger_df)) >= LEDGER_COMPACT_EVERY
+
+
+def event_text(v):
+    """事件欄位的文字 (空值為空字串；由雲端載入的流水帳缺少欄位時為 NaN)"""
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return ""
+    return str(v).strip()
+
+
+def settled_event_ids(rank_df):
+    """積分榜所有學生已套用的事件 ID"""
+    settled = set()
+    if not rank_df.empty and SETTLED_EVENTS in rank_df.columns:
+        for text in rank_df[SETTLED_EVENTS]:
+            text = event_text(text)
+            if text:
+                settled.update(text.split(EVENT_SEP))
+    return settled
+
+
+def pending_events(rank_df, ledger_df):
+    """積分榜尚未套用的事件 (事件 ID 不在已結算事件中)，按事件 ID 排序"""
+    if ledger_df.empty:
+        return ledger_df
+    mask = ~ledger_df["事件ID"].astype(str).isin(settled_event_ids(rank_df))
+    if not rank_df.empty and SETTLED_COLUMN in rank_df.columns:
+        # 舊版結算時間：只用於轉換前已結算的事件
+        legacy = {}
+        keys = zip(text_key(rank_df["年級"]), text_key(rank_df["姓名"]))
+        for key, ts in zip(keys, rank_df[SETTLED_COLUMN]):
+            legacy.setdefault(key, event_text(ts))
+        event_keys = zip(text_key(ledger_df["年級"]), text_key(ledger_df["姓名"]))
+        watermark = pd.Series([legacy.get(k, "") for k in event_keys], index=ledger_df.index)
+        mask &= ledger_df["時間"].astype(str) > watermark
+    return ledger_df[mask].sort_values(by="事件ID")
+
+
+def apply_ledger(rank_df, ledger_df):
+    """把未結算的事件套用到積分榜，返回 (積分榜, 套用事件數)
+
+    重複套用不會重複加分 (已結算的事件會被略過)。
+    """
+    pending = pending_events(rank_df, ledger_df)
+    if pending.empty:
+        return rank_df, 0
+    registry = StudentRegistry().bind_rankings(rank_df)
+    for event in pending.to_dict('records'):
+        registry.apply_event(event)
+    return registry.commit(), len(pending)
+
+
+def settle_rankings(rank_df, ledger_df):
+    """匯入或同步積分榜時，未有結算紀錄的學生視為已套用流水帳中該學生的所有事件"""
+    df_r = rank_df.copy()
+    settled = df_r[SETTLED_EVENTS].map(event_text) if SETTLED_EVENTS in df_r.columns else pd.Series("", index=df_r.index)
+    if SETTLED_COLUMN in df_r.columns:
+        unsettled = (settled == "") & (df_r[SETTLED_COLUMN].map(event_text) == "")
+    else:
+        unsettled = settled == ""
+    if not ledger_df.empty and unsettled.any():
+        ids = ledger_df.groupby([text_key(ledger_df["年級"]), text_key(ledger_df["姓名"])])["事件ID"].agg(
+            lambda s: EVENT_SEP.join(s.astype(str)))
+        keys = pd.MultiIndex.from_arrays([text_key(df_r["年級"]), text_key(df_r["姓名"])])
+        found = pd.Series(ids.reindex(keys).to_numpy(), index=df_r.index).map(event_text)
+        settled = settled.where(~unsettled, found)
+    df_r[SETTLED_EVENTS] = settled
+    return df_r
+
+
+def points_history(ledger_df, name, grade):
+    """單一學生的積分事件及累計變動 (按時間排序)"""
+    if ledger_df.empty:
+        return ledger_df
+    mask = (text_key(ledger_df["姓名"]) == str(name).strip()) & (text_key(ledger_df["年級"]) == str(grade).strip())
+    history = ledger_df[mask].sort_values(by="事件ID")
+    return history.assign(累計變動=pd.to_numeric(history["分數變動"], errors='coerce').fillna(0).cumsum())
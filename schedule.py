@@ -0,0 +1,174 @@
+"""正覺壁球管理系統 - 訓練日程索引
+
+把日程表各班的「具體日期」文字一次解析為已排序的日期，並建立全校按日期排序的訓練節數索引，
+以二分搜尋查詢某日或某段期間 (例如本週) 有訓練的班別。結果只在日程表更新時重建。
+"""
+import re
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 具體日期的分隔符 (半形及全形逗號、頓號)
+DATE_SEP = re.compile(r"[,，、]")
+# 日期標籤後附加的星期等備註，例如「06/10 (日)」
+DATE_NOTE = re.compile(r"[(（][^)）]*[)）]")
+# 有年份的日期格式：先試 ISO，再試 日/月/年 (本地慣用，不會理解為 月/日)
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%Y年%m月%d日", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+# 沒有年份的格式 (日/月)，年份按學年推算
+DAY_MONTH_FORMATS = ("%d/%m", "%d-%m", "%d.%m", "%m月%d日")
+# 學年由九月開始：九月至十二月屬學年的首年，一月至八月屬翌年
+ACADEMIC_YEAR_START = 9
+WEEKDAY_NAMES = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
+CALENDAR_COLUMNS = ["日期", "星期", "班級"]
+
+
+def split_dates(raw):
+    """具體日期文字 -> 日期標籤列表 (保留原有文字，考勤紀錄以此作為日期鍵)"""
+    if raw is None or (not isinstance(raw, str) and pd.isna(raw)):
+        return []
+    return [d.strip() for d in DATE_SEP.split(str(raw)) if d.strip()]
+
+
+def academic_year(date):
+    """date 所屬學年的首年 (例如 2025-03-01 屬 2024/25 學年，返回 2024)"""
+    date = pd.Timestamp(date)
+    return date.year if date.month >= ACADEMIC_YEAR_START else date.year - 1
+
+
+def _clean_label(label):
+    text = DATE_NOTE.sub("", str(label)).strip()
+    # Excel 日期儲存格讀入後為「2024-09-04 00:00:00」，只取日期部分
+    return text.split()[0] if text else ""
+
+
+def _parse_with_year(text):
+    for fmt in DATE_FORMATS:
+        try:
+            return pd.Timestamp(datetime.strptime(text, fmt))
+        except ValueError:
+            continue
+    return pd.NaT
+
+
+def _parse_day_month(text, start_year):
+    for fmt in DAY_MONTH_FORMATS:
+        try:
+            # 以閏年解析，令 29/02 亦可讀取，再按學年換上實際年份
+            parsed = datetime.strptime(f"{text}|2000", f"{fmt}|%Y")
+        except ValueError:
+            continue
+        year = start_year if parsed.month >= ACADEMIC_YEAR_START else start_year + 1
+        try:
+            return pd.Timestamp(year, parsed.month, parsed.day)
+        except ValueError:
+            return pd.NaT
+    return pd.NaT
+
+
+def parse_dates(labels, today=None):
+    """日期標籤 -> {標籤: pd.Timestamp (無法解析時為 NaT)}
+
+    沒有年份的 日/月 標籤 (例如「06/10」) 按學年推算年份：學年取同一批標籤中有年份的日期最常見的學年，
+    全部沒有年份時取 today (預設為今日) 所屬的學年。
+    """
+    labels = list(dict.fromkeys(labels))
+    texts = {label: _clean_label(label) for label in labels}
+    parsed = {label: _parse_with_year(texts[label]) for label in labels}
+    years = Counter(academic_year(ts) for ts in parsed.values() if pd.notna(ts))
+    start_year = years.most_common(1)[0][0] if years else academic_year(pd.Timestamp.now() if today is None else today)
+    for label in labels:
+        if pd.isna(parsed[label]):
+            parsed[label] = _parse_day_month(texts[label], start_year)
+    return parsed
+
+
+class ScheduleIndex:
+    """日程表索引
+
+    - 各班的日期標籤按日期先後排序 (無法解析的日期按文字排在最後)
+    - calendar 為全校所有可解析的訓練節數 (日期、星期、班級及日程表的其他欄位)，按日期排序，
+      以 searchsorted 查詢任何日期範圍
+    同一班別有多列日程時合併所有日期，其他欄位 (上課時間、地點等) 以第一列為準。
+    沒有年份的日期按學年推算 (見 parse_dates)。
+    """
+
+    def __init__(self, schedule_df, today=None):
+        self.classes = []
+        self._labels = {}
+        self._timestamps = {}
+        info = {}
+        if schedule_df is not None and not schedule_df.empty and "班級" in schedule_df.columns:
+            for record in schedule_df.to_dict('records'):
+                s_class = str(record["班級"]).strip()
+                if not s_class or s_class == "nan":
+                    continue
+                if s_class not in self._labels:
+                    self.classes.append(s_class)
+                    self._labels[s_class] = []
+                    info[s_class] = {k: v for k, v in record.items() if k not in ("班級", "具體日期")}
+                self._labels[s_class] += split_dates(record.get("具體日期"))
+
+        # 所有日期標籤只解析一次
+        lookup = parse_dates((label for s_class in self.classes for label in self._labels[s_class]), today)
+
+        rows = []
+        for s_class in self.classes:
+            class_labels = sorted(dict.fromkeys(self._labels[s_class]),
+                                  key=lambda d: (pd.isna(lookup[d]), lookup[d] if pd.notna(lookup[d]) else pd.Timestamp.min, d))
+            self._labels[s_class] = class_labels
+            self._timestamps[s_class] = pd.DatetimeIndex([lookup[d] for d in class_labels]).to_numpy(dtype='datetime64[s]')
+            rows += [{"時間": lookup[d], "日期": d, "班級": s_class, **info[s_class]} for d in class_labels if pd.notna(lookup[d])]
+
+        extra = list(dict.fromkeys(k for s_class in self.classes for k in info[s_class]))
+        calendar = pd.DataFrame(rows, columns=["時間", *CALENDAR_COLUMNS, *extra])
+        calendar["時間"] = pd.to_datetime(calendar["時間"])
+        calendar = calendar.sort_values(by="時間", kind="stable", ignore_index=True)
+        calendar["星期"] = [WEEKDAY_NAMES[ts.weekday()] for ts in calendar["時間"]]
+        self._calendar = calendar
+        self._dates = calendar["時間"].to_numpy(dtype='datetime64[s]')
+
+    # --- 各班日期 ---
+    def dates(self, s_class):
+        """該班的日期標籤 (已排序)"""
+        return self._labels.get(str(s_class).strip(), [])
+
+    def nearest_index(self, s_class, today):
+        """該班最接近 today 的一節在 dates() 中的位置 (距離相同時取已過去的一節)；沒有可解析的日期時返回 0"""
+        stamps = self._timestamps.get(str(s_class).strip())
+        if stamps is None or not len(stamps) or np.isnat(stamps).all():
+            return 0
+        today = np.datetime64(pd.Timestamp(today).normalize(), 's')
+        distance = np.abs(stamps - today).astype('timedelta64[D]').astype(float)
+        distance[np.isnat(stamps)] = np.inf
+        # 以 2 倍距離 + 是否在 today 之後作排序鍵，距離相同時優先選擇已過去的一節
+        return int(np.argmin(distance * 2 + (stamps > today)))
+
+    # --- 全校日曆 ---
+    def sessions_between(self, start, end):
+        """start 至 end (包括首尾兩日) 的所有訓練節數，按日期排序"""
+        lo = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(start).normalize(), 's'), side='left')
+        hi = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(end).normalize(), 's'), side='right')
+        return self._calendar.iloc[lo:hi].drop(columns="時間").reset_index(drop=True)
+
+    def classes_on(self, date):
+        """該日有訓練的班別"""
+        return self.sessions_between(date, date)["班級"].tolist()
+
+    def week_of(self, date):
+        """date 所在一週 (星期一至星期日) 的訓練節數"""
+        monday = pd.Timestamp(date).normalize() - pd.Timedelta(days=pd.Timestamp(date).weekday())
+        return self.sessions_between(monday, monday + pd.Timedelta(days=6))
+
+    def months(self):
+        """有訓練的月份 (YYYY-MM)，按先後排序"""
+        return list(dict.fromkeys(self._calendar["時間"].dt.strftime("%Y-%m")))
+
+    def month(self, month):
+        start = pd.Timestamp(f"{month}-01")
+        return self.sessions_between(start, start + pd.offsets.MonthEnd(0))
+
+    def calendar(self):
+        """全校合併日曆"""
+        return self._calendar.drop(columns="時間")
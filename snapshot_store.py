@@ -0,0 +1,137 @@
+"""正覺壁球管理系統 - 本機集合快照
+
+把每個集合最近一次從後端讀取的內容按欄位保存為 JSON (日期時間等型別附有型別標記，讀取後與後端內容相同)，
+並記錄內容版本 (etag)。程序重新啟動或雲端無法連線時，可先以快照即時顯示數據。
+快照只包含數據，讀取時不會執行任何程式碼。
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+
+# 快照檔案格式；其他格式 (包括舊版的 Parquet 及 pickle 快照) 視為沒有快照，下次由後端重新讀取
+SNAPSHOT_FORMAT = "typed-json"
+META_FILE = "snapshots.json"
+# JSON 沒有的型別以 {TYPE_TAG: 型別, "value": 文字} 保存
+TYPE_TAG = "$type"
+
+
+def snapshot_etag(docs, versions):
+    """集合內容的版本標記：文件 ID、版本及內容任何一項改變時都會不同"""
+    h = hashlib.sha1()
+    for doc_id in sorted(docs):
+        h.update(json.dumps([doc_id, versions.get(doc_id, 0), docs[doc_id]], ensure_ascii=False, sort_keys=True, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+def encode_value(v):
+    """把文件欄位值轉為 JSON 可保存的形式 (int、float、bool、文字及 None 原樣保存)"""
+    if isinstance(v, datetime):
+        return {TYPE_TAG: "datetime", "value": v.isoformat()}
+    if isinstance(v, date):
+        return {TYPE_TAG: "date", "value": v.isoformat()}
+    if isinstance(v, bytes):
+        return {TYPE_TAG: "bytes", "value": base64.b64encode(v).decode('ascii')}
+    if isinstance(v, dict):
+        return {TYPE_TAG: "map", "value": {str(k): encode_value(x) for k, x in v.items()}}
+    if isinstance(v, (list, tuple)):
+        return [encode_value(x) for x in v]
+    return v
+
+
+def decode_value(v):
+    """encode_value 的反向轉換"""
+    if isinstance(v, list):
+        return [decode_value(x) for x in v]
+    if not isinstance(v, dict):
+        return v
+    kind, value = v.get(TYPE_TAG), v.get("value")
+    if kind == "datetime":
+        return datetime.fromisoformat(value)
+    if kind == "date":
+        return date.fromisoformat(value)
+    if kind == "bytes":
+        return base64.b64decode(value)
+    if kind == "map":
+        return {k: decode_value(x) for k, x in value.items()}
+    raise ValueError(f"未知的快照型別：{kind}")
+
+
+class SnapshotStore:
+    """每個集合一個快照檔案，另以 snapshots.json 記錄各集合的 etag、格式及保存時間"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._meta = self._read_meta()
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.directory, META_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _replace(self, path, write):
+        """先寫入暫存檔再原子地取代，中途失敗不會留下損壞的快照"""
+        tmp = f"{path}.tmp"
+        write(tmp)
+        os.replace(tmp, path)
+
+    def meta(self, collection_name):
+        return self._meta.get(collection_name)
+
+    def read(self, collection_name):
+        """返回 (文件, 版本, etag)；沒有快照或快照無法讀取時返回 None"""
+        meta = self.meta(collection_name)
+        if meta is None or meta.get("format") != SNAPSHOT_FORMAT:
+            return None
+        try:
+            with open(os.path.join(self.directory, meta["file"]), encoding='utf-8') as f:
+                payload = json.load(f)
+            ids = payload["ids"]
+            versions = dict(zip(ids, payload["versions"]))
+            missing = {doc_id: set(cols) for doc_id, cols in meta.get("missing", {}).items()}
+            docs = {doc_id: {} for doc_id in ids}
+            for column, values in payload["columns"].items():
+                for doc_id, v in zip(ids, values):
+                    # 快照按欄位保存，去除該文件原本沒有的欄位
+                    if column not in missing.get(doc_id, ()):
+                        docs[doc_id][column] = decode_value(v)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return docs, versions, meta["etag"]
+
+    def write(self, collection_name, docs, versions):
+        """保存集合快照，返回 etag；內容與現有快照相同時不寫入"""
+        etag = snapshot_etag(docs, versions)
+        with self._lock:
+            meta = self.meta(collection_name)
+            if meta is not None and meta["etag"] == etag:
+                return etag
+            ids = list(docs)
+            columns = list(dict.fromkeys(k for data in docs.values() for k in data))
+            payload = {
+                "ids": ids,
+                "versions": [versions.get(doc_id, 0) for doc_id in ids],
+                "columns": {c: [encode_value(docs[doc_id].get(c)) for doc_id in ids] for c in columns},
+            }
+            # 記錄各文件缺少的欄位，讀取時還原為與後端相同的內容
+            missing = {doc_id: [c for c in columns if c not in data] for doc_id, data in docs.items()}
+            path = os.path.join(self.directory, f"{collection_name}.json")
+            self._replace(path, lambda tmp: self._write_json(tmp, payload))
+            self._meta[collection_name] = {
+                "etag": etag, "format": SNAPSHOT_FORMAT, "file": os.path.basename(path), "saved_at": time.time(),
+                "missing": {doc_id: cols for doc_id, cols in missing.items() if cols},
+            }
+            self._replace(os.path.join(self.directory, META_FILE), lambda tmp: self._write_json(tmp, self._meta))
+        return etag
+
+    @staticmethod
+    def _write_json(path, data):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
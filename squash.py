@@ -1,8 +1,25 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime
-import io
+import hashlib
+import logging
+import os
+import uuid
+
+from attendance import ENTRY_COLUMNS, AttendanceBook, migrate_records
+from auth import AdminAuthenticator, AuthUnavailable, LoginThrottle
+from awards import AWARDS_PAGE_SIZE, award_years, filter_awards, page_slice, render_awards_page_html, sort_awards
+from datastore import DataService, FirestoreBackend, Query, SQLiteBackend, SQLitePool
+from excel_io import export_attendance_csv, export_rankings_xlsx, export_school_workbook, import_excel
+from instrumentation import PROCESS_METRICS, Metrics, Span, export_json
+from rankings import (BADGE_AWARDS, LEDGER_COLUMNS, LEDGER_COMPACT_EVERY, Leaderboard, StudentRegistry, apply_ledger,
+                      badge_event, new_point_event, points_history, record_event, settle_rankings, sync_from_roster)
+from schedule import ScheduleIndex
+from snapshot_store import SnapshotStore
+from tenants import DEFAULT_TENANT, TenantPool, read_settings, registered_tenants
+from write_queue import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
 
 # 嘗試匯入 Firebase 套件
 try:
@@ -15,108 +32,464 @@ except ImportError:
 # 頁面配置
 st.set_page_config(page_title="正覺壁球管理系統", layout="wide", initial_sidebar_state="expanded")
 
-# --- 1. Firebase 初始化 ---
+# 沒有 Firebase 時的本機資料庫檔案
+SQLITE_PATH = os.environ.get("SQUASH_SQLITE_PATH", "squash_data.db")
+# 延後寫入日誌 (尚未提交至 Firestore 的修改)
+JOURNAL_PATH = os.environ.get("SQUASH_JOURNAL_PATH", "squash_journal.db")
+# 各集合的本機快照目錄 (重新啟動或離線時先以快照顯示)
+SNAPSHOT_DIR = os.environ.get("SQUASH_SNAPSHOT_DIR", "squash_snapshots")
+# 同一伺服器服務的學校 (以逗號分隔的學校代號)；網址以 ?school=代號 選擇，未指定時為預設學校
+TENANTS = registered_tenants(os.environ.get("SQUASH_TENANTS", ""))
+# 同時保留在記憶體的學校數目上限，及每間學校的數據快取上限 (MB)
+MAX_ACTIVE_TENANTS = int(os.environ.get("SQUASH_MAX_ACTIVE_TENANTS", "20"))
+TENANT_CACHE_MB = float(os.environ.get("SQUASH_TENANT_CACHE_MB", "256"))
+
+# --- 1. 學校選擇及 Firebase 初始化 ---
+def select_tenant():
+    """由網址參數 school 選擇學校；切換學校時清除上一間學校的 session 數據及登入狀態"""
+    tenant = str(st.query_params.get("school", DEFAULT_TENANT)).strip().lower()
+    if tenant not in TENANTS:
+        st.error(f"找不到學校「{tenant}」，請檢查網址。")
+        st.stop()
+    if st.session_state.get('tenant') != tenant:
+        for key in list(st.session_state.keys()):
+            del st.session_state[key]
+        st.session_state.tenant = tenant
+    return tenant
+
+@st.cache_resource
+def get_firestore_client():
+    """所有 session 及學校共用的 Firestore Client (內部維持連線池)，沒有設定時返回 None"""
+    try:
+        get_app()
+    except ValueError:
+        if "firebase_config" not in st.secrets:
+            return None
+        key_dict = dict(st.secrets["firebase_config"])
+        if "private_key" in key_dict:
+            key_dict["private_key"] = key_dict["private_key"].replace("\\n", "\n")
+        initialize_app(credentials.Certificate(key_dict))
+    return firestore.client()
+
 def init_firebase():
-    """初始化 Firebase 並返回 Firestore Client"""
+    """取得共用的 Firestore Client；初始化失敗時不會快取，下次執行時重試"""
     if not HAS_FIREBASE:
         return None
-    
-    if 'firebase_initialized' not in st.session_state:
-        try:
-            try:
-                app = get_app()
-            except ValueError:
-                if "firebase_config" in st.secrets:
-                    key_dict = dict(st.secrets["firebase_config"])
-                    if "private_key" in key_dict:
-                        key_dict["private_key"] = key_dict["private_key"].replace("\\n", "\n")
-                    cred = credentials.Certificate(key_dict)
-                    app = initialize_app(cred)
-                else:
-                    return None
-            
-            st.session_state.db = firestore.client()
-            st.session_state.firebase_initialized = True
-        except Exception as e:
-            st.error(f"Firebase 初始化失敗: {e}")
-            return None
-    return st.session_state.get('db')
+    try:
+        st.session_state.db = get_firestore_client()
+    except Exception as e:
+        st.error(f"Firebase 初始化失敗: {e}")
+        st.session_state.db = None
+    return st.session_state.db
 
+app_id = select_tenant()
 db = init_firebase()
-app_id = "squash-management-v1"
 
 # --- 2. 身份驗證功能 ---
-def get_admin_password():
-    """從 Firebase 讀取管理員密碼，若失敗則返回預設值 8888"""
-    default_pwd = "8888"
-    if st.session_state.get('db') is not None:
-        try:
-            doc_ref = st.session_state.db.collection('artifacts').document(app_id).collection('public').document('data').collection('admin_settings').document('config')
-            doc = doc_ref.get()
-            if doc.exists:
-                return str(doc.to_dict().get('password', default_pwd))
-        except Exception:
-            pass
-    return default_pwd
+def get_tenant_settings():
+    """本校的管理設定 (admin_settings/config，不包括密碼)，由各 session 共用並定期重新讀取；失敗時返回空字典"""
+    pool = get_tenant_pool()
+    if pool is None:
+        return {}
+    try:
+        return pool.settings(app_id)
+    except Exception:
+        return {}
+
+def load_admin_settings(tenant):
+    pool = get_tenant_pool()
+    return read_settings(pool.get(tenant).backend) if pool is not None else {}
+
+@st.cache_resource
+def get_authenticator():
+    """程序內共用的管理員驗證：密碼雜湊按學校快取，只在過期時重新讀取 (見 auth.py)"""
+    return AdminAuthenticator(load_admin_settings, secret=os.environ.get("SQUASH_SESSION_SECRET"))
+
+def admin_login(pwd):
+    """驗證管理員密碼 (每個 session 連續失敗後須等待)，成功時發出 session token"""
+    throttle = st.session_state.setdefault('login_throttle', LoginThrottle())
+    wait = throttle.wait_time()
+    if wait:
+        st.sidebar.error(f"嘗試次數過多，請於 {wait:.0f} 秒後再試")
+        return False
+    authenticator = get_authenticator()
+    try:
+        ok = authenticator.check(app_id, pwd)
+    except AuthUnavailable:
+        st.sidebar.error("暫時無法讀取管理設定，請稍後再試")
+        return False
+    if not ok:
+        throttle.failed()
+        st.sidebar.error("密碼錯誤")
+        return False
+    throttle.succeeded()
+    st.session_state.auth_token = authenticator.issue(app_id, "ADMIN")
+    return True
 
 # --- 3. 數據存取與同步函數 ---
-def load_cloud_data(collection_name, default_data):
-    key = f"cloud_{collection_name}"
-    if st.session_state.get('db') is not None:
+@st.cache_resource
+def get_firestore_pool(_db):
+    """程序內所有 session 共用的各校數據服務 (共用快取 + 差異同步引擎)，共用同一個 Firestore Client
+
+    寫入先記錄在本機日誌，由背景執行緒提交至 Firestore，網絡緩慢時介面不需等待；
+    讀取先以本機快照即時顯示，再在背景與 Firestore 核對。
+    """
+    def create(tenant):
+        service = DataService(FirestoreBackend(_db, tenant), max_bytes=int(TENANT_CACHE_MB * 2 ** 20))
+        service.attach_snapshot_store(SnapshotStore(os.path.join(SNAPSHOT_DIR, tenant)))
+        return service.attach_write_queue(WriteBehindQueue(service.engine, JOURNAL_PATH, namespace=tenant))
+    return TenantPool(create, max_active=MAX_ACTIVE_TENANTS)
+
+@st.cache_resource
+def get_local_pool(path):
+    """沒有 Firebase 時改用本機 SQLite，各校共用同一個連線池，數據仍由所有 session 共用"""
+    connections = SQLitePool(path)
+    return TenantPool(lambda tenant: DataService(SQLiteBackend(path, tenant, pool=connections), max_bytes=int(TENANT_CACHE_MB * 2 ** 20)),
+                      max_active=MAX_ACTIVE_TENANTS)
+
+def get_tenant_pool():
+    if st.session_state.get('db') is None:
         try:
-            coll_path = st.session_state.db.collection('artifacts').document(app_id).collection('public').document('data').collection(collection_name)
-            docs = coll_path.stream()
-            data = [doc.to_dict() for doc in docs]
-            if data:
-                df = pd.DataFrame(data)
-                df.columns = [str(c).strip() for c in df.columns]
-                if collection_name == 'attendance_records':
-                    for col in ["班級", "日期", "出席人數", "出席名單", "記錄人"]:
-                        if col not in df.columns: df[col] = ""
-                st.session_state[key] = df
-                return df
+            return get_local_pool(SQLITE_PATH)
         except Exception:
-            pass
-    
+            # 無法開啟本機資料庫時只保存在本 session
+            return None
+    return get_firestore_pool(st.session_state.db)
+
+def get_sync_service():
+    """本校的數據服務 (首次使用時建立)"""
+    pool = get_tenant_pool()
+    if pool is None:
+        return None
+    try:
+        return pool.get(app_id)
+    except Exception:
+        return None
+
+def session_metrics():
+    """本 session 的效能統計 (程序整體的統計為 PROCESS_METRICS)"""
+    if 'metrics' not in st.session_state:
+        st.session_state.metrics = Metrics()
+    return st.session_state.metrics
+
+def timed(name):
+    """量度一段運算，同時記錄到本 session 及程序整體的統計"""
+    return Span(name, PROCESS_METRICS, session_metrics())
+
+def use_loaded_data(collection_name, df, default_data):
+    """登記已讀取的集合；雲端無數據時沿用本 session 的數據或預設值"""
+    key = f"cloud_{collection_name}"
+    if df is not None:
+        st.session_state[key] = df
+        return df
     if key in st.session_state:
         return st.session_state[key]
-    
     df_default = pd.DataFrame(default_data)
     st.session_state[key] = df_default
     return df_default
 
-def save_cloud_data(collection_name, df):
+def load_cloud_data(collection_name, default_data):
+    df = None
+    service = get_sync_service()
+    if service is not None:
+        try:
+            # 共用快取中的 DataFrame 只作引用，修改前須先 copy()
+            df = service.load(collection_name)
+        except Exception:
+            pass
+    return use_loaded_data(collection_name, df, default_data)
+
+def load_all_cloud_data(specs):
+    """並行讀取多個集合並寫入 session state，記錄各集合耗時
+
+    specs: [(session 鍵, 集合名稱, 預設數據), ...]
+    """
+    frames, errors, timings, cached = {}, {}, {}, set()
+    service = get_sync_service()
+    if service is not None and specs:
+        names = [c for _, c, _ in specs]
+        cached = {name for name in names if service.cache.peek(name) is not None}
+        frames, errors, timings = service.load_many(names)
+    for state_key, collection_name, default_data in specs:
+        st.session_state[state_key] = use_loaded_data(collection_name, frames.get(collection_name), default_data)
+    st.session_state.load_timings = {name: (t, name in errors) for name, t in timings.items()}
+    # 只記錄實際讀取的耗時；共用快取命中不計入 data.load.*
+    for name, t in timings.items():
+        if name not in cached:
+            session_metrics().record(f"data.load.{name}", t)
+
+def query_cloud_data(state_key, where, order_by=None, descending=False, limit=None):
+    """只讀取符合條件的文件 (例如單一班別的考勤)，結果按 (集合, 條件) 共用快取
+
+    離線時由本 session 已載入的數據篩選；查詢失敗 (例如後端缺少所需的索引) 時記錄錯誤，
+    改為讀取整個集合後篩選。沒有結果時返回空的預設表格。
+    """
+    collection_name, default_data = DATA_SPECS[state_key]
+    query = Query(collection_name, where, order_by, descending, limit)
+    df = None
+    service = get_sync_service()
+    if service is not None:
+        try:
+            # 只記錄實際向後端查詢的耗時；共用快取命中不計入 data.query.*
+            targets = () if service.query_cached(query) else (session_metrics(),)
+            with Span(f"data.query.{collection_name}", *targets):
+                df = service.query(query)
+        except Exception:
+            logger.exception("查詢 %s 失敗，改為讀取整個集合後篩選", collection_name)
+            df = query.filter_frame(load_cloud_data(collection_name, default_data))
+    elif f"cloud_{collection_name}" in st.session_state:
+        df = query.filter_frame(st.session_state[f"cloud_{collection_name}"])
+    return df if df is not None and not df.empty else pd.DataFrame(default_data)
+
+def save_cloud_data(collection_name, df, from_stored=False):
     if df is None: return
-    df = df.dropna(how='all')
-    df.columns = [str(c).strip() for c in df.columns]
     key = f"cloud_{collection_name}"
-    st.session_state[key] = df
-    if st.session_state.get('db') is not None:
+    # 本 session 修改前讀取的版本：只提交相對此版本的修改；寫入成功後才更新，失敗的修改下次儲存時重新提交。
+    # from_stored 時與已儲存的內容比對 (例如壓縮由流水帳推算、只曾發布至快取的積分榜)
+    base = None if from_stored else st.session_state.get(key)
+    if base is df:
+        # 頁面原地修改了讀取的 DataFrame，base 已包含修改：改為與同步快照比對
+        base = None
+    # 只在需要時建立新的 DataFrame，不原地修改呼叫者的 DataFrame (可能是共用快取中的同一物件)
+    if df.isna().all(axis=1).any():
+        df = df.dropna(how='all')
+    if any(not isinstance(c, str) or c != c.strip() for c in df.columns):
+        df = df.rename(columns=lambda c: str(c).strip())
+    service = get_sync_service()
+    if service is None:
+        st.session_state[key] = df
+    else:
         try:
-            coll_ref = st.session_state.db.collection('artifacts').document(app_id).collection('public').document('data').collection(collection_name)
-            # 刪除舊數據
-            for doc in coll_ref.stream(): doc.reference.delete()
-            # 寫入新數據
-            for _, row in df.iterrows():
-                if collection_name == 'attendance_records':
-                    doc_id = f"{row.get('班級', 'Unknown')}_{row.get('日期', 'Unknown')}".replace("/", "-")
-                elif collection_name == 'announcements':
-                    doc_id = f"{row.get('日期')}_{row.get('標題', 'NoTitle')}"
-                elif collection_name == 'tournaments':
-                    doc_id = f"tm_{row.get('比賽名稱', 'NoName')}_{row.get('日期', 'NoDate')}"
-                elif collection_name == 'student_awards':
-                    doc_id = f"award_{row.get('學生姓名')}_{row.get('日期')}_{np.random.randint(1000)}"
-                elif '姓名' in row and ('年級' in row or '班級' in row):
-                    # 使用 班級+姓名 作為 ID 以區分不同學生，若沒班級則用姓名
-                    doc_id = f"{row.get('班級', row.get('年級', 'NA'))}_{row.get('姓名')}"
-                else:
-                    doc_id = str(np.random.randint(1000000))
-                
-                clean_row = {k: (v if pd.notna(v) else None) for k, v in row.to_dict().items()}
-                coll_ref.document(doc_id).set(clean_row)
-            st.toast(f"✅ {collection_name} 已同步至雲端")
+            # 只寫入相對 base 有變更的文件 (按版本比對後提交)，成功後才更新共用快取
+            with Span(f"data.save.{collection_name}", session_metrics()) as info:
+                result = service.save(collection_name, df, base)
+                info["docs"] = len(result.inserted) + len(result.updated) + len(result.deleted)
+            # 其他管理員同時修改了部分文件時，result.frame 以雲端內容取代這些文件，其餘變更已寫入
+            df = st.session_state[key] = result.frame
+            if result.conflicts:
+                st.toast(f"⚠️ {collection_name} 有 {len(result.conflicts)} 筆紀錄已被其他管理員修改，已載入最新內容")
+            if result.queued:
+                st.toast(f"✅ {collection_name} 已儲存，正在背景同步至雲端 ({result.summary()})")
+            elif result.changed:
+                st.toast(f"✅ {collection_name} 已同步至雲端 ({result.summary()})")
         except Exception as e:
             st.error(f"同步失敗: {e}")
+    return df
+
+def append_cloud_record(collection_name, state_key, record):
+    """附加單筆紀錄 (只寫入一份文件，不比對整個集合)，返回附加後的 DataFrame"""
+    df = st.session_state[state_key]
+    new_df = pd.concat([df, pd.DataFrame([record])], ignore_index=True) if not df.empty else pd.DataFrame([record])
+    st.session_state[state_key] = new_df
+    service = get_sync_service()
+    if service is None:
+        st.session_state[f"cloud_{collection_name}"] = new_df
+        return new_df
+    try:
+        service.append(collection_name, record, new_df)
+        st.session_state[f"cloud_{collection_name}"] = new_df
+    except Exception as e:
+        st.error(f"同步失敗: {e}")
+    return new_df
+
+def publish_cloud_data(collection_name, state_key, df):
+    """只更新 session 及共用快取，不寫入雲端 (用於可由雲端數據推算的結果)"""
+    st.session_state[state_key] = st.session_state[f"cloud_{collection_name}"] = df
+    service = get_sync_service()
+    if service is not None:
+        service.publish(collection_name, df)
+
+def get_student_registry():
+    """本 session 的學生索引，來源 DataFrame 被替換時才重建"""
+    if 'student_registry' not in st.session_state:
+        st.session_state.student_registry = StudentRegistry()
+    return st.session_state.student_registry
+
+def get_attendance_book():
+    """本 session 的正規化考勤紀錄 (每節每位學生一筆)
+
+    新格式尚無數據時，自動由舊格式 attendance_records (出席名單以逗號連接) 遷移；
+    只有管理員 session 會把遷移結果寫回雲端。
+    """
+    entries = st.session_state.attendance_entries
+    source, book = st.session_state.get('attendance_book', (None, None))
+    if book is not None and entries is source:
+        return book
+    source = entries
+    if entries.empty:
+        ensure_data(['attendance_records'])
+        legacy = st.session_state.attendance_records
+        if not legacy.empty:
+            with timed("compute.attendance_migrate"):
+                entries = migrate_records(legacy, st.session_state.get('class_players_df', pd.DataFrame()))
+            if st.session_state.is_admin:
+                save_cloud_data('attendance_entries', entries)
+                st.session_state.attendance_entries = source = entries
+    with timed("compute.attendance_book"):
+        book = AttendanceBook(entries)
+    st.session_state.attendance_book = (source, book)
+    return book
+
+def get_class_attendance_book(s_class):
+    """單一班別的考勤：學生 session 只按班別查詢該班的紀錄，管理員使用全校的考勤紀錄"""
+    if st.session_state.is_admin:
+        return get_attendance_book()
+    entries = query_cloud_data('attendance_entries', [("班級", "==", s_class)])
+    if entries.empty:
+        # 該班尚無新格式紀錄時，可能仍需由舊格式遷移
+        ensure_data(['attendance_entries'])
+        return get_attendance_book()
+    source, book = st.session_state.get('class_attendance_book', (None, None))
+    if book is None or entries is not source:
+        book = AttendanceBook(entries)
+        st.session_state.class_attendance_book = (entries, book)
+    return book
+
+@st.cache_data(max_entries=8, show_spinner="正在讀取 Excel…")
+def parse_excel_upload(kind, digest, _data):
+    """按檔案內容雜湊快取解析結果，同一檔案在重新執行時不會再次解析"""
+    with timed(f"compute.excel_import.{kind}"):
+        return import_excel(_data, kind)
+
+def excel_import_widget(label, kind, confirm_label):
+    """上載、驗證並預覽 Excel；按下確認後返回驗證後的 DataFrame，否則返回 None"""
+    uploaded = st.file_uploader(label, type=["xlsx"], key=f"upload_{kind}")
+    if not uploaded:
+        return None
+    data = uploaded.getvalue()
+    result = parse_excel_upload(kind, hashlib.sha256(data).hexdigest(), data)
+    for err in result.errors:
+        st.error(err)
+    for warning in result.warnings:
+        st.warning(warning)
+    if not result.ok:
+        return None
+    st.caption(f"預覽：共 {len(result.frame)} 列有效數據 (讀取 {result.rows_read} 列，{result.sheets} 個工作表)")
+    st.dataframe(result.frame.head(20), use_container_width=True)
+    if st.button(confirm_label):
+        return result.frame
+    return None
+
+def data_version(state_key, df=None):
+    """數據版本 (匯出檔案及視圖的快取鍵)，不需雜湊表格內容
+
+    df (預設為 session 中的數據) 正是共用快取中的 DataFrame 時使用集合的版本號；
+    否則 (離線、查詢結果或只屬本 session 的 DataFrame) 為本 session 配發的版本，DataFrame 被替換時才改變。
+    """
+    df = st.session_state[state_key] if df is None else df
+    collection_name = DATA_SPECS[state_key][0]
+    service = get_sync_service()
+    if service is not None and service.cache.peek(collection_name) is df:
+        return (app_id, collection_name, service.cache.version(collection_name))
+    versions = st.session_state.setdefault('local_data_versions', {})
+    source, version = versions.get(state_key, (None, None))
+    if source is not df:
+        version = uuid.uuid4().hex
+        versions[state_key] = (df, version)
+    return (app_id, collection_name, version)
+
+def lazy_download(key, label, version, build, file_name, mime):
+    """匯出檔案只在按下「準備」後產生，其後的重新執行只顯示下載按鈕 (不嵌套在其他按鈕內)
+
+    version() 返回數據版本，只在已準備或按下按鈕時計算；build(version) 產生檔案內容。
+    數據版本改變後須重新準備。
+    """
+    state_key = f"export_{key}"
+    prepared = st.session_state.get(state_key)
+    if prepared is not None and prepared[0] != version():
+        prepared = None
+    if prepared is None:
+        st.session_state.pop(state_key, None)
+        if not st.button(f"📦 準備{label}", key=f"prepare_{key}"):
+            return
+        current = version()
+        prepared = st.session_state[state_key] = (current, build(current))
+    st.download_button(label=f"📥 下載{label}", data=prepared[1], file_name=file_name, mime=mime, key=f"download_{key}")
+
+# 匯出檔案只在需要時產生，並按數據版本跨 session 快取
+@st.cache_data(max_entries=4, show_spinner="正在產生 Excel…")
+def rankings_xlsx(version, _rank_df):
+    with timed("compute.export_rankings"):
+        return export_rankings_xlsx(_rank_df)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def attendance_csv(version, _report_df):
+    with timed("compute.export_attendance_csv"):
+        return export_attendance_csv(_report_df)
+
+@st.cache_data(max_entries=2, show_spinner="正在產生全校報表…")
+def school_workbook(version, _rank_df, _matrices):
+    with timed("compute.export_school_workbook"):
+        return export_school_workbook(_rank_df, _matrices)
+
+# 榮譽榜：篩選結果及每頁 HTML 按數據版本快取
+@st.cache_data(max_entries=64, show_spinner=False)
+def awards_view(version, _awards_df, student, competition, year, exact_student):
+    with timed("compute.awards_filter"):
+        return filter_awards(sort_awards(_awards_df), student, competition, year, exact_student)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def awards_page_html(version, _page_df, highlight_name, page_key):
+    return render_awards_page_html(_page_df, highlight_name)
+
+def derived_view(state_key, kind, builder):
+    """由 session 數據衍生的視圖 (builder 接收 DataFrame)
+
+    線上時按共用快取的集合版本跨 session 共用；否則按本 session 的 DataFrame 快取。
+    """
+    def build(df):
+        with timed(f"compute.{kind}"):
+            return builder(df)
+
+    df = st.session_state[state_key]
+    service = get_sync_service()
+    if service is not None:
+        value = service.cache.derived(DATA_SPECS[state_key][0], kind, df, build)
+        if value is not None:
+            return value
+    source, value = st.session_state.get(f"view_{kind}", (None, None))
+    if source is not df:
+        value = build(df)
+        st.session_state[f"view_{kind}"] = (df, value)
+    return value
+
+def get_schedule_index():
+    """日程表索引 (各班已排序的日期及全校日曆)，只在匯入新日程後重建"""
+    return derived_view('schedule_df', 'schedule_index', ScheduleIndex)
+
+def materialize_rankings():
+    """把積分流水帳中未結算的事件套用到積分榜；兩者均未變更時不作任何計算"""
+    rank_df, ledger_df = st.session_state.rank_df, st.session_state.ledger_df
+    checked = st.session_state.get('rank_materialized', (None, None))
+    if checked[0] is rank_df and checked[1] is ledger_df:
+        return
+    with timed("compute.apply_ledger"):
+        rank_df, n_applied = apply_ledger(rank_df, ledger_df)
+    if n_applied:
+        publish_cloud_data('rankings', 'rank_df', rank_df)
+    st.session_state.rank_materialized = (rank_df, ledger_df)
+
+def record_point_event(event):
+    """登記一筆積分事件：流水帳只寫入一份文件，積分榜只修改該學生 (發布時仍會複製整個積分榜)
+
+    已儲存的積分榜累積 LEDGER_COMPACT_EVERY 筆未結算事件時，把積分榜與已儲存的內容比對後寫回雲端
+    (寫入自上次壓縮以來有變更的學生)。
+    """
+    ledger_df = append_cloud_record('points_ledger', 'ledger_df', event)
+    service = get_sync_service()
+    stored = st.session_state.rank_df
+    if service is not None:
+        try:
+            stored = service.stored('rankings')
+        except Exception:
+            logger.exception("讀取已儲存的積分榜失敗，暫不壓縮")
+    df_r, compact = record_event(get_student_registry(), st.session_state.rank_df, ledger_df, event, stored)
+    if compact:
+        st.session_state.rank_df = df_r
+        save_cloud_data('rankings', df_r, from_stored=True)
+    else:
+        publish_cloud_data('rankings', 'rank_df', df_r)
+    st.session_state.rank_materialized = (df_r, ledger_df)
 
 # --- 4. 初始化 Session State ---
 if 'logged_in' not in st.session_state:
@@ -125,18 +498,15 @@ if 'is_admin' not in st.session_state:
     st.session_state.is_admin = False
 if 'user_id' not in st.session_state:
     st.session_state.user_id = ""
-
-# 香港壁球總會章別獎勵設定
-BADGE_AWARDS = {
-    "白金章": {"points": 400, "icon": "💎"},
-    "金章": {"points": 200, "icon": "🥇"},
-    "銀章": {"points": 100, "icon": "🥈"},
-    "銅章": {"points": 50, "icon": "🥉"},
-    "無": {"points": 0, "icon": ""}
-}
+# 管理員身份以簽署的 token 確認 (只需本機驗證簽署)，過期後須重新登入
+if st.session_state.is_admin and get_authenticator().verify(app_id, st.session_state.get('auth_token')) != "ADMIN":
+    st.session_state.logged_in = False
+    st.session_state.is_admin = False
+    st.session_state.pop('auth_token', None)
+    st.toast("🔒 管理員登入已逾時，請重新登入")
 
 # --- 5. 側邊欄與登入邏輯 ---
-st.sidebar.title("🏸 正覺壁球管理系統")
+st.sidebar.title(f"🏸 {get_tenant_settings().get('school_name', '正覺壁球管理系統')}")
 
 if not st.session_state.logged_in:
     st.sidebar.subheader("🔑 系統登入")
@@ -145,14 +515,11 @@ if not st.session_state.logged_in:
     if login_mode == "管理員":
         pwd = st.sidebar.text_input("管理員密碼", type="password")
         if st.sidebar.button("登入管理系統"):
-            admin_pwd = get_admin_password()
-            if pwd == admin_pwd:
+            if admin_login(pwd):
                 st.session_state.logged_in = True
                 st.session_state.is_admin = True
                 st.session_state.user_id = "ADMIN"
                 st.rerun()
-            else:
-                st.sidebar.error("密碼錯誤")
     else:
         st.sidebar.info("請輸入學生班別及學號 (例如: 1A 01)")
         c1, c2 = st.sidebar.columns(2)
@@ -179,44 +546,113 @@ else:
 if st.sidebar.button("🔌 登出系統"):
     st.session_state.logged_in = False
     st.session_state.is_admin = False
+    st.session_state.pop('auth_token', None)
     st.rerun()
 
-# --- 6. 數據加載 (移除刷新按鈕，改為直接檢查載入) ---
-if 'schedule_df' not in st.session_state:
-    st.session_state.schedule_df = load_cloud_data('schedules', [])
-if 'class_players_df' not in st.session_state:
-    st.session_state.class_players_df = load_cloud_data('class_players', [])
-if 'rank_df' not in st.session_state:
-    st.session_state.rank_df = load_cloud_data('rankings', pd.DataFrame(columns=["年級", "班級", "姓名", "積分", "章別"]))
-if 'attendance_records' not in st.session_state:
-    st.session_state.attendance_records = load_cloud_data('attendance_records', pd.DataFrame(columns=["班級", "日期", "出席人數", "出席名單", "記錄人"]))
-if 'announcements_df' not in st.session_state:
-    st.session_state.announcements_df = load_cloud_data('announcements', pd.DataFrame(columns=["標題", "內容", "日期"]))
-if 'tournaments_df' not in st.session_state:
-    st.session_state.tournaments_df = load_cloud_data('tournaments', pd.DataFrame(columns=["比賽名稱", "日期", "截止日期", "連結", "備註"]))
-if 'awards_df' not in st.session_state:
-    st.session_state.awards_df = load_cloud_data('student_awards', pd.DataFrame(columns=["學生姓名", "比賽名稱", "獎項", "日期", "備註"]))
-
 # 菜單導航
 menu_options = ["📅 訓練日程表", "🏆 隊員排行榜", "📝 考勤點名", "🏅 學生得獎紀錄", "📢 活動公告", "🗓️ 比賽報名與賽程"]
 if st.session_state.is_admin:
-    menu_options.append("💰 學費與預算核算")
+    menu_options += ["📈 出席分析", "💰 學費與預算核算", "🩺 系統診斷"]
 menu = st.sidebar.radio("功能選單", menu_options)
 
+# --- 6. 數據加載 (按頁面需要並行讀取，每次重新執行均從共用快取取得最新引用) ---
+DATA_SPECS = {
+    'schedule_df': ('schedules', []),
+    'class_players_df': ('class_players', []),
+    'rank_df': ('rankings', pd.DataFrame(columns=["年級", "班級", "姓名", "積分", "章別"])),
+    'attendance_entries': ('attendance_entries', pd.DataFrame(columns=ENTRY_COLUMNS)),
+    # 舊格式考勤紀錄，只用於遷移
+    'attendance_records': ('attendance_records', pd.DataFrame(columns=["班級", "日期", "出席人數", "出席名單", "記錄人"])),
+    'announcements_df': ('announcements', pd.DataFrame(columns=["標題", "內容", "日期"])),
+    'tournaments_df': ('tournaments', pd.DataFrame(columns=["比賽名稱", "日期", "截止日期", "連結", "備註"])),
+    'ledger_df': ('points_ledger', pd.DataFrame(columns=LEDGER_COLUMNS)),
+    'awards_df': ('student_awards', pd.DataFrame(columns=["學生姓名", "比賽名稱", "獎項", "日期", "備註"])),
+}
+
+# 各頁面所需的數據 (管理員額外需要的數據另列)
+PAGE_DATA = {
+    "📅 訓練日程表": ['schedule_df'],
+    "🏆 隊員排行榜": ['rank_df', 'ledger_df'],
+    # 學生只按班別查詢考勤，得獎紀錄在頁面內按需要讀取
+    "📝 考勤點名": ['schedule_df', 'class_players_df'],
+    "🏅 學生得獎紀錄": ['class_players_df'],
+    "📢 活動公告": ['announcements_df'],
+    "🗓️ 比賽報名與賽程": ['tournaments_df'],
+    "📈 出席分析": ['attendance_entries', 'class_players_df'],
+    "💰 學費與預算核算": [],
+    "🩺 系統診斷": [],
+}
+ADMIN_PAGE_DATA = {
+    "🏆 隊員排行榜": ['class_players_df'],
+    "📝 考勤點名": ['attendance_entries'],
+    "🏅 學生得獎紀錄": ['awards_df'],
+}
+
+def ensure_data(state_keys):
+    """只讀取指定的數據 (首次讀取時從雲端並行載入，其後來自共用快取)"""
+    load_all_cloud_data([(k, *DATA_SPECS[k]) for k in state_keys])
+
+page_data = PAGE_DATA.get(menu, [])
+if st.session_state.is_admin:
+    page_data = page_data + ADMIN_PAGE_DATA.get(menu, [])
+ensure_data(page_data)
+if 'ledger_df' in page_data:
+    materialize_rankings()
+
+sync_queue = getattr(get_sync_service(), 'write_queue', None)
+if st.session_state.is_admin and sync_queue is not None:
+    sync_status = sync_queue.status()
+    if sync_status["pending"]:
+        retry = f"，{sync_status['retry_in']:.0f} 秒後重試 ({sync_status['last_error']})" if sync_status["failures"] else ""
+        st.sidebar.warning(f"⏳ {sync_status['pending']} 項修改等待同步至雲端{retry}")
+    else:
+        st.sidebar.caption("☁️ 所有修改已同步至雲端")
+    if sync_status["conflicts"]:
+        st.sidebar.caption(f"⚠️ {sync_status['conflicts']} 項修改因其他管理員已更新而改用雲端內容")
+
+if st.session_state.is_admin and st.session_state.load_timings:
+    with st.sidebar.expander("⏱️ 數據載入耗時"):
+        st.table(pd.DataFrame([
+            {"集合": name, "耗時 (ms)": round(t * 1000, 1), "狀態": "❌ 失敗" if failed else "✅"}
+            for name, (t, failed) in st.session_state.load_timings.items()
+        ]))
+
 # --- 7. 頁面模組 ---
+# 量度本次頁面繪製的耗時 (於檔案結尾結束；st.rerun / st.stop 中斷的繪製不計)
+page_span = timed(f"page.{menu}")
+
 
 if menu == "📅 訓練日程表":
     st.title("📅 訓練班日程管理")
     if st.session_state.is_admin:
-        u_sched = st.file_uploader("匯入日程 Excel", type=["xlsx"])
-        if u_sched:
-            df_new = pd.read_excel(u_sched)
-            if st.button("🚀 確認更新日程"):
-                st.session_state.schedule_df = df_new
-                save_cloud_data('schedules', df_new)
-                st.rerun()
+        df_new = excel_import_widget("匯入日程 Excel", 'schedules', "🚀 確認更新日程")
+        if df_new is not None:
+            st.session_state.schedule_df = df_new
+            save_cloud_data('schedules', df_new)
+            st.rerun()
     if not st.session_state.schedule_df.empty:
-        st.dataframe(st.session_state.schedule_df, use_container_width=True)
+        schedule = get_schedule_index()
+        today = datetime.now()
+        today_classes = schedule.classes_on(today)
+        st.info(f"📌 今日有訓練：{'、'.join(today_classes)}" if today_classes else "📌 今日沒有訓練。")
+        sc_tab1, sc_tab2, sc_tab3 = st.tabs(["🗓️ 本週", "📆 合併日曆", "📋 日程表"])
+        with sc_tab1:
+            week = schedule.week_of(today)
+            if week.empty:
+                st.caption("本週沒有訓練。")
+            else:
+                st.dataframe(week, use_container_width=True, hide_index=True)
+        with sc_tab2:
+            months = schedule.months()
+            if months:
+                current = today.strftime("%Y-%m")
+                default = next((i for i, m in enumerate(months) if m >= current), len(months) - 1)
+                sel_month = st.selectbox("月份", months, index=default)
+                st.dataframe(schedule.month(sel_month), use_container_width=True, hide_index=True)
+            else:
+                st.caption("日程表中沒有可辨認的日期。")
+        with sc_tab3:
+            st.dataframe(st.session_state.schedule_df, use_container_width=True)
     else:
         st.info("暫無日程。")
 
@@ -226,43 +662,29 @@ elif menu == "🏆 隊員排行榜":
     
     if st.session_state.is_admin:
         with st.expander("🛠️ 排行榜管理"):
-            tab_upload, tab_badge, tab_manual, tab_export = st.tabs(["📤 批量匯入/同步", "🥇 章別獎勵登記", "✏️ 手動調整分數", "📥 匯出排行榜"])
+            tab_upload, tab_badge, tab_manual, tab_history, tab_export = st.tabs(["📤 批量匯入/同步", "🥇 章別獎勵登記", "✏️ 手動調整分數", "📜 積分紀錄", "📥 匯出排行榜"])
             
             with tab_upload:
                 st.write("您可以從「學生名單」自動同步或手動匯入 Excel。系統會自動排除重複報名的學生。")
                 if st.button("🔄 從壁球班名單同步所有學生", help="將點名系統中的學生自動加入排行榜，並自動過濾重複"):
                     if not st.session_state.class_players_df.empty:
-                        df_r = st.session_state.rank_df
-                        for col in ["年級", "班級", "姓名", "積分", "章別"]:
-                            if col not in df_r.columns: df_r[col] = 0 if col == "積分" else "無"
-                        
-                        count_added = 0
-                        for _, p_row in st.session_state.class_players_df.iterrows():
-                            # 同時比對姓名與年級，防止重複
-                            exists = ((df_r["姓名"].astype(str).str.strip() == str(p_row["姓名"]).strip()) & (df_r["年級"].astype(str).str.strip() == str(p_row.get("年級", "-")).strip())).any()
-                            if not exists:
-                                new_entry = pd.DataFrame([{
-                                    "年級": str(p_row.get("年級", "-")).strip(),
-                                    "班級": str(p_row["班級"]).strip(),
-                                    "姓名": str(p_row["姓名"]).strip(),
-                                    "積分": 100,
-                                    "章別": "無"
-                                }])
-                                df_r = pd.concat([df_r, new_entry], ignore_index=True)
-                                count_added += 1
+                        # 以 (姓名, 年級) 反連接一次找出新學生，避免逐列比對
+                        with timed("compute.ranking_sync"):
+                            df_r, count_added = sync_from_roster(st.session_state.rank_df, st.session_state.class_players_df)
+                        df_r = settle_rankings(df_r, st.session_state.ledger_df)
                         
                         st.session_state.rank_df = df_r
                         save_cloud_data('rankings', df_r)
                         st.success(f"同步完成！新增了 {count_added} 位新學生。")
                         st.rerun()
 
-                u_rank = st.file_uploader("匯入積分榜 Excel (需包含: 年級, 班級, 姓名, 積分)", type=["xlsx"])
-                if u_rank:
-                    df_r = pd.read_excel(u_rank)
-                    if st.button("🚀 確認更新積分排名"):
-                        st.session_state.rank_df = df_r
-                        save_cloud_data('rankings', df_r)
-                        st.rerun()
+                df_r = excel_import_widget("匯入積分榜 Excel (需包含: 年級, 班級, 姓名, 積分)", 'rankings', "🚀 確認更新積分排名")
+                if df_r is not None:
+                    # 匯入的積分視為已結算至最新的積分事件
+                    df_r = settle_rankings(df_r, st.session_state.ledger_df)
+                    st.session_state.rank_df = df_r
+                    save_cloud_data('rankings', df_r)
+                    st.rerun()
             
             with tab_badge:
                 with st.form("badge_award_form"):
@@ -271,34 +693,8 @@ elif menu == "🏆 隊員排行榜":
                     b_class = st.text_input("班別 (如: 4A)").strip()
                     b_type = st.selectbox("所考獲章別", ["白金章", "金章", "銀章", "銅章"])
                     if st.form_submit_button("確認發放獎勵積分"):
-                        df_r = st.session_state.rank_df.copy()
-                        for col in ["年級", "班級", "姓名", "積分", "章別"]:
-                            if col not in df_r.columns: df_r[col] = 0 if col == "積分" else "無"
-                        
-                        # 查找學生 (嚴格對比字串並去除空格)
-                        mask = (df_r["姓名"].astype(str).str.strip() == b_name) & (df_r["年級"].astype(str).str.strip() == b_grade)
-                        if any(mask):
-                            idx = df_r[mask].index[0]
-                            df_r.at[idx, "章別"] = b_type
-                            # 計算積分
-                            current_pts = pd.to_numeric(df_r.at[idx, "積分"], errors='coerce')
-                            if pd.isna(current_pts): current_pts = 0
-                            df_r.at[idx, "積分"] = int(current_pts + BADGE_AWARDS[b_type]["points"])
-                            if b_class: df_r.at[idx, "班級"] = b_class
-                        else:
-                            # 找不到則建立新記錄
-                            new_row = pd.DataFrame([{
-                                "年級": b_grade if b_grade else "-",
-                                "班級": b_class if b_class else "-",
-                                "姓名": b_name, 
-                                "積分": 100 + BADGE_AWARDS[b_type]["points"],
-                                "章別": b_type
-                            }])
-                            df_r = pd.concat([df_r, new_row], ignore_index=True)
-                        
-                        # 更新並同步
-                        st.session_state.rank_df = df_r
-                        save_cloud_data('rankings', df_r)
+                        # 記錄為積分事件；學生不在積分榜時建立新記錄
+                        record_point_event(badge_event(b_name, b_grade, b_class, b_type, st.session_state.user_id))
                         st.success(f"已更新 {b_name} 的章別及積分。")
                         st.rerun()
 
@@ -308,37 +704,42 @@ elif menu == "🏆 隊員排行榜":
                     m_grade = st.text_input("年級").strip()
                     m_points = st.number_input("調整分數 (加分輸入正數，扣分輸入負數)", value=10, step=1)
                     if st.form_submit_button("執行分數調整"):
-                        df_r = st.session_state.rank_df.copy()
-                        for col in ["年級", "班級", "姓名", "積分", "章別"]:
-                            if col not in df_r.columns: df_r[col] = 0 if col == "積分" else "無"
-                        
-                        mask = (df_r["姓名"].astype(str).str.strip() == m_name) & (df_r["年級"].astype(str).str.strip() == m_grade)
-                        if any(mask):
-                            idx = df_r[mask].index[0]
-                            old_pts = pd.to_numeric(df_r.at[idx, "積分"], errors='coerce')
-                            if pd.isna(old_pts): old_pts = 0
-                            df_r.at[idx, "積分"] = int(old_pts + m_points)
-                            st.session_state.rank_df = df_r
-                            save_cloud_data('rankings', df_r)
+                        registry = get_student_registry().bind_rankings(st.session_state.rank_df)
+                        label = registry.find(m_name, m_grade)
+                        if label is not None:
+                            old_pts = registry.points(label)
+                            record_point_event(new_point_event(m_name, m_grade, "", m_points, "手動調整", "", st.session_state.user_id))
                             st.success(f"已調整 {m_name} 的分數 ({old_pts} -> {old_pts + m_points})")
                             st.rerun()
                         else:
                             st.error("找不到該學生，請確認姓名及年級是否正確。")
 
+            with tab_history:
+                ledger_df = st.session_state.ledger_df
+                st.write(f"每次章別登記及分數調整都會記錄為一筆積分事件 (共 {len(ledger_df)} 筆)，每 {LEDGER_COMPACT_EVERY} 筆自動結算至積分榜。")
+                hc1, hc2 = st.columns(2)
+                h_name = hc1.text_input("學生姓名", key="history_name").strip()
+                h_grade = hc2.text_input("年級", key="history_grade").strip()
+                if h_name:
+                    history = points_history(ledger_df, h_name, h_grade)
+                    if history.empty:
+                        st.info("該學生尚無積分事件。")
+                    else:
+                        st.line_chart(history.set_index("時間")["累計變動"])
+                        st.dataframe(history[["時間", "分數變動", "原因", "章別", "管理員", "累計變動"]], use_container_width=True, hide_index=True)
+                elif not ledger_df.empty:
+                    st.dataframe(ledger_df.sort_values(by="事件ID", ascending=False).head(50)[["時間", "年級", "姓名", "分數變動", "原因", "章別", "管理員"]], use_container_width=True, hide_index=True)
+                if st.button("🧮 立即結算積分", help="把所有積分事件的結果寫回積分榜 (只寫入有變更的學生)"):
+                    save_cloud_data('rankings', st.session_state.rank_df)
+                    st.success("已結算積分。")
+
             with tab_export:
                 st.write("將目前的排行榜內容匯出為 Excel 檔案。")
                 if not st.session_state.rank_df.empty:
-                    output = io.BytesIO()
-                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                        export_df = st.session_state.rank_df.copy()
-                        export_df = export_df.drop_duplicates(subset=["年級", "姓名"], keep='first')
-                        export_df["積分"] = pd.to_numeric(export_df["積分"], errors='coerce').fillna(0).astype(int)
-                        export_df = export_df.sort_values(by="積分", ascending=False)
-                        export_df.to_excel(writer, index=False, sheet_name='積分榜')
-                    
-                    st.download_button(
-                        label="📥 下載積分排行榜 (Excel)",
-                        data=output.getvalue(),
+                    lazy_download(
+                        "rankings", "積分排行榜 (Excel)",
+                        lambda: data_version('rank_df'),
+                        lambda version: rankings_xlsx(version, st.session_state.rank_df),
                         file_name=f"squash_ranking_{datetime.now().strftime('%Y%m%d')}.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
@@ -346,53 +747,38 @@ elif menu == "🏆 隊員排行榜":
                     st.info("目前無數據可供匯出。")
     
     if not st.session_state.rank_df.empty:
-        display_rank_df = st.session_state.rank_df.copy()
-        required_cols = ["年級", "班級", "姓名", "積分", "章別"]
-        for col in required_cols:
-            if col not in display_rank_df.columns:
-                display_rank_df[col] = 0 if col == "積分" else "-"
-
-        # 自動合併重複學生（姓名+年級）
-        display_rank_df["姓名"] = display_rank_df["姓名"].astype(str).str.strip()
-        display_rank_df["年級"] = display_rank_df["年級"].astype(str).str.strip()
-        display_rank_df = display_rank_df.drop_duplicates(subset=["年級", "姓名"], keep='first')
-        display_rank_df["積分"] = pd.to_numeric(display_rank_df["積分"], errors='coerce').fillna(0).astype(int)
-        display_rank_df = display_rank_df.sort_values(by="積分", ascending=False)
-        
-        def get_rank_ui(row):
-            badge = str(row.get("章別", "無"))
-            icon_info = BADGE_AWARDS.get(badge, {"icon": ""})
-            return f"{icon_info['icon']} {badge}" if badge != "無" and badge != "nan" else "-"
-
-        display_rank_df["榮譽勳章"] = display_rank_df.apply(get_rank_ui, axis=1)
-        display_rank_df.reset_index(drop=True, inplace=True)
-        display_rank_df.index = np.arange(1, len(display_rank_df) + 1)
-        
-        cols_to_show = ["年級", "班級", "姓名", "積分", "榮譽勳章"]
-        st.table(display_rank_df[cols_to_show])
+        # 排行榜視圖按積分榜版本快取，只在積分榜變更後重新計算
+        board = derived_view('rank_df', 'leaderboard', lambda df: Leaderboard(df, BADGE_AWARDS))
+        view_mode = st.radio("排行榜範圍", ["全校", "按年級", "按班別"], horizontal=True)
+        if view_mode == "按年級" and board.by_grade:
+            sel_grade = st.selectbox("選擇年級", list(board.by_grade))
+            st.table(board.by_grade[sel_grade])
+        elif view_mode == "按班別" and board.by_class:
+            sel_rank_class = st.selectbox("選擇班別", list(board.by_class))
+            st.table(board.by_class[sel_rank_class])
+        else:
+            st.table(board.table)
     else:
         st.info("暫無積分數據。")
 
 elif menu == "📝 考勤點名":
     st.title("📝 考勤點名與報表")
     if st.session_state.is_admin:
-        u_class = st.file_uploader("匯入學生名單 Excel (欄位：班級, 姓名, 年級, 學號[選填])", type=["xlsx"])
-        if u_class:
-            df_c = pd.read_excel(u_class)
-            if st.button("🚀 確認更新名單"):
-                st.session_state.class_players_df = df_c
-                save_cloud_data('class_players', df_c)
-                st.rerun()
+        df_c = excel_import_widget("匯入學生名單 Excel (欄位：班級, 姓名, 年級, 學號[選填])", 'class_players', "🚀 確認更新名單")
+        if df_c is not None:
+            st.session_state.class_players_df = df_c
+            save_cloud_data('class_players', df_c)
+            st.rerun()
 
     if st.session_state.schedule_df.empty:
         st.warning("請先在『訓練日程表』匯入班級數據。")
     else:
-        class_list = st.session_state.schedule_df["班級"].unique().tolist()
-        sel_class = st.selectbox("請選擇班別", class_list)
-        
-        class_info = st.session_state.schedule_df[st.session_state.schedule_df["班級"] == sel_class]
-        raw_dates = str(class_info.iloc[0].get("具體日期", ""))
-        all_dates = [d.strip() for d in raw_dates.split(",") if d.strip()]
+        schedule = get_schedule_index()
+        class_list = schedule.classes
+        today_classes = schedule.classes_on(datetime.now())
+        # 預設選擇今日有訓練的第一個班別
+        sel_class = st.selectbox("請選擇班別", class_list, index=class_list.index(today_classes[0]) if today_classes else 0)
+        all_dates = schedule.dates(sel_class)
         
         if st.session_state.is_admin:
             tabs = st.tabs(["🎯 今日點名", "📊 考勤總表"])
@@ -405,17 +791,18 @@ elif menu == "📝 考勤點名":
         with tab1:
             if not st.session_state.is_admin:
                 st.markdown("### 🎯 今日點名紀錄")
-            sel_date = st.selectbox("選擇日期", all_dates)
+            # 預設為最接近今日的一節
+            sel_date = st.selectbox("選擇日期", all_dates, index=schedule.nearest_index(sel_class, datetime.now()))
             current_players = st.session_state.class_players_df[st.session_state.class_players_df["班級"] == sel_class] if not st.session_state.class_players_df.empty else pd.DataFrame()
             
             if not current_players.empty:
-                attendance_recs = st.session_state.attendance_records
-                existing_rec = attendance_recs[(attendance_recs["班級"] == sel_class) & (attendance_recs["日期"] == sel_date)]
-                existing_list = existing_rec.iloc[0]["出席名單"].split(", ") if not existing_rec.empty and pd.notna(existing_rec.iloc[0]["出席名單"]) else []
+                book = get_class_attendance_book(sel_class)
+                existing_list = book.present(sel_class, sel_date)
+                recorder = book.recorder(sel_class, sel_date)
 
                 st.markdown(f"#### 📋 {sel_class} - {sel_date}")
-                if not existing_rec.empty:
-                    st.caption(f"上次更新由: {existing_rec.iloc[0].get('記錄人', '系統')}")
+                if recorder is not None:
+                    st.caption(f"上次更新由: {recorder or '系統'}")
 
                 cols = st.columns(4)
                 attendance_dict = {}
@@ -432,17 +819,11 @@ elif menu == "📝 考勤點名":
                 if st.session_state.is_admin:
                     if st.button("💾 儲存點名", type="primary"):
                         present_names = [n for n, p in attendance_dict.items() if p]
-                        new_rec = {
-                            "班級": sel_class, 
-                            "日期": sel_date, 
-                            "出席人數": len(present_names), 
-                            "出席名單": ", ".join(present_names),
-                            "記錄人": st.session_state.user_id
-                        }
-                        df_recs = st.session_state.attendance_records
-                        df_recs = df_recs[~((df_recs["班級"] == sel_class) & (df_recs["日期"] == sel_date))]
-                        st.session_state.attendance_records = pd.concat([df_recs, pd.DataFrame([new_rec])], ignore_index=True)
-                        save_cloud_data('attendance_records', st.session_state.attendance_records)
+                        # 只替換該班該日的每位學生紀錄，同步時只寫入有變更的文件
+                        entries = book.record_session(sel_class, sel_date, present_names, list(attendance_dict), st.session_state.user_id)
+                        st.session_state.attendance_entries = entries
+                        st.session_state.attendance_book = (entries, book)
+                        save_cloud_data('attendance_entries', entries)
                         st.success("✅ 儲存成功")
                 else:
                     st.info("ℹ️ 您目前的權限僅能查看點名紀錄，無法進行修改。")
@@ -452,40 +833,49 @@ elif menu == "📝 考勤點名":
         if tab2 is not None:
             with tab2:
                 st.markdown(f"### 📊 {sel_class} 考勤總表")
-                class_records = st.session_state.attendance_records[st.session_state.attendance_records["班級"] == sel_class]
-                class_players = st.session_state.class_players_df[st.session_state.class_players_df["班級"] == sel_class]
+                book = get_attendance_book()
+                class_players = st.session_state.class_players_df[st.session_state.class_players_df["班級"] == sel_class] if not st.session_state.class_players_df.empty else pd.DataFrame()
                 
                 if class_players.empty:
                     st.info("尚無學生名單數據。")
-                elif class_records.empty:
+                elif not book.class_sessions(sel_class).sessions:
                     st.info("尚無考勤紀錄。")
                 else:
-                    report_dates = all_dates
-                    student_names = class_players["姓名"].unique().tolist()
-                    
-                    matrix_data = []
-                    for name in student_names:
-                        row_data = {"學生姓名": name}
-                        for date in report_dates:
-                            daily_rec = class_records[class_records["日期"] == date]
-                            if not daily_rec.empty:
-                                present_list = str(daily_rec.iloc[0]["出席名單"]).split(", ")
-                                row_data[date] = "✅" if name in present_list else "✘"
-                            else:
-                                row_data[date] = "-" 
-                        matrix_data.append(row_data)
-                    
-                    report_df = pd.DataFrame(matrix_data)
+                    # 由每節的出席 bitset 直接組合 學生×日期 矩陣
+                    with timed("compute.attendance_matrix"):
+                        report_df = book.matrix(sel_class, class_players["姓名"].map(str).unique().tolist(), all_dates)
                     st.dataframe(report_df.set_index("學生姓名"), use_container_width=True)
                     
-                    csv = report_df.to_csv(index=False).encode('utf-8-sig')
-                    st.download_button(
-                        label="📥 下載考勤報表 (CSV)",
-                        data=csv,
+                    lazy_download(
+                        "attendance_csv", "考勤報表 (CSV)",
+                        lambda: (data_version('attendance_entries'), data_version('class_players_df'), sel_class, tuple(all_dates)),
+                        lambda version: attendance_csv(version, report_df),
                         file_name=f"{sel_class}_attendance_report.csv",
                         mime="text/csv",
                     )
 
+                st.divider()
+
+                def school_version():
+                    ensure_data(['rank_df', 'ledger_df'])
+                    materialize_rankings()
+                    return tuple(data_version(k) for k in ('rank_df', 'attendance_entries', 'class_players_df', 'schedule_df'))
+
+                def build_school_workbook(version):
+                    matrices = {}
+                    players = st.session_state.class_players_df
+                    for s_class in class_list:
+                        class_players = players[players["班級"] == s_class] if not players.empty else pd.DataFrame()
+                        if not class_players.empty:
+                            matrices[s_class] = book.matrix(s_class, class_players["姓名"].map(str).unique().tolist(), schedule.dates(s_class))
+                    return school_workbook(version, st.session_state.rank_df, matrices)
+
+                lazy_download(
+                    "school_workbook", "全校考勤及積分榜 (Excel)", school_version, build_school_workbook,
+                    file_name=f"squash_school_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+
 elif menu == "🏅 學生得獎紀錄":
     st.title("🏅 學生比賽榮譽榜")
     
@@ -509,38 +899,46 @@ elif menu == "🏅 學生得獎紀錄":
                     save_cloud_data('student_awards', st.session_state.awards_df)
                     st.rerun()
 
-    if not st.session_state.awards_df.empty:
-        student_real_name = ""
-        if not st.session_state.is_admin and not st.session_state.class_players_df.empty:
-            df_cp = st.session_state.class_players_df
-            if "班級" in df_cp.columns and "學號" in df_cp.columns:
-                match = df_cp[(df_cp["班級"].astype(str).str.upper() + df_cp["學號"].astype(str).str.zfill(2)) == st.session_state.user_id]
-                if not match.empty:
-                    student_real_name = str(match.iloc[0]["姓名"])
-            
+    student_real_name = ""
+    if not st.session_state.is_admin and not st.session_state.class_players_df.empty:
+        registry = get_student_registry().bind_players(st.session_state.class_players_df)
+        student_real_name = registry.resolve_user(st.session_state.user_id)
+    only_mine = bool(student_real_name) and st.toggle("⭐ 只看我的獎項", value=False)
+    if only_mine:
+        # 學生快速路徑：只按學生姓名查詢本人的紀錄，不讀取整個得獎紀錄集合。
+        # 只用等式條件 (Firestore 不需複合索引)，由 awards_view 在本機按日期排序
+        awards_df = query_cloud_data('awards_df', [("學生姓名", "==", student_real_name)])
+    else:
+        ensure_data(['awards_df'])
+        awards_df = st.session_state.awards_df
+
+    if not awards_df.empty:
         st.markdown("### 🏆 榮譽榜單")
-        
-        for index, row in st.session_state.awards_df.sort_values(by="日期", ascending=False).iterrows():
-            is_own_award = (str(row["學生姓名"]).strip() == str(student_real_name).strip() and student_real_name != "")
-            bg_color = "#e8f0fe" if is_own_award else "#ffffff"
-            border = "2px solid #1a73e8" if is_own_award else "1px solid #e0e0e0"
-            text_color = "#202124"
-            
-            st.markdown(f"""
-            <div style="background-color: {bg_color}; padding: 18px; border-radius: 12px; border: {border}; margin-bottom: 12px; box-shadow: 0 2px 4px rgba(0,0,0,0.05);">
-                <h3 style="margin:0; color: #1a73e8; font-size: 1.4em;">🏆 {row['獎項']}</h3>
-                <div style="color: {text_color}; margin-top: 10px;">
-                    <p style="margin:4px 0;"><b>比賽名稱：</b>{row['比賽名稱']}</p>
-                    <p style="margin:4px 0;"><b>獲獎學生：</b>{row['學生姓名']} { ' <span style="color:#d93025; font-weight:bold;">(⭐ 恭喜您！)</span>' if is_own_award else ''}</p>
-                    <p style="margin:4px 0; font-size: 0.9em; color: #5f6368;">📅 獲獎日期：{row['日期']}</p>
-                    { f'<p style="margin:8px 0 0 0; font-style: italic; border-top: 1px dashed #ccc; padding-top: 8px;">{row["備註"]}</p>' if row["備註"] else '' }
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-            
+
+        if only_mine:
+            f_student, f_comp, f_year = student_real_name, "", ""
+        else:
+            fc1, fc2, fc3 = st.columns([2, 2, 1])
+            f_student = fc1.text_input("🔍 學生姓名", key="award_filter_student")
+            f_comp = fc2.text_input("🔍 比賽名稱", key="award_filter_comp")
+            f_year = fc3.selectbox("年份", [""] + award_years(awards_df), format_func=lambda y: y or "全部", key="award_filter_year")
+
+        version = data_version('awards_df', awards_df)
+        filtered = awards_view(version, awards_df, f_student, f_comp, f_year, only_mine)
+        if filtered.empty:
+            st.info("沒有符合條件的得獎紀錄。")
+        else:
+            n_pages = -(-len(filtered) // AWARDS_PAGE_SIZE)
+            page = st.number_input(f"頁數 (共 {n_pages} 頁，{len(filtered)} 項紀錄)", min_value=1, max_value=n_pages, value=1, step=1) if n_pages > 1 else 1
+            page_df, _ = page_slice(filtered, page)
+            st.markdown(awards_page_html(version, page_df, student_real_name, (f_student, f_comp, f_year, only_mine, page)), unsafe_allow_html=True)
+
             if st.session_state.is_admin:
-                if st.button(f"🗑️ 刪除此項紀錄", key=f"del_award_{index}"):
-                    st.session_state.awards_df = st.session_state.awards_df.drop(index)
+                labels = {idx: f"{row['日期']}｜{row['學生姓名']}｜{row['比賽名稱']}｜{row['獎項']}" for idx, row in page_df.iterrows()}
+                dc1, dc2 = st.columns([4, 1])
+                del_idx = dc1.selectbox("選擇要刪除的紀錄 (本頁)", list(labels), format_func=labels.get, key="del_award_select")
+                if dc2.button("🗑️ 刪除此項紀錄"):
+                    st.session_state.awards_df = st.session_state.awards_df.drop(del_idx)
                     save_cloud_data('student_awards', st.session_state.awards_df)
                     st.rerun()
     else:
@@ -588,6 +986,41 @@ elif menu == "🗓️ 比賽報名與賽程":
                     st.rerun()
     st.dataframe(st.session_state.tournaments_df, use_container_width=True)
 
+elif menu == "📈 出席分析":
+    st.title("📈 出席分析")
+    # 統計數據在載入及每次儲存點名時增量更新；學生統計在本 session 的考勤紀錄改變後才重新計算
+    book = get_attendance_book()
+    class_summary = book.class_summary()
+    if class_summary.empty:
+        st.info("尚無考勤紀錄。")
+    else:
+        st.subheader("🏫 各班概覽")
+        st.dataframe(
+            class_summary.style.format({"平均出席人數": "{:.1f}", "平均出席率": "{:.0%}"}),
+            use_container_width=True, hide_index=True
+        )
+
+        st.subheader("⚠️ 出席率偏低學生")
+        threshold = st.slider("出席率低於", 0, 100, 70, step=5, format="%d%%")
+        student_summary = book.student_summary()
+        low = student_summary[student_summary["出席率"] < threshold / 100].sort_values(by="出席率")
+        if low.empty:
+            st.success("沒有出席率低於此標準的學生。")
+        else:
+            st.dataframe(low.style.format({"出席率": "{:.0%}"}), use_container_width=True, hide_index=True)
+
+        st.subheader("👥 班別明細")
+        a_class = st.selectbox("選擇班別", class_summary["班級"].tolist())
+        sessions = book.class_sessions(a_class)
+        detail = sessions.student_summary().sort_values(by=["出席率", "連續出席"], ascending=False)
+        st.dataframe(detail.style.format({"出席率": "{:.0%}"}), use_container_width=True, hide_index=True)
+
+        session_dates = sessions.ordered_dates()
+        if session_dates:
+            a_date = st.selectbox("查看缺席名單", session_dates[::-1])
+            absent = sessions.absentees(a_date)
+            st.write(f"缺席 {len(absent)} 人：" + ("、".join(absent) if absent else "全員出席 🎉"))
+
 elif menu == "💰 學費與預算核算":
     st.title("💰 預算與營運核算 (康文署標準)")
     st.info("收入：該期學生總人數 × 學費。支出：學校按開班數支付給康文署的費用。")
@@ -634,3 +1067,43 @@ elif menu == "💰 學費與預算核算":
     }
     st.table(pd.DataFrame(summary_data))
     st.success(f"💡 結算：本期預計營運利潤為 HK$ {profit:,}")
+
+elif menu == "🩺 系統診斷":
+    st.title("🩺 系統診斷")
+    st.caption("各項目的耗時統計：data.* 為數據讀寫、page.* 為頁面繪製、compute.* 為數據運算。")
+
+    scope = st.radio("統計範圍", ["本 session", "整個程序"], horizontal=True)
+    metrics = session_metrics() if scope == "本 session" else PROCESS_METRICS
+    summary = metrics.summary()
+    if summary.empty:
+        st.info("尚未有量度數據。")
+    else:
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+        sel_span = st.selectbox("查看耗時分佈", summary["項目"].tolist())
+        buckets = metrics.to_dict()["spans"][sel_span]["buckets"]
+        st.bar_chart(pd.Series(buckets, name="次數"))
+
+    service = get_sync_service()
+    if service is not None:
+        st.subheader("🗄️ 數據服務")
+        st.caption(f"學校代號 {app_id}；快取約 {service.cache.memory() / 2 ** 20:.1f} / {TENANT_CACHE_MB:.0f} MB，"
+                   f"已因記憶體上限移除 {service.cache.evictions} 次")
+        st.table(pd.DataFrame([
+            {"集合": collection, "快取版本": service.cache.version(collection), "已載入": service.cache.peek(collection) is not None}
+            for collection, _ in DATA_SPECS.values()
+        ]))
+        if service.write_queue is not None:
+            st.json(service.write_queue.status())
+
+    dc1, dc2 = st.columns(2)
+    dc1.download_button(
+        label="📥 匯出統計 (JSON)",
+        data=export_json(process=PROCESS_METRICS, session=session_metrics()),
+        file_name=f"squash_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+        mime="application/json",
+    )
+    if dc2.button("🔄 重設本 session 統計"):
+        session_metrics().reset()
+        st.rerun()
+
+page_span.finish()
@@ -0,0 +1,137 @@
+"""正覺壁球管理系統 - 多校 (租戶) 支援
+
+每間學校為一個租戶，以 app_id 區分數據路徑 (artifacts/{app_id}/public/data/...)。
+TenantPool 只為正在使用的租戶建立數據服務，並移除最久未使用或閒置過久的租戶，
+因此記憶體及啟動成本按活躍租戶數目增長，而不是已登記的學校數目。
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from datastore import DEFAULT_CACHE_TTL, split_version
+
+# 原有的單校部署使用的 app_id，作為預設租戶
+DEFAULT_TENANT = "squash-management-v1"
+# 同時保留在記憶體的租戶上限
+DEFAULT_MAX_ACTIVE = 20
+# 閒置超過此時間 (秒) 的租戶會被移出記憶體
+DEFAULT_IDLE_TIMEOUT = 1800
+# 各租戶的管理設定文件 (admin_settings/config)
+SETTINGS_COLLECTION = "admin_settings"
+SETTINGS_DOCUMENT = "config"
+# 不會由 TenantPool.settings 返回的欄位 (密碼只由 auth.py 讀取)
+SECRET_FIELDS = ("password", "password_hash")
+
+TENANT_PATTERN = re.compile(r"^[a-z0-9][a-z0-9-]{1,62}$")
+
+
+def validate_tenant(app_id):
+    """租戶 ID 只可包含小寫英文字母、數字及連字號 (用作 Firestore 路徑及檔案名稱)"""
+    app_id = str(app_id).strip()
+    if not TENANT_PATTERN.match(app_id):
+        raise ValueError(f"學校代號「{app_id}」無效：只可使用小寫英文字母、數字及連字號")
+    return app_id
+
+
+def registered_tenants(text):
+    """由以逗號分隔的設定 (例如 SQUASH_TENANTS 環境變數) 取得已登記的租戶，預設租戶必定包括在內"""
+    tenants = [validate_tenant(t) for t in str(text or "").split(",") if t.strip()]
+    return frozenset([DEFAULT_TENANT, *tenants])
+
+
+def read_settings(backend):
+    """從後端讀取管理設定文件 (不經快取)，沒有設定時返回空字典"""
+    docs = backend.list_documents(SETTINGS_COLLECTION)
+    return split_version(docs[SETTINGS_DOCUMENT])[0] if SETTINGS_DOCUMENT in docs else {}
+
+
+class TenantPool:
+    """按需建立及保留各租戶的數據服務 (最近使用的排在最後)
+
+    factory(app_id) 返回新的 DataService。超出 max_active 或閒置超過 idle_timeout 的租戶會在背景執行緒關閉
+    (見 DataService.close，包括提交延後寫入佇列的剩餘修改)，不會阻塞觸發移除的請求；
+    同一租戶在舊服務關閉完成前不會建立新服務，因此每個租戶最多只有一個佇列提交同一日誌。
+    各租戶的管理設定按 settings_ttl 快取。
+    """
+
+    def __init__(self, factory, max_active=DEFAULT_MAX_ACTIVE, idle_timeout=DEFAULT_IDLE_TIMEOUT, settings_ttl=DEFAULT_CACHE_TTL):
+        self.factory = factory
+        self.max_active = max_active
+        self.idle_timeout = idle_timeout
+        self.settings_ttl = settings_ttl
+        self._services = OrderedDict()
+        self._last_used = {}
+        self._settings = {}
+        # 正在背景關閉的租戶 {app_id: 執行緒}
+        self._closing = {}
+        self._lock = threading.Lock()
+
+    def get(self, app_id):
+        """返回租戶的數據服務，尚未建立時以 factory 建立"""
+        while True:
+            with self._lock:
+                closing = self._closing.get(app_id)
+                if closing is None or not closing.is_alive():
+                    self._closing.pop(app_id, None)
+                    now = time.monotonic()
+                    service = self._services.get(app_id)
+                    if service is None:
+                        service = self._services[app_id] = self.factory(app_id)
+                    self._services.move_to_end(app_id)
+                    self._last_used[app_id] = now
+                    for evicted_id, evicted in self._select_evictions(now, keep=app_id):
+                        self._close_later(evicted_id, evicted)
+                    return service
+            # 該租戶剛被移除，舊服務仍在提交剩餘修改：等待完成後才建立新服務
+            closing.join()
+
+    def _select_evictions(self, now, keep):
+        evicted = []
+        for app_id in list(self._services):
+            over_limit = len(self._services) > self.max_active
+            idle = now - self._last_used[app_id] > self.idle_timeout
+            if app_id == keep or not (over_limit or idle):
+                continue
+            evicted.append((app_id, self._services.pop(app_id)))
+            self._last_used.pop(app_id, None)
+            self._settings.pop(app_id, None)
+        return evicted
+
+    def _close_later(self, app_id, service):
+        thread = threading.Thread(target=service.close, name=f"tenant-close-{app_id}", daemon=True)
+        self._closing[app_id] = thread
+        thread.start()
+
+    def settings(self, app_id):
+        """租戶的管理設定 (例如學校名稱，不包括密碼)；沒有設定時返回空字典"""
+        with self._lock:
+            hit = self._settings.get(app_id)
+        if hit is not None and time.monotonic() - hit[1] < self.settings_ttl:
+            return hit[0]
+        settings = {k: v for k, v in read_settings(self.get(app_id).backend).items() if k not in SECRET_FIELDS}
+        with self._lock:
+            if app_id in self._services:
+                self._settings[app_id] = (settings, time.monotonic())
+        return settings
+
+    def active(self):
+        """活躍租戶的狀態：閒置時間及快取記憶體"""
+        now = time.monotonic()
+        with self._lock:
+            items = [(app_id, service, now - self._last_used[app_id]) for app_id, service in self._services.items()]
+        return [{"租戶": app_id, "閒置 (秒)": round(idle, 1), "快取記憶體 (MB)": round(service.cache.memory() / 2 ** 20, 2)}
+                for app_id, service, idle in items]
+
+    def close(self):
+        with self._lock:
+            services = list(self._services.values())
+            closing = list(self._closing.values())
+            self._services.clear()
+            self._last_used.clear()
+            self._settings.clear()
+            self._closing.clear()
+        for service in services:
+            service.close()
+        for thread in closing:
+            thread.join()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 各模組位於專案根目錄 (沒有安裝成套件)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,79 @@
+import pandas as pd
+
+from attendance import ENTRY_COLUMNS, AttendanceBook, migrate_records
+
+
+def entries(rows):
+    return pd.DataFrame([dict(zip(ENTRY_COLUMNS, row)) for row in rows], columns=ENTRY_COLUMNS)
+
+
+def make_book():
+    return AttendanceBook(entries([
+        ("A班", "13/10", "小明", True, "T"), ("A班", "13/10", "小美", False, "T"),
+        ("A班", "06/10", "小明", False, "T"), ("A班", "06/10", "小美", True, "T"),
+    ]))
+
+
+def test_student_summary_streaks_follow_date_order():
+    summary = make_book().class_sessions("A班").student_summary().set_index("學生姓名")
+    assert summary.at["小明", "出席次數"] == 1 and summary.at["小明", "連續出席"] == 1
+    assert summary.at["小美", "連續出席"] == 0
+    assert summary.at["小美", "出席率"] == 0.5
+
+
+def test_summary_is_cached_until_a_session_is_recorded():
+    book = make_book()
+    sessions = book.class_sessions("A班")
+    first = book.student_summary()
+    assert book.student_summary() is first
+    assert sessions.student_summary() is sessions.student_summary()
+    assert sessions.ordered_dates() == ["06/10", "13/10"]
+
+    book.record_session("A班", "20/10", ["小明", "小強"], ["小明", "小美"], "T")
+    summary = book.student_summary()
+    assert summary is not first
+    rows = summary.set_index("學生姓名")
+    assert rows.at["小明", "連續出席"] == 2 and rows.at["小強", "出席次數"] == 1
+    assert sessions.ordered_dates() == ["06/10", "13/10", "20/10"]
+    assert book.class_summary().at[0, "點名節數"] == 3
+
+
+def legacy_records():
+    return pd.DataFrame([
+        {"班級": "A班", "日期": "04/09", "出席人數": 2, "出席名單": "小明, 小美", "記錄人": "T1"},
+        # 同一節的重複紀錄：舊版只顯示第一筆
+        {"班級": "A班", "日期": "04/09", "出席人數": 1, "出席名單": "小明", "記錄人": "T2"},
+        # 舊版把以頓號分隔的日期當作一個標籤；其中 04/09 已有單獨的紀錄
+        {"班級": "A班", "日期": "04/09、11/09", "出席人數": 1, "出席名單": "小美", "記錄人": "T3"},
+        {"班級": "A班", "日期": "18/09", "出席人數": 0, "出席名單": None, "記錄人": "T1"},
+        {"班級": "B班", "日期": "04/09", "出席人數": 2, "出席名單": "小強, 插班生", "記錄人": "T1"},
+    ])
+
+
+def test_migrate_legacy_records():
+    players = pd.DataFrame({"班級": ["A班", "A班", "B班", "B班"], "姓名": ["小明", "小美", "小強", "小強"]})
+    migrated = migrate_records(legacy_records(), players)
+    assert list(migrated.columns) == ENTRY_COLUMNS
+    assert sorted(set(zip(migrated["班級"], migrated["日期"]))) == [("A班", "04/09"), ("A班", "11/09"), ("A班", "18/09"), ("B班", "04/09")]
+
+    book = AttendanceBook(migrated)
+    assert book.present("A班", "04/09") == ["小明", "小美"] and book.recorder("A班", "04/09") == "T1"
+    assert book.present("A班", "11/09") == ["小美"] and book.recorder("A班", "11/09") == "T3"
+    # 沒有出席者的一節仍保留全班的缺席紀錄
+    assert book.present("A班", "18/09") == [] and book.class_sessions("A班").absentees("18/09") == ["小明", "小美"]
+    # 名單以外的出席者保留，重複的名單學生只有一筆
+    b_class = migrated[migrated["班級"] == "B班"]
+    assert list(b_class["學生姓名"]) == ["小強", "插班生"] and b_class["出席"].all()
+
+
+def test_migrated_matrix_matches_legacy_display():
+    players = pd.DataFrame({"班級": ["A班", "A班"], "姓名": ["小明", "小美"]})
+    records = legacy_records()[lambda df: df["日期"] != "04/09、11/09"]
+    book = AttendanceBook(migrate_records(records, players))
+    report = book.matrix("A班", ["小明", "小美"], ["04/09", "18/09", "25/09"]).set_index("學生姓名")
+    assert report.loc["小明"].tolist() == ["✅", "✘", "-"]
+    assert report.loc["小美"].tolist() == ["✅", "✘", "-"]
+
+
+def test_migrate_empty_records():
+    assert migrate_records(pd.DataFrame(columns=["班級", "日期", "出席名單"]), pd.DataFrame()).empty
@@ -0,0 +1,108 @@
+import pytest
+
+import auth
+from auth import (FAILURE_WINDOW, LOCKOUT_BASE, MAX_FAILURES, AdminAuthenticator, AuthUnavailable, LoginThrottle,
+                  credential_from_settings, hash_password, verify_password)
+
+
+@pytest.fixture(autouse=True)
+def fast_hashes(monkeypatch):
+    # 測試時降低雜湊成本
+    monkeypatch.setattr(auth, "SCRYPT_N", 2 ** 4)
+    monkeypatch.setattr(auth, "PBKDF2_ITERATIONS", 1000)
+
+
+def test_hash_and_verify():
+    encoded = hash_password("secret")
+    assert verify_password("secret", encoded)
+    assert not verify_password("wrong", encoded)
+    assert hash_password("secret") != encoded
+
+
+def test_pbkdf2_fallback(monkeypatch):
+    monkeypatch.setattr(auth, "HAS_SCRYPT", False)
+    encoded = hash_password("secret")
+    assert encoded.startswith("pbkdf2_sha256$")
+    assert verify_password("secret", encoded)
+
+
+@pytest.mark.parametrize("encoded", ["", "plain", "scrypt$1$2", "pbkdf2_sha256$x$y$z", "scrypt$16$8$1$!!$!!", None])
+def test_malformed_hashes_are_rejected(encoded):
+    assert not verify_password("secret", encoded)
+
+
+def test_credential_from_settings():
+    assert verify_password("8888", credential_from_settings({}))
+    assert verify_password("legacy", credential_from_settings({"password": "legacy"}))
+    stored = hash_password("new")
+    assert credential_from_settings({"password_hash": stored, "password": "legacy"}) == stored
+
+
+def test_authenticator_caches_and_falls_back():
+    calls = []
+
+    def loader(app_id):
+        calls.append(app_id)
+        if len(calls) > 1:
+            raise ConnectionError("offline")
+        return {"password": "pw"}
+
+    authenticator = AdminAuthenticator(loader, secret="k", ttl=0)
+    assert authenticator.check("school-a", "pw")
+    # 讀取失敗時沿用上次的雜湊
+    assert authenticator.check("school-a", "pw") and not authenticator.check("school-a", "x")
+    assert len(calls) == 3
+
+
+def test_authenticator_without_cache_is_unavailable():
+    def loader(app_id):
+        raise ConnectionError("offline")
+
+    with pytest.raises(AuthUnavailable):
+        AdminAuthenticator(loader).check("school-a", "8888")
+
+
+def test_authenticator_ttl_and_invalidate():
+    settings = {"password": "old"}
+    calls = []
+
+    def loader(app_id):
+        calls.append(app_id)
+        return dict(settings)
+
+    authenticator = AdminAuthenticator(loader, secret="k", ttl=3600)
+    assert authenticator.check("school-a", "old")
+    settings["password"] = "new"
+    assert authenticator.check("school-a", "old") and len(calls) == 1
+    authenticator.invalidate("school-a")
+    assert authenticator.check("school-a", "new") and len(calls) == 2
+
+
+def test_tokens():
+    authenticator = AdminAuthenticator(lambda app_id: {}, secret="k")
+    token = authenticator.issue("school-a", "ADMIN")
+    assert authenticator.verify("school-a", token) == "ADMIN"
+    assert authenticator.verify("school-b", token) is None
+    assert authenticator.verify("school-a", token[:-2] + "xx") is None
+    assert authenticator.verify("school-a", "garbage") is None
+    assert AdminAuthenticator(lambda app_id: {}, secret="other").verify("school-a", token) is None
+    expired = authenticator.issue("school-a", "ADMIN", ttl=-1)
+    assert authenticator.verify("school-a", expired) is None
+
+
+def test_login_throttle():
+    throttle = LoginThrottle()
+    now = 1000.0
+    for i in range(MAX_FAILURES - 1):
+        throttle.failed(now + i)
+    assert throttle.wait_time(now + MAX_FAILURES) == 0
+    throttle.failed(now + MAX_FAILURES)
+    assert throttle.wait_time(now + MAX_FAILURES) == LOCKOUT_BASE
+    # 之後每次失敗等待時間加倍
+    throttle.failed(now + MAX_FAILURES + 1)
+    assert throttle.wait_time(now + MAX_FAILURES + 1) == LOCKOUT_BASE * 2
+    # 失敗紀錄在 FAILURE_WINDOW 後失效
+    assert throttle.wait_time(now + MAX_FAILURES + 2 + FAILURE_WINDOW) == 0
+    throttle.failed(now)
+    throttle.succeeded()
+    assert throttle.wait_time(now) == 0
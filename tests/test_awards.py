@@ -0,0 +1,55 @@
+import pandas as pd
+
+from awards import award_years, filter_awards, page_slice, render_awards_page_html, sort_awards
+
+
+def make_awards(n=3):
+    return pd.DataFrame([
+        {"日期": f"2024-09-{i + 1:02d}", "比賽名稱": f"校際賽{i}", "獎項": "冠軍", "學生姓名": f"學生{i}", "備註": ""}
+        for i in range(n)
+    ])
+
+
+def test_user_text_is_escaped():
+    awards = pd.DataFrame([{"日期": "2024-09-01", "比賽名稱": "<script>alert(1)</script>", "獎項": "冠軍 & 亞軍",
+                            "學生姓名": '小明"><img src=x>', "備註": "<b>備註</b>"}])
+    page = render_awards_page_html(awards, '小明"><img src=x>')
+    assert "<script>" not in page and "<img" not in page and "<b>備註" not in page
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in page and "冠軍 &amp; 亞軍" in page
+    assert "&lt;b&gt;備註&lt;/b&gt;" in page
+    # 以真實姓名比對 (未轉義) 後標示本人的獎項
+    assert "恭喜您" in page
+
+
+def test_missing_note_renders_no_note_block():
+    awards = make_awards(1).assign(備註=[None])
+    page = render_awards_page_html(awards)
+    assert "dashed" not in page and "None" not in page and "恭喜您" not in page
+
+
+def test_page_slice_bounds():
+    awards = make_awards(25)
+    first, n_pages = page_slice(awards, 1, page_size=10)
+    assert n_pages == 3 and len(first) == 10
+    last, _ = page_slice(awards, 3, page_size=10)
+    assert list(last["學生姓名"]) == [f"學生{i}" for i in range(20, 25)]
+    # 超出範圍的頁數限制在最後一頁或第一頁
+    assert page_slice(awards, 99, page_size=10)[0].equals(last)
+    assert page_slice(awards, 0, page_size=10)[0].equals(first)
+
+
+def test_empty_filter_result_has_one_empty_page():
+    awards = filter_awards(make_awards(), student="不存在")
+    page, n_pages = page_slice(awards, 5)
+    assert page.empty and n_pages == 1
+    assert render_awards_page_html(page) == ""
+
+
+def test_filter_and_sort():
+    awards = pd.concat([make_awards(), pd.DataFrame([{"日期": "2023-05-01", "比賽名稱": "公開賽", "獎項": "季軍",
+                                                      "學生姓名": "學生10", "備註": ""}])], ignore_index=True)
+    assert list(sort_awards(awards)["日期"])[:2] == ["2024-09-03", "2024-09-02"]
+    assert award_years(awards) == ["2024", "2023"]
+    assert list(filter_awards(awards, student="學生1")["學生姓名"]) == ["學生1", "學生10"]
+    assert list(filter_awards(awards, student="學生1", exact_student=True)["學生姓名"]) == ["學生1"]
+    assert list(filter_awards(awards, competition="校際", year="2024")["比賽名稱"]) == ["校際賽0", "校際賽1", "校際賽2"]
@@ -0,0 +1,204 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from datastore import DataService, MemoryBackend, Query, SharedDataCache
+from write_queue import WriteBehindQueue
+
+
+def make_service():
+    backend = MemoryBackend({'attendance_records': {
+        "A班_2024-09-04": {"班級": "A班", "日期": "2024-09-04", "出席名單": "a", "_version": 1},
+        "A班_2024-09-11": {"班級": "A班", "日期": "2024-09-11", "出席名單": "b", "_version": 1},
+    }})
+    return backend, DataService(backend)
+
+
+def edit(df, date, names):
+    df = df.copy()
+    df.loc[df["日期"] == date, "出席名單"] = names
+    return df
+
+
+def remote(backend, date):
+    return backend.collections['attendance_records'][f"A班_{date}"]
+
+
+def test_concurrent_sessions_same_document_conflict():
+    backend, service = make_service()
+    read_a = service.load('attendance_records')
+    read_b = service.load('attendance_records')
+
+    result_b = service.save('attendance_records', edit(read_b, "2024-09-04", "a,b"), read_b)
+    assert result_b.updated == ["A班_2024-09-04"] and not result_b.conflicts
+
+    # A 以讀取時的內容為基礎修改同一節：不可覆蓋 B 的修改
+    result_a = service.save('attendance_records', edit(read_a, "2024-09-04", "c"), read_a)
+    assert list(result_a.conflicts) == ["A班_2024-09-04"]
+    assert not result_a.changed
+    assert remote(backend, "2024-09-04")["出席名單"] == "a,b"
+    assert result_a.frame.set_index("日期").at["2024-09-04", "出席名單"] == "a,b"
+
+
+def test_concurrent_sessions_different_documents_merge():
+    backend, service = make_service()
+    read_a = service.load('attendance_records')
+    read_b = service.load('attendance_records')
+
+    service.save('attendance_records', edit(read_b, "2024-09-04", "a,b"), read_b)
+    result_a = service.save('attendance_records', edit(read_a, "2024-09-11", "b,c"), read_a)
+
+    # A 只寫入自己修改的一節，B 的修改保留並合併到 A 的結果
+    assert result_a.updated == ["A班_2024-09-11"] and not result_a.conflicts
+    assert remote(backend, "2024-09-04")["出席名單"] == "a,b"
+    assert remote(backend, "2024-09-11")["出席名單"] == "b,c"
+    merged = result_a.frame.set_index("日期")["出席名單"]
+    assert merged["2024-09-04"] == "a,b" and merged["2024-09-11"] == "b,c"
+
+
+def test_concurrent_delete_of_modified_document_conflicts():
+    backend, service = make_service()
+    read_a = service.load('attendance_records')
+    read_b = service.load('attendance_records')
+
+    service.save('attendance_records', edit(read_b, "2024-09-04", "a,b"), read_b)
+    result_a = service.save('attendance_records', read_a[read_a["日期"] != "2024-09-04"], read_a)
+
+    assert list(result_a.conflicts) == ["A班_2024-09-04"]
+    assert "A班_2024-09-04" in backend.collections['attendance_records']
+
+
+def test_remote_change_from_other_process_conflicts():
+    backend, service = make_service()
+    read = service.load('attendance_records')
+    # 其他程序直接寫入後端 (本程序的快照尚未更新)
+    backend.collections['attendance_records']["A班_2024-09-04"] = {
+        "班級": "A班", "日期": "2024-09-04", "出席名單": "z", "_version": 2}
+
+    result = service.save('attendance_records', edit(read, "2024-09-04", "c"), read)
+    assert list(result.conflicts) == ["A班_2024-09-04"]
+    assert remote(backend, "2024-09-04")["出席名單"] == "z"
+
+
+def test_cold_load_reads_collection_once_and_watches_changes():
+    backend, service = make_service()
+    # 監聽的第一次回呼即為讀取結果，不另外讀取整個集合
+    df = service.load('attendance_records')
+    assert backend.rpc_count == 1 and len(df) == 2
+    assert service.engine.snapshot('attendance_records')[1] == {"A班_2024-09-04": 1, "A班_2024-09-11": 1}
+
+    # 本程序的寫入 (回音) 不令快取失效；其他程序的寫入令快取失效
+    saved = service.save('attendance_records', edit(df, "2024-09-04", "a,b"), df).frame
+    assert service.cache.peek('attendance_records') is saved
+    backend.commit('attendance_records', {"A班_2024-09-18": {"班級": "A班", "日期": "2024-09-18", "出席名單": "c"}}, [], {})
+    assert service.cache.peek('attendance_records') is None
+    assert len(service.load('attendance_records')) == 3
+
+
+def test_failed_save_leaves_cache_unchanged():
+    backend, service = make_service()
+    read = service.load('attendance_records')
+
+    def offline(*args):
+        raise ConnectionError("offline")
+
+    backend.commit = offline
+    with pytest.raises(ConnectionError):
+        service.save('attendance_records', edit(read, "2024-09-04", "x"), read)
+    assert service.cache.peek('attendance_records') is read
+
+    record = {"班級": "A班", "日期": "2024-09-18", "出席名單": "c"}
+    with pytest.raises(ConnectionError):
+        service.append('attendance_records', record, pd.concat([read, pd.DataFrame([record])], ignore_index=True))
+    assert service.cache.peek('attendance_records') is read
+
+
+def test_query_includes_writes_still_in_the_journal(tmp_path):
+    backend, service = make_service()
+    read = service.load('attendance_records')
+
+    def offline(*args):
+        raise ConnectionError("offline")
+
+    backend.commit = offline
+    service.attach_write_queue(WriteBehindQueue(service.engine, str(tmp_path / "journal.db")))
+    try:
+        added = pd.DataFrame([{"班級": "A班", "日期": "2024-09-18", "出席名單": "c"}])
+        service.save('attendance_records', pd.concat([read[read["日期"] != "2024-09-04"], added], ignore_index=True), read)
+        # 共用快取過期後查詢改由後端執行，後端尚未收到排隊中的新增及刪除
+        service.cache.invalidate('attendance_records')
+        query = Query('attendance_records', [("班級", "==", "A班")], order_by="日期")
+        assert list(service.query(query)["日期"]) == ["2024-09-11", "2024-09-18"]
+        limited = Query('attendance_records', [("日期", ">=", "2024-09-01")], order_by="日期", descending=True, limit=1)
+        assert list(service.query(limited)["日期"]) == ["2024-09-18"]
+        assert sorted(service.load('attendance_records')["日期"]) == ["2024-09-11", "2024-09-18"]
+    finally:
+        service.close()
+
+
+def test_cache_versions_are_unique_across_caches():
+    first, second = SharedDataCache(), SharedDataCache()
+    df = pd.DataFrame({"a": [1]})
+    first.put('rankings', df)
+    second.put('rankings', df)
+    assert first.version('rankings') != second.version('rankings')
+    before = first.version('rankings')
+    first.invalidate('rankings')
+    assert first.version('rankings') > before
+
+
+def test_query_cached_reports_shared_cache_hits():
+    backend, service = make_service()
+    query = Query('attendance_records', [("日期", "==", "2024-09-04")])
+    assert not service.query_cached(query)
+    service.query(query)
+    assert service.query_cached(query)
+    rpcs = backend.rpc_count
+    service.query(query)
+    assert backend.rpc_count == rpcs
+
+    # 寫入令查詢結果失效；載入整個集合後可由快取篩選
+    service.cache.invalidate('attendance_records')
+    assert not service.query_cached(query)
+    service.load('attendance_records')
+    assert service.query_cached(query)
+
+
+def test_load_many_isolates_failures_and_times_each_collection():
+    backend, service = make_service()
+    backend.collections['rankings'] = {"4A_小明": {"年級": "P4", "班級": "4A", "姓名": "小明", "積分": 100, "_version": 1}}
+    list_documents = backend.list_documents
+
+    def flaky(collection_name):
+        if collection_name == 'student_awards':
+            raise ConnectionError("offline")
+        return list_documents(collection_name)
+
+    backend.list_documents = flaky
+    names = ['attendance_records', 'rankings', 'student_awards', 'schedules']
+    frames, errors, timings = service.load_many(names)
+    assert set(timings) == set(names) and all(t >= 0 for t in timings.values())
+    assert list(errors) == ['student_awards'] and isinstance(errors['student_awards'], ConnectionError)
+    assert len(frames['attendance_records']) == 2 and frames['rankings'].at[0, "姓名"] == "小明"
+    # 空集合返回 None (由呼叫者使用預設值)
+    assert frames['schedules'] is None
+    # 已讀取的集合放入共用快取，失敗的集合下次重新讀取
+    assert service.cache.peek('rankings') is frames['rankings']
+    assert service.cache.peek('student_awards') is None
+    assert service.load_many([]) == ({}, {}, {})
+
+
+def test_load_many_reads_collections_concurrently():
+    backend, service = make_service()
+    barrier = threading.Barrier(2, timeout=5)
+    list_documents = backend.list_documents
+
+    def wait_for_each_other(collection_name):
+        # 兩個集合的讀取須同時進行才能通過
+        barrier.wait()
+        return list_documents(collection_name)
+
+    backend.list_documents = wait_for_each_other
+    frames, errors, _ = service.load_many(['attendance_records', 'rankings'])
+    assert not errors and len(frames['attendance_records']) == 2
@@ -0,0 +1,76 @@
+import io
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from excel_io import (export_attendance_csv, export_rankings_xlsx, export_school_workbook, import_excel,
+                      ranking_export_frame, safe_sheet_title)
+from rankings import SETTLED_COLUMN, SETTLED_EVENTS
+
+
+def workbook(df):
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def test_class_players_keep_extra_columns():
+    data = workbook(pd.DataFrame({"班別": ["4A"], "學生姓名": ["小明"], "學號": [1], "家長電話": ["91234567"]}))
+    result = import_excel(data, 'class_players')
+    assert result.ok
+    row = result.frame.iloc[0]
+    assert (row["班級"], row["姓名"], row["學號"], row["家長電話"]) == ("4A", "小明", "01", "91234567")
+
+
+def test_rankings_keep_extra_columns():
+    data = workbook(pd.DataFrame({"年級": ["P4"], "班級": ["4A"], "姓名": ["小明"], "積分": [120], "備註": ["隊長"]}))
+    result = import_excel(data, 'rankings')
+    assert result.ok
+    assert result.frame.iloc[0]["備註"] == "隊長"
+    assert result.frame.iloc[0]["章別"] == "無"
+
+
+def sheet_rows(data, title):
+    return [list(row) for row in load_workbook(io.BytesIO(data), read_only=True)[title].iter_rows(values_only=True)]
+
+
+def make_rankings():
+    return pd.DataFrame([
+        {"年級": "P4", "班級": "4A", "姓名": "小明", "積分": "120", "章別": "銅章", SETTLED_EVENTS: "e1", SETTLED_COLUMN: ""},
+        {"年級": "P5", "班級": "5B", "姓名": "小美", "積分": 150.0, "章別": "無", SETTLED_EVENTS: "", SETTLED_COLUMN: ""},
+        {"年級": "P4", "班級": "4A", "姓名": "小明", "積分": 90, "章別": "無", SETTLED_EVENTS: "", SETTLED_COLUMN: ""},
+    ])
+
+
+def test_ranking_export_drops_internal_columns_and_duplicates():
+    export_df = ranking_export_frame(make_rankings())
+    assert list(export_df.columns) == ["年級", "班級", "姓名", "積分", "章別"]
+    assert list(zip(export_df["姓名"], export_df["積分"])) == [("小美", 150), ("小明", 120)]
+
+    rows = sheet_rows(export_rankings_xlsx(make_rankings()), "積分榜")
+    assert rows[0] == ["年級", "班級", "姓名", "積分", "章別"]
+    assert rows[1] == ["P5", "5B", "小美", 150, "無"] and len(rows) == 3
+
+
+def test_attendance_csv_has_bom_for_excel():
+    report = pd.DataFrame({"學生姓名": ["小明"], "2024-09-04": ["✅"]})
+    data = export_attendance_csv(report)
+    assert data.startswith(b"\xef\xbb\xbf")
+    assert data.decode('utf-8-sig').splitlines() == ["學生姓名,2024-09-04", "小明,✅"]
+
+
+def test_school_workbook_has_one_sheet_per_class():
+    matrix = pd.DataFrame({"學生姓名": ["小明"], "2024-09-04": ["✅"]})
+    data = export_school_workbook(make_rankings(), {"4A": matrix, "4/A": matrix})
+    assert load_workbook(io.BytesIO(data), read_only=True).sheetnames == ["積分榜", "考勤-4A", "考勤-4-A"]
+    assert sheet_rows(data, "考勤-4A") == [["學生姓名", "2024-09-04"], ["小明", "✅"]]
+    assert load_workbook(io.BytesIO(export_school_workbook(None, {})), read_only=True).sheetnames == ["空白"]
+
+
+def test_sheet_titles_are_valid_and_unique():
+    used = set()
+    long_title = "考勤-" + "甲" * 40
+    first = safe_sheet_title(long_title, used)
+    second = safe_sheet_title(long_title, used)
+    assert len(first) == 31 and len(second) == 31 and first != second and second.endswith(" (2)")
+    assert safe_sheet_title("a[b]:c*?/\\", set()) == "a-b--c----"
@@ -0,0 +1,65 @@
+import json
+
+import pandas as pd
+
+from instrumentation import BUCKETS_MS, Histogram, Metrics, Span, export_json, frame_memory
+
+
+def test_histogram_percentiles_use_bucket_bounds():
+    h = Histogram()
+    for ms in [0.5, 1.5, 3, 30]:
+        h.add(ms)
+    assert h.buckets[0] == h.buckets[1] == h.buckets[2] == 1 and h.buckets[BUCKETS_MS.index(50)] == 1
+    assert h.percentile(0.25) == 1.0
+    assert h.percentile(0.5) == 2.0
+    # 區間上限大於最長耗時時以最長耗時為準
+    assert h.percentile(0.95) == 30
+    summary = h.to_dict()
+    assert summary["count"] == 4 and summary["mean_ms"] == 8.75 and summary["max_ms"] == 30
+
+
+def test_histogram_overflow_and_empty():
+    assert Histogram().percentile(0.5) == 0.0
+    h = Histogram()
+    h.add(12000, docs=3, nbytes=100)
+    assert h.buckets[-1] == 1 and h.percentile(0.5) == 12000
+    assert h.to_dict()["buckets"][f">{BUCKETS_MS[-1]}ms"] == 1
+    assert h.docs == 3 and h.bytes == 100
+
+
+def test_span_records_to_every_target_once():
+    process, session = Metrics(), Metrics()
+    with Span("data.load.rankings", process, session) as info:
+        info["docs"], info["bytes"] = 5, 64
+    for metrics in (process, session):
+        row = metrics.summary().iloc[0]
+        assert row["項目"] == "data.load.rankings" and row["count"] == 1 and row["docs"] == 5 and row["bytes"] == 64
+
+    span = Span("compute.view", process)
+    span.finish()
+    span.finish()
+    assert process.to_dict()["spans"]["compute.view"]["count"] == 1
+    # 沒有目標的 span 不記錄任何統計
+    with Span("data.query.rankings"):
+        pass
+    assert "data.query.rankings" not in process.to_dict()["spans"]
+
+
+def test_metrics_summary_reset_and_export():
+    metrics = Metrics()
+    metrics.record("a", 0.001)
+    metrics.record("b", 0.5)
+    assert list(metrics.summary()["項目"]) == ["b", "a"]
+    exported = json.loads(export_json(process=metrics))
+    assert exported["process"]["spans"]["b"]["p50_ms"] == 500
+    metrics.reset()
+    assert metrics.summary().empty
+
+
+def test_frame_memory_samples_large_frames():
+    small = pd.DataFrame({"姓名": [f"學生{i}" for i in range(100)]})
+    assert frame_memory(small) == small.memory_usage(index=True, deep=True).sum()
+    large = pd.DataFrame({"姓名": [f"學生{i:05d}" for i in range(20000)]})
+    exact = large.memory_usage(index=True, deep=True).sum()
+    assert abs(frame_memory(large) - exact) / exact < 0.05
+    assert frame_memory(None) == 0
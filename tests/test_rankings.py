@@ -0,0 +1,190 @@
+from datetime import datetime
+
+import pandas as pd
+
+from datastore import DataService, MemoryBackend, SharedDataCache
+from rankings import (BADGE_AWARDS, LEDGER_COLUMNS, LEDGER_COMPACT_EVERY, NEW_PLAYER_POINTS, RANK_COLUMNS, SETTLED_COLUMN,
+                      SETTLED_EVENTS, Leaderboard, StudentRegistry, apply_ledger, badge_event, new_point_event, pending_events,
+                      record_event, settle_rankings, sync_from_roster)
+
+
+def make_rankings():
+    return pd.DataFrame([
+        {"年級": "P4", "班級": "4A", "姓名": "小明", "積分": 100, "章別": "無"},
+        {"年級": "P5", "班級": "5B", "姓名": "小美", "積分": 150, "章別": "銅章"},
+    ])
+
+
+def event(name, grade, delta, when, badge=""):
+    return new_point_event(name, grade, "", delta, "調整", badge, "ADMIN", now=datetime.fromisoformat(when))
+
+
+def points(rank_df, name):
+    return int(rank_df.set_index("姓名").at[name, "積分"])
+
+
+def test_apply_ledger_is_idempotent():
+    ledger = pd.DataFrame([event("小明", "P4", 10, "2024-10-01T10:00"), event("小美", "P5", -5, "2024-10-01T11:00")])
+    rank_df, applied = apply_ledger(make_rankings(), ledger)
+    assert applied == 2 and points(rank_df, "小明") == 110 and points(rank_df, "小美") == 145
+    again, applied = apply_ledger(rank_df, ledger)
+    assert applied == 0 and again is rank_df
+
+
+def test_late_event_with_earlier_time_is_applied():
+    first = event("小明", "P4", 10, "2024-10-01T10:00")
+    rank_df, _ = apply_ledger(make_rankings(), pd.DataFrame([first]))
+    # 另一程序的事件時間較早，但較遲寫入流水帳
+    late = event("小明", "P4", 20, "2024-10-01T09:00")
+    ledger = pd.DataFrame([first, late])
+    assert pending_events(rank_df, ledger)["事件ID"].tolist() == [late["事件ID"]]
+    rank_df, applied = apply_ledger(rank_df, ledger)
+    assert applied == 1 and points(rank_df, "小明") == 130
+
+
+def test_nan_badge_from_cloud_is_not_a_badge():
+    ledger = pd.DataFrame([event("小明", "P4", 10, "2024-10-01T10:00")], columns=LEDGER_COLUMNS)
+    ledger["章別"] = float("nan")
+    ledger["班級"] = float("nan")
+    rank_df, _ = apply_ledger(make_rankings(), ledger)
+    row = rank_df.set_index("姓名").loc["小明"]
+    assert row["章別"] == "無" and row["積分"] == 110 and row["班級"] == "4A"
+
+
+def test_badge_event_creates_student():
+    registry = StudentRegistry().bind_rankings(make_rankings())
+    registry.apply_event(event("小強", "P6", 50, "2024-10-01T10:00", badge="銅章"))
+    rank_df = registry.commit()
+    row = rank_df.set_index("姓名").loc["小強"]
+    assert row["章別"] == "銅章" and row["積分"] == 150
+
+
+def test_settle_rankings_marks_existing_events():
+    ledger = pd.DataFrame([event("小明", "P4", 10, "2024-10-01T10:00"), event("小強", "P6", 5, "2024-10-01T11:00")])
+    settled = settle_rankings(make_rankings(), ledger)
+    assert settled.set_index("姓名").at["小明", SETTLED_EVENTS] == ledger.at[0, "事件ID"]
+    # 不在積分榜的學生的事件仍會套用
+    assert pending_events(settled, ledger)["姓名"].tolist() == ["小強"]
+
+
+def test_legacy_settlement_time_is_respected():
+    old = event("小明", "P4", 10, "2024-10-01T10:00")
+    new = event("小明", "P4", 20, "2024-10-02T10:00")
+    rank_df = make_rankings().assign(**{SETTLED_COLUMN: ["2024-10-01T12:00:00.000000", ""]})
+    ledger = pd.DataFrame([old, new])
+    rank_df, applied = apply_ledger(rank_df, ledger)
+    assert applied == 1 and points(rank_df, "小明") == 120
+    assert apply_ledger(rank_df, ledger)[1] == 0
+
+
+def test_record_event_compacts_when_enough_events_are_unsettled():
+    registry, rank_df = StudentRegistry(), make_rankings()
+    stored = rank_df
+    # 其他 session 已附加一筆事件：按流水帳長度的倍數判斷會錯過壓縮
+    ledger, flags = pd.DataFrame([event("小美", "P5", 5, "2024-10-01T10:00")]), []
+    for _ in range(LEDGER_COMPACT_EVERY - 1):
+        e = badge_event("小明", "P4", "4A", "銅章", "ADMIN")
+        ledger = pd.concat([ledger, pd.DataFrame([e])], ignore_index=True)
+        rank_df, compact = record_event(registry, rank_df, ledger, e, stored)
+        flags.append(compact)
+    assert flags == [False] * (LEDGER_COMPACT_EVERY - 2) + [True]
+    assert points(rank_df, "小明") == 100 + 50 * (LEDGER_COMPACT_EVERY - 1)
+    assert len(pending_events(rank_df, ledger)) == 1
+
+
+def test_compaction_writes_every_student_changed_since_last_save():
+    backend = MemoryBackend()
+    service = DataService(backend)
+    idle = pd.DataFrame([{"年級": "P6", "班級": "6C", "姓名": "小強", "積分": 80, "章別": "無"}])
+    service.save('rankings', pd.concat([make_rankings(), idle], ignore_index=True))
+    registry, ledger = StudentRegistry(), pd.DataFrame(columns=LEDGER_COLUMNS)
+    # 與 record_point_event 相同：未壓縮時只發布，壓縮時與已儲存的內容比對後寫入
+    rank_df, results = service.load('rankings'), []
+    for i in range(LEDGER_COMPACT_EVERY):
+        name, grade = [("小明", "P4"), ("小美", "P5"), (f"新同學{i}", "P6")][i % 3]
+        e = badge_event(name, grade, "", "銅章", "ADMIN")
+        ledger = pd.concat([ledger, pd.DataFrame([e])], ignore_index=True)
+        service.append('points_ledger', e, ledger)
+        rank_df, compact = record_event(registry, rank_df, ledger, e, service.stored('rankings'))
+        if compact:
+            results.append(service.save('rankings', rank_df))
+            rank_df = results[-1].frame
+        else:
+            service.publish('rankings', rank_df)
+
+    # 只寫入有事件的學生，未變更的學生 (補上空白的已結算欄位) 不會寫入
+    assert len(results) == 1
+    assert len(results[0].inserted) + len(results[0].updated) == ledger["姓名"].nunique()
+    saved = DataService(backend).load('rankings')
+    assert pending_events(saved, ledger).empty
+    assert points(saved, "小明") == points(rank_df, "小明") and points(saved, "小美") == points(rank_df, "小美")
+    assert saved["姓名"].str.startswith("新同學").sum() == ledger["姓名"].str.startswith("新同學").sum()
+
+
+def test_sync_from_roster_adds_only_new_students():
+    roster = pd.DataFrame({
+        "年級": ["P4", " P5 ", "P5", "P6", "P6"],
+        "班級": ["4A", "5B ", "5C", "6C", "6D"],
+        "姓名": ["小明", "小美", "小美", " 小強", "小強"],
+    })
+    df_r, added = sync_from_roster(make_rankings(), roster)
+    # 小明、小美 已在積分榜 (比對前去除空白)；名單中重複的 小強 只加入第一筆
+    assert added == 1 and len(df_r) == 3
+    new = df_r.iloc[-1]
+    assert (new["年級"], new["班級"], new["姓名"], new["積分"], new["章別"]) == ("P6", "6C", "小強", NEW_PLAYER_POINTS, "無")
+    assert df_r.iloc[:2].equals(make_rankings())
+
+
+def test_sync_from_roster_without_grade_column():
+    roster = pd.DataFrame({"班級": ["4A", "4A"], "姓名": ["小明", "小新"]})
+    df_r, added = sync_from_roster(make_rankings(), roster)
+    # 沒有年級欄位時記為 "-"：與積分榜中 P4 的小明不是同一學生
+    assert added == 2 and list(df_r["年級"].iloc[2:]) == ["-", "-"]
+
+
+def test_sync_from_roster_fills_missing_rank_columns():
+    rank_df = pd.DataFrame({"年級": ["P4"], "姓名": ["小明"]})
+    df_r, added = sync_from_roster(rank_df, pd.DataFrame())
+    assert added == 0 and list(df_r.columns) == ["年級", "姓名", "班級", "積分", "章別"]
+    assert df_r.at[0, "積分"] == 0 and df_r.at[0, "章別"] == "無"
+    # 不修改呼叫者的 DataFrame
+    assert list(rank_df.columns) == ["年級", "姓名"]
+    # 空白積分榜：名單學生全部加入
+    df_r, added = sync_from_roster(pd.DataFrame(columns=RANK_COLUMNS), rank_df.assign(班級="4A"))
+    assert added == 1 and list(df_r.columns) == RANK_COLUMNS and df_r.at[0, "積分"] == NEW_PLAYER_POINTS
+
+
+def test_leaderboard_ranks_and_merges_duplicates():
+    rank_df = pd.concat([make_rankings(), pd.DataFrame([
+        {"年級": "P4", "班級": "4B", "姓名": " 小明", "積分": 999, "章別": "金章"},
+        {"年級": "P4", "班級": "4B", "姓名": "小新", "積分": "abc", "章別": "白金章"},
+    ])], ignore_index=True)
+    board = Leaderboard(rank_df, BADGE_AWARDS)
+    # 重複學生以第一筆為準，無法解讀的積分視為 0
+    assert list(board.table["姓名"]) == ["小美", "小明", "小新"] and list(board.table.index) == [1, 2, 3]
+    assert list(board.table["積分"]) == [150, 100, 0]
+    assert list(board.table["榮譽勳章"]) == ["🥉 銅章", "-", "💎 白金章"]
+    assert list(board.by_grade["P4"]["姓名"]) == ["小明", "小新"] and list(board.by_grade["P4"].index) == [1, 2]
+    assert sorted(board.by_class) == ["4A", "4B", "5B"]
+
+
+def test_leaderboard_is_memoised_by_rankings_version():
+    cache, builds = SharedDataCache(), []
+
+    def build(df):
+        builds.append(df)
+        return Leaderboard(df, BADGE_AWARDS)
+
+    rank_df = make_rankings()
+    cache.put('rankings', rank_df)
+    board = cache.derived('rankings', 'leaderboard', rank_df, build)
+    assert cache.derived('rankings', 'leaderboard', rank_df, build) is board and len(builds) == 1
+    # 不是快取中的 DataFrame (例如 session 自行修改的副本) 不會共用
+    assert cache.derived('rankings', 'leaderboard', rank_df.copy(), build) is None
+
+    updated = rank_df.assign(積分=[300, 150])
+    cache.put('rankings', updated)
+    new_board = cache.derived('rankings', 'leaderboard', updated, build)
+    assert new_board is not board and len(builds) == 2 and new_board.table.iloc[0]["姓名"] == "小明"
+    cache.invalidate('rankings')
+    assert cache.derived('rankings', 'leaderboard', updated, build) is None
@@ -0,0 +1,78 @@
+import pandas as pd
+
+from attendance import sort_dates
+from schedule import ScheduleIndex, academic_year, parse_dates, split_dates
+
+
+def make_index(today="2024-10-01"):
+    schedule = pd.DataFrame([
+        {"班級": "A班", "具體日期": "13/10, 06/10, 20/10", "地點": "A場"},
+        {"班級": "B班", "具體日期": "2024-10-08、2024-10-15", "地點": "B場"},
+        {"班級": "A班", "具體日期": "03/01 (五), 不定期", "地點": "其他"},
+        {"班級": "C班", "具體日期": "待定", "地點": "C場"},
+    ])
+    return ScheduleIndex(schedule, today=today)
+
+
+def test_split_dates():
+    assert split_dates("06/10, 13/10，20/10、27/10") == ["06/10", "13/10", "20/10", "27/10"]
+    assert split_dates(None) == [] and split_dates(float("nan")) == []
+
+
+def test_day_month_labels_use_academic_year():
+    parsed = parse_dates(["06/10", "13/10", "03/01", "29/02"], today="2023-11-01")
+    assert parsed["06/10"] == pd.Timestamp("2023-10-06")
+    assert parsed["13/10"] == pd.Timestamp("2023-10-13")
+    # 一月屬學年的翌年；2024 年為閏年
+    assert parsed["03/01"] == pd.Timestamp("2024-01-03")
+    assert parsed["29/02"] == pd.Timestamp("2024-02-29")
+
+
+def test_day_month_year_inferred_from_dated_labels():
+    parsed = parse_dates(["2022-09-07", "14/09", "05/05"], today="2026-10-18")
+    assert parsed["14/09"] == pd.Timestamp("2022-09-14")
+    assert parsed["05/05"] == pd.Timestamp("2023-05-05")
+
+
+def test_formats_and_unparseable():
+    parsed = parse_dates(["2024-09-04 00:00:00", "04/09/2024", "2024年9月4日", "06/10 (日)", "不定期", "32/13"], today="2024-09-01")
+    assert parsed["2024-09-04 00:00:00"] == parsed["04/09/2024"] == parsed["2024年9月4日"] == pd.Timestamp("2024-09-04")
+    assert parsed["06/10 (日)"] == pd.Timestamp("2024-10-06")
+    assert pd.isna(parsed["不定期"]) and pd.isna(parsed["32/13"])
+    assert academic_year("2025-03-01") == 2024 and academic_year("2024-09-01") == 2024
+
+
+def test_class_dates_sorted_by_date():
+    index = make_index()
+    assert index.dates("A班") == ["06/10", "13/10", "20/10", "03/01 (五)", "不定期"]
+
+
+def test_calendar_queries():
+    index = make_index()
+    assert index.classes_on("2024-10-06") == ["A班"]
+    assert index.sessions_between("2024-10-06", "2024-10-13")["班級"].tolist() == ["A班", "B班", "A班"]
+    week = index.week_of("2024-10-09")
+    assert week["日期"].tolist() == ["2024-10-08", "13/10"]
+    assert week["星期"].tolist() == ["星期二", "星期日"]
+    assert index.months() == ["2024-10", "2025-01"]
+    assert index.month("2025-01")["日期"].tolist() == ["03/01 (五)"]
+    assert index.calendar().columns.tolist()[:3] == ["日期", "星期", "班級"]
+
+
+def test_nearest_index():
+    index = make_index()
+    assert index.nearest_index("A班", "2024-10-12") == 1
+    assert index.nearest_index("A班", "2024-10-16") == 1
+    assert index.nearest_index("A班", "2025-03-01") == 3
+    assert index.nearest_index("C班", "2024-10-12") == 0
+
+
+def test_empty_schedule():
+    index = ScheduleIndex(pd.DataFrame(columns=["班級", "具體日期"]))
+    assert index.classes == [] and index.classes_on("2024-10-06") == []
+    assert index.months() == []
+
+
+def test_sort_dates_day_month():
+    assert sort_dates(["13/10", "06/10", "03/01", "2024-09-04", "待定"], today="2024-10-01") == \
+        ["2024-09-04", "06/10", "13/10", "03/01", "待定"]
@@ -0,0 +1,62 @@
+from datetime import date, datetime, timezone
+
+from datastore import DataService, MemoryBackend
+from snapshot_store import SnapshotStore
+
+
+def make_docs():
+    return {
+        "4A_小明": {"年級": "P4", "班級": "4A", "姓名": "小明", "積分": 3, "平均": 2.5, "在籍": True, "備註": None,
+                   "登記時間": datetime(2024, 9, 4, 16, 30, tzinfo=timezone.utc), "生日": date(2014, 5, 1),
+                   "記錄": [1, {"章別": "銅章"}]},
+        # 沒有「平均」等欄位：讀取時不應補上空值
+        "5B_小美": {"年級": "P5", "班級": "5B", "姓名": "小美", "積分": 150},
+    }
+
+
+def test_round_trip_keeps_types_and_missing_fields(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    docs, versions = make_docs(), {"4A_小明": 2, "5B_小美": 1}
+    etag = store.write('rankings', docs, versions)
+
+    # 重新開啟 (模擬程序重新啟動)
+    read_docs, read_versions, read_etag = SnapshotStore(str(tmp_path)).read('rankings')
+    assert read_docs == docs and read_versions == versions and read_etag == etag
+    assert type(read_docs["4A_小明"]["積分"]) is int and type(read_docs["4A_小明"]["平均"]) is float
+    assert "平均" not in read_docs["5B_小美"] and "備註" in read_docs["4A_小明"]
+
+
+def test_unchanged_content_is_not_rewritten(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    etag = store.write('rankings', make_docs(), {})
+    saved_at = store.meta('rankings')["saved_at"]
+    assert store.write('rankings', make_docs(), {}) == etag
+    assert store.meta('rankings')["saved_at"] == saved_at
+
+
+def test_unreadable_or_legacy_snapshots_are_ignored(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write('rankings', make_docs(), {})
+    (tmp_path / "rankings.json").write_text("{", encoding='utf-8')
+    assert store.read('rankings') is None
+    # 舊版 pickle 快照不會被讀取
+    store._meta['rankings']["format"] = "pickle"
+    assert store.read('rankings') is None
+
+
+def test_restart_from_snapshot_reconciles_without_changes(tmp_path):
+    docs = {doc_id: {**data, "_version": 1} for doc_id, data in make_docs().items()}
+    backend = MemoryBackend({'rankings': docs})
+    first = DataService(backend).attach_snapshot_store(SnapshotStore(str(tmp_path)))
+    first.load('rankings')
+    first._background.shutdown(wait=True)
+
+    # 重新啟動：先以快照返回，背景核對後內容相同，共用快取保持不變
+    store = SnapshotStore(str(tmp_path))
+    saved_at = store.meta('rankings')["saved_at"]
+    service = DataService(backend).attach_snapshot_store(store)
+    df = service.load('rankings')
+    service._background.shutdown(wait=True)
+    assert 'rankings' in service._reconciled
+    assert service.cache.peek('rankings') is df and store.meta('rankings')["saved_at"] == saved_at
+    assert service.engine.snapshot('rankings')[0] == make_docs()
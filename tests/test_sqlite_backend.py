@@ -0,0 +1,61 @@
+import pytest
+
+from datastore import MemoryBackend, Query, SQLiteBackend
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "data.db"), "school-a")
+    yield backend
+    backend.pool.close()
+
+
+def entry(s_class, date, name):
+    return {"班級": s_class, "日期": date, "學生姓名": name, "出席": True}
+
+
+def test_sqlite_commit_and_versions(sqlite_backend):
+    assert sqlite_backend.commit('attendance_entries', {"d1": entry("A班", "2024-09-04", "小明")}, [], {}) == {}
+    assert sqlite_backend.list_documents('attendance_entries')["d1"]["_version"] == 1
+    assert sqlite_backend.commit('attendance_entries', {"d1": entry("A班", "2024-09-11", "小明")}, [], {"d1": 1}) == {}
+    assert sqlite_backend.list_documents('attendance_entries')["d1"]["_version"] == 2
+
+    # 版本不符：不寫入，返回雲端目前內容
+    conflicts = sqlite_backend.commit('attendance_entries', {"d1": entry("A班", "2024-09-18", "小明")}, [], {"d1": 1})
+    assert conflicts["d1"]["日期"] == "2024-09-11" and conflicts["d1"]["_version"] == 2
+    # 刪除亦須版本相符
+    assert "d1" in sqlite_backend.commit('attendance_entries', {}, ["d1"], {"d1": 1})
+    assert sqlite_backend.commit('attendance_entries', {}, ["d1"], {"d1": 2}) == {}
+    assert sqlite_backend.list_documents('attendance_entries') == {}
+
+
+def test_sqlite_queries_use_indexed_fields(sqlite_backend):
+    docs = {
+        "d1": entry("A班", "2024-09-04", "小明"),
+        "d2": entry("A班", "2024-09-11", "小美"),
+        "d3": entry("B班", "2024-09-05", "小明"),
+    }
+    sqlite_backend.commit('attendance_entries', docs, [], {})
+    by_class = sqlite_backend.query('attendance_entries', Query('attendance_entries', [("班級", "==", "A班")], order_by="日期", descending=True))
+    assert list(by_class) == ["d2", "d1"]
+    by_student = sqlite_backend.query('attendance_entries', Query('attendance_entries', [("學生姓名", "==", "小明"), ("日期", ">=", "2024-09-05")]))
+    assert list(by_student) == ["d3"]
+    limited = sqlite_backend.query('attendance_entries', Query('attendance_entries', order_by="日期", limit=2))
+    assert list(limited) == ["d1", "d3"]
+    # 與記憶體後端的結果一致
+    memory = MemoryBackend({'attendance_entries': docs})
+    query = Query('attendance_entries', [("班級", "==", "A班")], order_by="日期")
+    assert list(memory.query('attendance_entries', query)) == list(sqlite_backend.query('attendance_entries', query))
+
+
+def test_sqlite_tenants_are_isolated(tmp_path):
+    a = SQLiteBackend(str(tmp_path / "data.db"), "school-a")
+    b = SQLiteBackend(str(tmp_path / "data.db"), "school-b", pool=a.pool)
+    a.commit('rankings', {"x": {"姓名": "小明"}}, [], {})
+    assert b.list_documents('rankings') == {}
+    a.pool.close()
+
+
+def test_query_rejects_unindexed_fields():
+    with pytest.raises(ValueError):
+        Query('rankings', [("積分", "==", 1)])
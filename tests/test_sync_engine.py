@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+
+from datastore import MAX_BATCH_OPS, MemoryBackend, SyncEngine
+
+
+def roster(n, points=100):
+    return pd.DataFrame({"年級": "P4", "班級": "4A", "姓名": [f"學生{i:04d}" for i in range(n)], "積分": points})
+
+
+@pytest.fixture
+def engine():
+    return SyncEngine(MemoryBackend())
+
+
+def test_first_sync_inserts_everything(engine):
+    result = engine.sync('rankings', roster(3))
+    assert len(result.inserted) == 3 and not result.updated and not result.deleted
+    assert engine.backend.write_count == 3
+
+
+def test_sync_writes_only_changed_documents(engine):
+    df = roster(5)
+    engine.sync('rankings', df)
+    writes = engine.backend.write_count
+
+    edited = df.copy()
+    edited.loc[2, "積分"] = 150
+    edited = edited.drop(index=4)
+    result = engine.sync('rankings', edited, base=df)
+    assert result.updated == ["4A_學生0002"] and result.deleted == ["4A_學生0004"] and not result.inserted
+    assert engine.backend.write_count - writes == 2
+
+    # 內容不變時不會寫入
+    assert not engine.sync('rankings', edited, base=edited.copy()).changed
+
+
+def test_commits_are_batched(engine):
+    n = MAX_BATCH_OPS * 2 + 1
+    engine.sync('rankings', roster(n))
+    rpcs = engine.backend.rpc_count
+    engine.sync('rankings', roster(n, points=200))
+    # 一次讀取快照已在首次同步時完成：只需 ceil(n / MAX_BATCH_OPS) 次提交
+    assert engine.backend.rpc_count - rpcs == 3
+
+
+def test_versions_increment_per_write(engine):
+    df = roster(1)
+    engine.sync('rankings', df)
+    assert engine.versions('rankings', ["4A_學生0000"]) == {"4A_學生0000": 1}
+    engine.sync('rankings', roster(1, points=120), base=df)
+    assert engine.backend.collections['rankings']["4A_學生0000"]["_version"] == 2
+    assert engine.versions('rankings', ["4A_學生0000", "unknown"]) == {"4A_學生0000": 2, "unknown": 0}
+
+
+def test_docs_added_by_other_sessions_are_kept(engine):
+    df = roster(2)
+    engine.sync('rankings', df)
+    engine.write_one('rankings', {"年級": "P5", "班級": "5B", "姓名": "新同學", "積分": 100})
+    # df 不包括其他 session 新增的文件：不應被刪除，並合併至結果
+    result = engine.sync('rankings', df, base=df.copy())
+    assert not result.deleted and "5B_新同學" in result.kept
+    assert "5B_新同學" in engine.backend.collections['rankings']
+
+
+def test_failed_commit_drops_snapshot(engine):
+    engine.sync('rankings', roster(2))
+
+    def offline(*args):
+        raise ConnectionError("offline")
+
+    engine.backend.commit = offline
+    with pytest.raises(ConnectionError):
+        engine.sync('rankings', roster(2, points=50))
+    assert engine.snapshot('rankings') is None
+
+
+def test_echo_of_own_write_matches_snapshot(engine):
+    engine.sync('rankings', roster(1))
+    doc = dict(engine.backend.collections['rankings']["4A_學生0000"])
+    assert engine.matches_snapshot('rankings', {"4A_學生0000": doc})
+    assert not engine.matches_snapshot('rankings', {"4A_學生0000": {**doc, "積分": 1}})
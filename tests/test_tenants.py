@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from tenants import DEFAULT_TENANT, TenantPool, registered_tenants, validate_tenant
+
+
+class FakeService:
+    """記錄關閉次序的數據服務；release 設定前 close 會一直等待 (模擬提交剩餘修改)"""
+
+    def __init__(self, app_id, log, release):
+        self.app_id = app_id
+        self.log = log
+        self.release = release
+
+    def close(self):
+        self.release.wait(5)
+        self.log.append(("closed", self.app_id))
+
+
+@pytest.fixture
+def pool():
+    log, release = [], threading.Event()
+
+    def factory(app_id):
+        log.append(("created", app_id))
+        return FakeService(app_id, log, release)
+
+    pool = TenantPool(factory, max_active=1)
+    yield pool, log, release
+    release.set()
+    pool.close()
+
+
+def test_eviction_closes_in_background(pool):
+    pool, log, release = pool
+    first = pool.get("school-a")
+    assert pool.get("school-a") is first
+    # 移除 school-a 不會等待其 close 完成
+    pool.get("school-b")
+    assert ("closed", "school-a") not in log
+    release.set()
+    pool._closing["school-a"].join(5)
+    assert ("closed", "school-a") in log
+
+
+def test_recreate_waits_for_previous_close(pool):
+    pool, log, release = pool
+    pool.get("school-a")
+    pool.get("school-b")
+    threading.Timer(0.05, release.set).start()
+    pool.get("school-a")
+    # 新服務只在舊服務關閉後建立
+    created = [i for i, entry in enumerate(log) if entry == ("created", "school-a")]
+    assert len(created) == 2 and log.index(("closed", "school-a")) < created[1]
+
+
+def test_validate_tenant():
+    assert validate_tenant(" school-a ") == "school-a"
+    with pytest.raises(ValueError):
+        validate_tenant("School/A")
+    assert registered_tenants("school-a, school-b") == {DEFAULT_TENANT, "school-a", "school-b"}
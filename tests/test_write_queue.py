@@ -0,0 +1,134 @@
+import sqlite3
+import time
+
+import pytest
+
+from datastore import MemoryBackend, SyncEngine
+import write_queue
+from write_queue import WriteBehindQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    backend = MemoryBackend({'rankings': {"A班_小明": {"班級": "A班", "姓名": "小明", "積分": 10, "_version": 1}}})
+    engine = SyncEngine(backend)
+    engine.load('rankings')
+    q = WriteBehindQueue(engine, str(tmp_path / "journal.db"), namespace="test")
+    yield backend, engine, q
+    q.stop()
+
+
+def doc(points):
+    return {"班級": "A班", "姓名": "小明", "積分": points}
+
+
+def test_enqueue_coalesces_and_flushes(queue):
+    backend, engine, q = queue
+    q.enqueue('rankings', {"A班_小明": doc(20)}, [])
+    q.enqueue('rankings', {"A班_小明": doc(30)}, [])
+    assert q.pending_count() == 1
+    assert q.pending('rankings') == {"A班_小明": doc(30)}
+
+    assert q.flush() == 1
+    assert q.pending_count() == 0
+    assert backend.collections['rankings']["A班_小明"] == {**doc(30), "_version": 2}
+    assert backend.write_count == 1
+
+
+def test_requeue_during_flush_is_not_lost(queue):
+    backend, engine, q = queue
+    q.enqueue('rankings', {"A班_小明": doc(20)}, [])
+    apply = engine.apply
+
+    def apply_and_edit(*args):
+        # 提交進行期間同一文件再次被修改
+        q.enqueue('rankings', {"A班_小明": doc(30)}, [])
+        return apply(*args)
+
+    engine.apply = apply_and_edit
+    q.flush()
+    engine.apply = apply
+    assert q.pending('rankings') == {"A班_小明": doc(30)}
+
+    q.flush()
+    assert q.pending_count() == 0
+    assert q.conflicts == 0
+    assert backend.collections['rankings']["A班_小明"] == {**doc(30), "_version": 3}
+
+
+def test_enqueue_after_commit_uses_new_version(queue):
+    backend, engine, q = queue
+    q.enqueue('rankings', {"A班_小明": doc(20)}, [])
+    q.flush()
+    q.enqueue('rankings', {"A班_小明": doc(30)}, [])
+    q.flush()
+    assert q.conflicts == 0
+    assert backend.collections['rankings']["A班_小明"]["積分"] == 30
+
+
+def test_remote_change_while_queued_is_conflict(queue):
+    backend, engine, q = queue
+    q.enqueue('rankings', {"A班_小明": doc(20)}, [])
+    backend.collections['rankings']["A班_小明"] = {**doc(99), "_version": 5}
+    flushed = []
+    q.on_flush = lambda name, conflicts: flushed.append(conflicts)
+    q.flush()
+    assert q.conflicts == 1
+    assert backend.collections['rankings']["A班_小明"]["積分"] == 99
+    assert flushed[0]["A班_小明"]["積分"] == 99
+
+
+def test_failed_flush_keeps_journal_and_retries(queue):
+    backend, engine, q = queue
+    q.enqueue('rankings', {"A班_小明": doc(20)}, [])
+    commit = backend.commit
+
+    def offline(*args):
+        raise ConnectionError("offline")
+
+    backend.commit = offline
+    with pytest.raises(ConnectionError):
+        q.flush()
+    assert q.pending_count() == 1
+
+    # 程序重新啟動：新的佇列從同一日誌繼續提交
+    backend.commit = commit
+    engine = SyncEngine(backend)
+    engine.load('rankings')
+    restarted = WriteBehindQueue(engine, q.path, namespace="test")
+    assert restarted.flush() == 1
+    assert backend.collections['rankings']["A班_小明"]["積分"] == 20
+    restarted.stop()
+
+
+def test_background_thread_retries_with_backoff(queue, monkeypatch):
+    backend, engine, q = queue
+    monkeypatch.setattr(write_queue, "FLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(write_queue, "RETRY_BASE_DELAY", 0.01)
+    commit, calls = backend.commit, []
+
+    def flaky(*args):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("offline")
+        return commit(*args)
+
+    backend.commit = flaky
+    q.enqueue('rankings', {"A班_小明": doc(20)}, [])
+    q.start()
+    for _ in range(200):
+        if not q.pending_count():
+            break
+        time.sleep(0.01)
+    assert q.pending_count() == 0
+    assert len(calls) == 2 and q.failures == 0
+
+
+def test_stop_flushes_and_closes_journal(queue):
+    backend, engine, q = queue
+    q.start()
+    q.enqueue('rankings', {"A班_小明": doc(20)}, [])
+    q.stop()
+    assert backend.collections['rankings']["A班_小明"]["積分"] == 20
+    with pytest.raises(sqlite3.ProgrammingError):
+        q.pending_count()
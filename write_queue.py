@@ -0,0 +1,203 @@
+"""正覺壁球管理系統 - 延後寫入佇列 (write-behind)
+
+修改先寫入本機日誌 (SQLite) 並即時反映在共用快取，再由背景執行緒合併後分批提交至後端；
+提交失敗時按指數退避重試。程序中途結束時，未提交的修改會在下次啟動時從日誌繼續提交。
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from instrumentation import Span
+
+# 重試的等待時間 (秒)：首次失敗後等待 RETRY_BASE_DELAY，每次加倍，最多 RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# 沒有新修改時背景執行緒檢查日誌的間隔 (秒)
+FLUSH_INTERVAL = 2.0
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    namespace TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    data TEXT,
+    base_version INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (namespace, collection, doc_id)
+);
+"""
+
+
+class WriteBehindQueue:
+    """以本機日誌保存待提交的文件修改，同一文件的多次修改合併為最後一次
+
+    每份文件記錄首次排隊時的版本 (base_version)，提交時以此作比對，
+    因此排隊期間其他管理員的修改仍會被偵測為衝突而不會被覆蓋。
+    on_flush(集合名稱, 衝突文件) 在每個集合提交後呼叫。
+    """
+
+    def __init__(self, engine, path, namespace="", on_flush=None):
+        self.engine = engine
+        self.path = path
+        self.namespace = namespace
+        self.on_flush = on_flush
+        # 效能統計 (instrumentation.Metrics)，由 DataService 設定
+        self.metrics = None
+        self.last_error = None
+        self.last_flush = None
+        self.failures = 0
+        self.next_attempt = 0.0
+        # 累計因其他管理員已修改而改用雲端內容的文件數
+        self.conflicts = 0
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(JOURNAL_SCHEMA)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM pending").fetchone()[0]
+
+    # --- 排隊 ---
+    def enqueue(self, collection_name, upserts, deletes):
+        """把文件修改寫入日誌 (刪除以 None 表示)；已在排隊的文件保留原有的 base_version"""
+        doc_ids = list(upserts) + list(deletes)
+        if not doc_ids:
+            return
+        with self._lock:
+            # 在鎖內讀取版本：與 flush 移除已提交文件的步驟互斥，不會以提交前的版本新增排隊
+            versions = self.engine.versions(collection_name, doc_ids)
+            rows = []
+            for doc_id in doc_ids:
+                self._seq += 1
+                data = upserts.get(doc_id)
+                rows.append((self.namespace, collection_name, doc_id,
+                             None if data is None else json.dumps(data, ensure_ascii=False, default=str),
+                             versions[doc_id], self._seq))
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT INTO pending VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (namespace, collection, doc_id) DO UPDATE SET data = excluded.data, seq = excluded.seq",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+        self._wake.set()
+
+    def pending(self, collection_name):
+        """尚未提交的修改 {文件 ID: 內容 (刪除為 None)}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, data FROM pending WHERE namespace = ? AND collection = ?",
+                                      (self.namespace, collection_name)).fetchall()
+        return {doc_id: None if data is None else json.loads(data) for doc_id, data in rows}
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pending WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def status(self):
+        """供介面顯示的同步狀態"""
+        return {
+            "pending": self.pending_count(),
+            "last_flush": self.last_flush,
+            "last_error": self.last_error,
+            "failures": self.failures,
+            "conflicts": self.conflicts,
+            "retry_in": max(0.0, self.next_attempt - time.monotonic()) if self.failures else 0.0,
+        }
+
+    # --- 提交 ---
+    def flush(self):
+        """把日誌中所有修改按集合合併提交，返回已提交的文件數；失敗時拋出例外 (日誌保持不變)"""
+        with self._flush_lock:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT collection, doc_id, data, base_version, seq FROM pending WHERE namespace = ? ORDER BY seq",
+                    (self.namespace,)).fetchall()
+            by_collection = {}
+            for collection_name, doc_id, data, base_version, seq in rows:
+                by_collection.setdefault(collection_name, []).append((doc_id, data, base_version, seq))
+
+            flushed = 0
+            for collection_name, items in by_collection.items():
+                upserts = {doc_id: json.loads(data) for doc_id, data, _, _ in items if data is not None}
+                deletes = [doc_id for doc_id, data, _, _ in items if data is None]
+                expected = {doc_id: base_version for doc_id, _, base_version, _ in items}
+                with Span(f"data.flush.{collection_name}", *filter(None, [self.metrics])) as info:
+                    conflicts = self.engine.apply(collection_name, upserts, deletes, expected)
+                    info["docs"] = len(items)
+                # 已寫入的文件在後端的新版本 (刪除後為 0)
+                committed = {doc_id: 0 if data is None else base_version + 1
+                             for doc_id, data, base_version, _ in items if doc_id not in conflicts}
+                # 只移除已提交的版本；提交期間再次修改的文件 (seq 不同) 留待下次提交，
+                # 並改以本次提交後的版本作比對，以免把本程序自己的寫入當作衝突
+                with self._lock:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    self._conn.executemany(
+                        "DELETE FROM pending WHERE namespace = ? AND collection = ? AND doc_id = ? AND seq = ?",
+                        [(self.namespace, collection_name, doc_id, seq) for doc_id, _, _, seq in items],
+                    )
+                    self._conn.executemany(
+                        "UPDATE pending SET base_version = ? WHERE namespace = ? AND collection = ? AND doc_id = ? AND seq != ?",
+                        [(committed[doc_id], self.namespace, collection_name, doc_id, seq)
+                         for doc_id, _, _, seq in items if doc_id in committed],
+                    )
+                    self._conn.execute("COMMIT")
+                flushed += len(items)
+                self.conflicts += len(conflicts)
+                if self.on_flush is not None:
+                    self.on_flush(collection_name, conflicts)
+            self.last_flush = time.time()
+            return flushed
+
+    def start(self):
+        """啟動背景提交執行緒 (重複呼叫不會建立多個執行緒)"""
+        self._stopped.clear()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """停止背景提交執行緒並關閉日誌：先嘗試提交剩餘的修改，失敗的修改保留在日誌
+
+        預設等待背景執行緒完成，令同一日誌及 namespace 不會同時有兩個佇列提交；
+        timeout 到期而執行緒仍在提交時不會關閉日誌。
+        """
+        self._stopped.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            if thread is threading.current_thread():
+                return
+            thread.join(timeout)
+            if thread.is_alive():
+                return
+        with self._lock:
+            self._conn.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            if time.monotonic() < self.next_attempt:
+                continue
+            try:
+                if self.pending_count():
+                    self.flush()
+                self.failures, self.last_error = 0, None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (self.failures - 1))
+                self.next_attempt = time.monotonic() + delay
+        # 停止前盡量提交剩餘的修改；失敗時留在日誌，下次啟動時再提交
+        try:
+            if self.pending_count():
+                self.flush()
+        except Exception as e:
+            self.last_error = str(e)